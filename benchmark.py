@@ -0,0 +1,265 @@
+# benchmark.py
+# Offline load test: scripted players play full games against main.app in-process, backed by FakeLLM.
+#
+# Usage:
+#   python benchmark.py --games 50 --concurrency 10 --latency-ms 300
+#
+# Reports p50/p95/p99 latency for /game/new, /interact and /guess plus overall requests/s.
+# No network access and no API key are needed: requests go straight into the ASGI app.
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+class ASGIClient:
+    """Minimal in-process HTTP client for an ASGI app, including its startup/shutdown lifespan."""
+
+    def __init__(self, app):
+        self.app = app
+        self._lifespan_task = None
+
+    async def startup(self):
+        self._lifespan_in = asyncio.Queue()
+        self._lifespan_out = asyncio.Queue()
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._lifespan_task = asyncio.create_task(self.app(scope, self._lifespan_in.get, self._lifespan_out.put))
+        await self._lifespan_in.put({"type": "lifespan.startup"})
+        message = await self._lifespan_out.get()
+        if message["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"App startup failed: {message}")
+
+    async def shutdown(self):
+        if self._lifespan_task is None:
+            return
+        await self._lifespan_in.put({"type": "lifespan.shutdown"})
+        await self._lifespan_out.get()
+        await self._lifespan_task
+
+    async def request(self, method: str, path: str, body=None, headers=None):
+        """Returns (status_code, response_headers, body_bytes)."""
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        raw_headers = [(b"host", b"testserver"), (b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+        raw_headers += [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+            "query_string": b"", "root_path": "", "headers": raw_headers,
+            "client": ("127.0.0.1", 50000), "server": ("testserver", 80), "state": {},
+        }
+        finished = asyncio.Event()
+        request_sent = False
+        response = {"status": 500, "headers": {}, "body": []}
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": payload, "more_body": False}
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = {k.decode(): v.decode() for k, v in message.get("headers", [])}
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+                if not message.get("more_body"):
+                    finished.set()
+
+        await self.app(scope, receive, send)
+        finished.set()
+        return response["status"], response["headers"], b"".join(response["body"])
+
+class LatencyRecorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    def record(self, endpoint: str, seconds: float, ok: bool):
+        self.samples.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, wall_seconds: float) -> dict:
+        endpoints = {}
+        for endpoint, samples in self.samples.items():
+            ordered = sorted(samples)
+            endpoints[endpoint] = {
+                "count": len(ordered),
+                "errors": self.errors.get(endpoint, 0),
+                "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+                "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+                "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+                "max_ms": round(ordered[-1] * 1000, 2),
+            }
+        total = sum(len(samples) for samples in self.samples.values())
+        return {
+            "wall_seconds": round(wall_seconds, 3),
+            "requests": total,
+            "requests_per_second": round(total / wall_seconds, 2) if wall_seconds else 0.0,
+            "endpoints": endpoints,
+        }
+
+def percentile(ordered: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+class ScriptedPlayer:
+    """
+    Plays one full game the way most players do: visit villagers in turn, always pick the
+    first suggested reply, move on when a villager only offers a single closing line,
+    then make a guess.
+    """
+
+    OPENING_LINE = "This is the starting prompt of the conversation."
+
+    def __init__(self, client: ASGIClient, recorder: LatencyRecorder, seed: int,
+                 difficulty: str, num_locations: int, max_turns: int, exchanges_per_villager: int = 3,
+                 think_seconds: float = 0.0):
+        self.client = client
+        self.recorder = recorder
+        self.rng = random.Random(seed)
+        self.difficulty = difficulty
+        self.num_locations = num_locations
+        self.max_turns = max_turns
+        self.exchanges_per_villager = exchanges_per_villager
+        self.think_seconds = think_seconds
+
+    async def _call(self, endpoint: str, method: str, path: str, body=None):
+        started = time.perf_counter()
+        status, _, raw = await self.client.request(method, path, body)
+        self.recorder.record(endpoint, time.perf_counter() - started, status == 200)
+        return status, (json.loads(raw) if raw else {})
+
+    async def play(self):
+        status, game = await self._call("/game/new", "POST", "/game/new", {
+            "difficulty": self.difficulty, "num_inaccessible_locations": self.num_locations,
+        })
+        if status != 200:
+            return
+        game_id = game["game_id"]
+
+        turns = 0
+        villagers = game["villagers"]
+        while turns < self.max_turns:
+            villager = villagers[0]
+            player_prompt = self.OPENING_LINE
+            for _ in range(self.exchanges_per_villager):
+                status, reply = await self._call("/interact", "POST", f"/game/{game_id}/interact", {
+                    "villager_id": villager["id"], "player_prompt": player_prompt,
+                })
+                turns += 1
+                suggestions = (reply.get("player_suggestions") or []) if status == 200 else []
+                if len(suggestions) <= 1 or turns >= self.max_turns:
+                    break
+                player_prompt = suggestions[0]
+                # Reading the reply before clicking a suggestion
+                if self.think_seconds:
+                    await asyncio.sleep(self.think_seconds)
+            villagers = villagers[1:] + villagers[:1]
+
+        await self._call("/guess", "POST", f"/game/{game_id}/guess", {
+            "location_name": self.rng.choice(game["inaccessible_locations"] or ["nowhere"]),
+        })
+
+async def run_benchmark(app, games: int, concurrency: int, seed: int, difficulty: str,
+                        num_locations: int, max_turns: int, quiet: bool = True, think_seconds: float = 0.0) -> dict:
+    client = ASGIClient(app)
+    recorder = LatencyRecorder()
+    # The server logs every call; keep that chatter out of the report unless asked for
+    server_output = open(os.devnull, "w") if quiet else sys.stdout
+    with contextlib.redirect_stdout(server_output):
+        await client.startup()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one_game(index: int):
+            async with slots:
+                player = ScriptedPlayer(client, recorder, seed + index, difficulty, num_locations, max_turns,
+                                        think_seconds=think_seconds)
+                await player.play()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_game(i) for i in range(games)))
+        wall = time.perf_counter() - started
+        _, _, speculation = await client.request("GET", "/speculation/stats/")
+        await client.shutdown()
+    if quiet:
+        server_output.close()
+
+    report = recorder.report(wall)
+    report["games"] = games
+    report["concurrency"] = concurrency
+    report["speculation"] = json.loads(speculation)
+    return report
+
+def print_report(report: dict):
+    print(f"\n=== Benchmark: {report['games']} games, {report['concurrency']} concurrent ===")
+    print(f"{'endpoint':<12} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for endpoint in ("/game/new", "/interact", "/guess"):
+        stats = report["endpoints"].get(endpoint)
+        if stats:
+            print(f"{endpoint:<12} {stats['count']:>6} {stats['errors']:>6} {stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9} {stats['max_ms']:>9}")
+    speculation = report.get("speculation") or {}
+    if speculation.get("enabled"):
+        lookups = speculation["hits"] + speculation["misses"]
+        hit_rate = speculation["hits"] / lookups if lookups else 0.0
+        print(f"\nspeculation: {speculation['launched']} launched, {speculation['hits']} hits, "
+              f"{speculation['misses']} misses ({hit_rate:.0%} hit rate), {speculation['wasted']} wasted")
+    print(f"\n{report['requests']} requests in {report['wall_seconds']} s -> {report['requests_per_second']} requests/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the Village of Echoes API.")
+    parser.add_argument("--games", type=int, default=20, help="Number of full games to play.")
+    parser.add_argument("--concurrency", type=int, default=5, help="Games played at the same time.")
+    parser.add_argument("--turns", type=int, default=12, help="Interaction turns per game before guessing.")
+    parser.add_argument("--difficulty", default="Medium")
+    parser.add_argument("--locations", type=int, default=5, help="num_inaccessible_locations per game.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Median fake LLM latency for an Interaction call.")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of the fake latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake LLM calls that fail.")
+    parser.add_argument("--pool", default="", help="WORLD_POOL_TARGETS for the run, e.g. 'Medium:5=4'. Empty disables the pool.")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Pause before the player clicks a suggestion.")
+    parser.add_argument("--speculate", action="store_true", help="Enable speculative replies (SPECULATION_ENABLED=1).")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    parser.add_argument("--verbose", action="store_true", help="Show the server's own log output.")
+    args = parser.parse_args()
+
+    # main.py reads its configuration at import time
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_SEED"] = str(args.seed)
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["FAKE_LLM_LATENCY_SIGMA"] = str(args.latency_sigma)
+    os.environ["FAKE_LLM_ERROR_RATE"] = str(args.error_rate)
+    os.environ["WORLD_POOL_TARGETS"] = args.pool
+    os.environ.setdefault("GAME_STORE_BACKEND", "memory")
+    # Log games to a throwaway file so every run starts from an empty event log
+    os.environ.setdefault("GAME_EVENT_LOG_PATH", os.path.join(tempfile.mkdtemp(prefix="echoes-bench-"), "game_events.db"))
+    if args.speculate:
+        os.environ["SPECULATION_ENABLED"] = "1"
+    with contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext():
+        import main as server
+
+    report = asyncio.run(run_benchmark(
+        server.app, args.games, args.concurrency, args.seed, args.difficulty,
+        args.locations, args.turns, quiet=not args.verbose, think_seconds=args.think_ms / 1000.0,
+    ))
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
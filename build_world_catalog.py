@@ -0,0 +1,172 @@
+# build_world_catalog.py
+# Builds worlds in bulk ahead of time and writes them to a catalog file the server memory-maps
+# (see game_logic/world_catalog.py and WORLD_CATALOG_PATH).
+#
+# Usage:
+#   python build_world_catalog.py data/worlds.cat --worlds "medium:5=200,hard:5=100" --concurrency 16
+#   WORLD_CATALOG_PATH=data/worlds.cat uvicorn main:app
+#
+# Each world is a full StoryGenerator + quest network build (every villager's clues written),
+# exactly as GameEngine makes them for live games, with up to --concurrency worlds in flight.
+# Worlds that fail validation (wrong location count, fallback network, missing clue text) are
+# regenerated, up to --max-attempts per world. --extend keeps the worlds already in the file.
+# Uses the configured LLM backend (GOOGLE_API_KEY for Gemini); --fake builds offline with FakeLLM.
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+
+def parse_worlds(spec: str) -> list:
+    """"medium:5=200,hard:5=100" -> [("medium", 5, 200), ("hard", 5, 100)]."""
+    targets = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, count = entry.partition("=")
+        difficulty, _, num_locations = key.rpartition(":")
+        targets.append((difficulty, int(num_locations), int(count or 1)))
+    return targets
+
+class CatalogBuilder:
+    """Generates, validates and writes worlds, sharing one concurrency limit across every key."""
+
+    def __init__(self, engine, writer, generate_world, concurrency: int, max_attempts: int):
+        self.engine = engine
+        self.writer = writer
+        # world_catalog.generate_catalog_world, imported once the configuration is in place
+        self.generate_world = generate_world
+        self.slots = asyncio.Semaphore(max(1, concurrency))
+        self.max_attempts = max(1, max_attempts)
+        self.written = {}
+        self.rejected = {}
+        self.failed = 0
+        self.done = 0
+        self.total = 0
+
+    async def build(self, targets: list):
+        self.total = sum(count for _, _, count in targets)
+        await asyncio.gather(*(
+            self.build_one(difficulty, num_locations)
+            for difficulty, num_locations, count in targets for _ in range(count)
+        ))
+
+    async def build_one(self, difficulty: str, num_locations: int):
+        key = f"{difficulty.lower()}:{num_locations}"
+        for _ in range(self.max_attempts):
+            async with self.slots:
+                try:
+                    world, problem = await self.generate_world(self.engine, difficulty, num_locations)
+                except Exception as e:
+                    print(f"--- CATALOG: {key} world failed: {e} ---", file=sys.stderr)
+                    problem = "error"
+                else:
+                    if problem is None and not self.writer.add(difficulty, num_locations, world):
+                        problem = "duplicate"
+            if problem is None:
+                self.written[key] = self.written.get(key, 0) + 1
+                break
+            self.rejected[problem] = self.rejected.get(problem, 0) + 1
+        else:
+            self.failed += 1
+        self.done += 1
+        if self.done % 10 == 0 or self.done == self.total:
+            print(f"{self.done}/{self.total} worlds ({sum(self.written.values())} written)", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Village of Echoes world catalog offline.")
+    parser.add_argument("output", help="Catalog file to write, e.g. data/worlds.cat.")
+    parser.add_argument("--worlds", required=True, help="Worlds to build per key, as 'difficulty:num_locations=count' pairs.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Worlds generated at the same time.")
+    parser.add_argument("--llm-concurrency", type=int, default=None, help="LLM calls in flight (LLM_MAX_CONCURRENCY); default 4x --concurrency.")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Generations per world before giving up on it.")
+    parser.add_argument("--extend", action="store_true", help="Keep the worlds already in the output file.")
+    parser.add_argument("--fake", action="store_true", help="Generate with the offline FakeLLM instead of the configured backend.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    parser.add_argument("--verbose", action="store_true", help="Show the engine's own log output.")
+    args = parser.parse_args()
+
+    targets = parse_worlds(args.worlds)
+    if not targets:
+        sys.exit("--worlds lists no worlds to build.")
+
+    # The server modules read their configuration at import time
+    os.environ["LLM_MAX_CONCURRENCY"] = str(args.llm_concurrency or 4 * args.concurrency)
+    if args.fake:
+        os.environ["LLM_BACKEND"] = "fake"
+    from dotenv import load_dotenv
+    load_dotenv()
+    from config import LLM_BACKEND, FAKE_LLM_SEED, FAKE_LLM_LATENCY_MS, FAKE_LLM_LATENCY_SIGMA, FAKE_LLM_ERROR_RATE, FAKE_LLM_MALFORMED_RATE
+    from game_logic.engine import GameEngine
+    from game_logic.fake_llm import FakeLLM
+    from game_logic.metrics import METRICS
+    from game_logic.world_catalog import WorldCatalog, WorldCatalogWriter, generate_catalog_world
+
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if LLM_BACKEND != "fake" and not api_key:
+        sys.exit("GOOGLE_API_KEY is not set; set it or pass --fake.")
+
+    started = time.perf_counter()
+    writer = WorldCatalogWriter(args.output)
+    carried = 0
+    if args.extend and os.path.exists(args.output):
+        existing = WorldCatalog(args.output)
+        for key, record in existing.records():
+            carried += writer.add_record(key, record)
+        existing.close()
+
+    engine_output = open(os.devnull, "w") if not args.verbose else sys.stdout
+    try:
+        with contextlib.redirect_stdout(engine_output):
+            llm_api = FakeLLM(
+                seed=FAKE_LLM_SEED, latency_ms=FAKE_LLM_LATENCY_MS, latency_sigma=FAKE_LLM_LATENCY_SIGMA,
+                error_rate=FAKE_LLM_ERROR_RATE, malformed_rate=FAKE_LLM_MALFORMED_RATE,
+            ) if LLM_BACKEND == "fake" else None
+            engine = GameEngine(api_key=api_key, llm_api=llm_api)
+            builder = CatalogBuilder(engine, writer, generate_catalog_world, args.concurrency, args.max_attempts)
+            asyncio.run(builder.build(targets))
+            engine.llm_api.response_cache.close()
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        if not args.verbose:
+            engine_output.close()
+    writer.close()
+    wall = time.perf_counter() - started
+
+    report = {
+        "output": args.output,
+        "bytes": os.path.getsize(args.output),
+        "worlds": len(writer),
+        "carried_over": carried,
+        "written": builder.written,
+        "rejected": builder.rejected,
+        "gave_up": builder.failed,
+        "llm_calls": {
+            prompt_type: int(METRICS.counter_value("echoes_llm_calls_total", prompt_type=prompt_type, outcome="ok"))
+            for prompt_type in ("StoryGenerator", "WorldBuilder", "WorldSkeleton", "VillagerNodes")
+            if METRICS.counter_value("echoes_llm_calls_total", prompt_type=prompt_type, outcome="ok")
+        },
+        "wall_seconds": round(wall, 2),
+        "worlds_per_second": round(sum(builder.written.values()) / wall, 2) if wall > 0 else None,
+    }
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    print(f"\n=== World catalog: {report['worlds']} worlds, {report['bytes']} bytes -> {args.output} ===")
+    for key, count in sorted(builder.written.items()):
+        print(f"{key:<16} {count:>6} new")
+    if carried:
+        print(f"{carried} world(s) carried over from the previous catalog")
+    if builder.rejected:
+        print("rejected and regenerated: " + ", ".join(f"{reason}={n}" for reason, n in sorted(builder.rejected.items())))
+    if builder.failed:
+        print(f"{builder.failed} world(s) gave up after {args.max_attempts} attempt(s)")
+    print(f"LLM calls: {report['llm_calls']}")
+    print(f"{sum(builder.written.values())} worlds in {report['wall_seconds']} s -> {report['worlds_per_second']} worlds/s")
+
+if __name__ == "__main__":
+    main()
@@ -61,4 +61,213 @@ VILLAGER_ROSTER = [
     }
 ]
 
-FAMILIARITY_LEVELS = {0: "Unknown", 1: "Stranger", 2: "Acquaintance", 3: "Familiar Face", 4: "Ally", 5: "Confidant"}
\ No newline at end of file
+FAMILIARITY_LEVELS = {0: "Unknown", 1: "Stranger", 2: "Acquaintance", 3: "Familiar Face", 4: "Ally", 5: "Confidant"}
+
+# --- Server tuning ---
+# Runtime knobs, overridable through environment variables.
+import os
+
+# Maximum number of Gemini calls allowed in flight at once on the async path.
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+# Token budget per minute across all async calls (prompt + response, estimated); match the
+# Gemini quota of the key in use. 0 disables the budget.
+LLM_TOKENS_PER_MINUTE = int(os.environ.get("LLM_TOKENS_PER_MINUTE", "0"))
+# Calls allowed to wait for a slot; beyond this new work gets HTTP 429 with Retry-After.
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "200"))
+
+# Pre-generated world pool, as "difficulty:num_inaccessible_locations=target" pairs
+# separated by commas, e.g. "medium:5=2,hard:5=1"; difficulty matches in any case. An empty
+# string disables the pool.
+def _parse_world_pool_targets(spec):
+    targets = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, size = entry.partition("=")
+        difficulty, _, num_locations = key.rpartition(":")
+        targets[(difficulty.strip().lower(), int(num_locations))] = int(size or 1)
+    return targets
+
+WORLD_POOL_TARGETS = _parse_world_pool_targets(os.environ.get("WORLD_POOL_TARGETS", "medium:5=2"))
+WORLD_POOL_WORKERS_PER_KEY = int(os.environ.get("WORLD_POOL_WORKERS_PER_KEY", "1"))
+
+# World catalog built offline with build_world_catalog.py. When set, /game/new first picks a
+# random world from it for the requested difficulty and location count, with no LLM call;
+# the pool and live generation only serve keys the catalog has no worlds for. Up to
+# WORLD_CATALOG_CACHE_WORLDS decoded worlds are kept in memory and shared by the games using them.
+WORLD_CATALOG_PATH = os.environ.get("WORLD_CATALOG_PATH", "")
+WORLD_CATALOG_CACHE_WORLDS = int(os.environ.get("WORLD_CATALOG_CACHE_WORLDS", "1024"))
+
+# Game-state store. "memory" is an in-process LRU (single worker only), "sqlite" can be
+# shared by every gunicorn worker, "sharded" spreads games over GAME_STORE_SHARDS stores
+# of GAME_STORE_SHARD_BACKEND type. A bound of 0 means unbounded.
+GAME_STORE_BACKEND = os.environ.get("GAME_STORE_BACKEND", "memory")
+GAME_STORE_MAX_GAMES = int(os.environ.get("GAME_STORE_MAX_GAMES", "10000"))
+GAME_STORE_MAX_BYTES = int(os.environ.get("GAME_STORE_MAX_BYTES", "0"))
+GAME_STORE_TTL_SECONDS = float(os.environ.get("GAME_STORE_TTL_SECONDS", "3600"))
+GAME_STORE_SQLITE_PATH = os.environ.get("GAME_STORE_SQLITE_PATH", "data/games.db")
+GAME_STORE_SHARDS = int(os.environ.get("GAME_STORE_SHARDS", "4"))
+GAME_STORE_SHARD_BACKEND = os.environ.get("GAME_STORE_SHARD_BACKEND", "memory")
+
+# Durable games: each turn's changes are appended to an event log (SQLite, WAL) with a full
+# snapshot every GAME_EVENT_LOG_SNAPSHOT_EVERY events, and games missing from the store are
+# rehydrated from it, e.g. after a restart. Writes are group-committed every
+# GAME_EVENT_LOG_FLUSH_MS, which is also the most a crash can lose. An empty path disables it.
+# Only in-memory stores are wrapped: the sqlite backends (and sharded sqlite) are durable already.
+GAME_EVENT_LOG_PATH = os.environ.get("GAME_EVENT_LOG_PATH", "data/game_events.db")
+GAME_EVENT_LOG_SNAPSHOT_EVERY = int(os.environ.get("GAME_EVENT_LOG_SNAPSHOT_EVERY", "50"))
+GAME_EVENT_LOG_FLUSH_MS = float(os.environ.get("GAME_EVENT_LOG_FLUSH_MS", "50"))
+# Turns are committed optimistically: the model is called without holding anything, and
+# the write checks the game's version. A turn that finds the game changed under it is
+# re-applied to the latest version; after this many lost races it fails with HTTP 409.
+GAME_COMMIT_MAX_ATTEMPTS = int(os.environ.get("GAME_COMMIT_MAX_ATTEMPTS", "5"))
+
+# Batch interactions: most turns accepted by one /game/{id}/interact/batch or
+# /admin/interact/batch request.
+INTERACT_BATCH_MAX_ITEMS = int(os.environ.get("INTERACT_BATCH_MAX_ITEMS", "20"))
+# /admin/... endpoints require this value in the X-Admin-Token header; empty disables them.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# Idempotency-Key header on /game/new and /interact: a retry with the same key gets the
+# original result (or waits for it while it is still running) for this many seconds.
+# At most IDEMPOTENCY_MAX_KEYS finished results are kept per worker.
+IDEMPOTENCY_TTL_SECONDS = float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "600"))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get("IDEMPOTENCY_MAX_KEYS", "10000"))
+
+# Conversation memory: verbatim exchanges kept per villager, and the approximate
+# token budget of each Interaction prompt section built from memory.
+MEMORY_WINDOW_TURNS = int(os.environ.get("MEMORY_WINDOW_TURNS", "6"))
+MEMORY_HISTORY_TOKENS = int(os.environ.get("MEMORY_HISTORY_TOKENS", "600"))
+MEMORY_SUMMARY_TOKENS = int(os.environ.get("MEMORY_SUMMARY_TOKENS", "200"))
+MEMORY_KNOWLEDGE_TOKENS = int(os.environ.get("MEMORY_KNOWLEDGE_TOKENS", "400"))
+
+# Fast dialogue tier for villagers with nothing to reveal, as "STATUS=tier" pairs.
+# Tiers: "llm" (full call), "template" (no LLM), "cache" (reused LLM lines), "model" (FAST_DIALOGUE_MODEL).
+def _parse_fast_dialogue_tiers(spec):
+    return dict(entry.strip().split("=", 1) for entry in spec.split(",") if "=" in entry)
+
+FAST_DIALOGUE_TIERS = _parse_fast_dialogue_tiers(
+    os.environ.get("FAST_DIALOGUE_TIERS", "PERMANENTLY_EXHAUSTED=template,HAS_LOCKED_CLUES=cache")
+)
+FAST_DIALOGUE_MODEL = os.environ.get("FAST_DIALOGUE_MODEL", "gemini-2.0-flash-lite")
+FAST_DIALOGUE_CACHE_SIZE = int(os.environ.get("FAST_DIALOGUE_CACHE_SIZE", "512"))
+FAST_DIALOGUE_CACHE_VARIANTS = int(os.environ.get("FAST_DIALOGUE_CACHE_VARIANTS", "3"))
+
+# LLM backend: "gemini" for the real API, "fake" for the offline FakeLLM used by benchmarks,
+# "replay" to serve the responses recorded in LLM_REPLAY_PATH (see replay.py).
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+FAKE_LLM_SEED = int(os.environ.get("FAKE_LLM_SEED", "0"))
+FAKE_LLM_LATENCY_MS = float(os.environ.get("FAKE_LLM_LATENCY_MS", "0"))
+FAKE_LLM_LATENCY_SIGMA = float(os.environ.get("FAKE_LLM_LATENCY_SIGMA", "0.5"))
+FAKE_LLM_ERROR_RATE = float(os.environ.get("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_MALFORMED_RATE = float(os.environ.get("FAKE_LLM_MALFORMED_RATE", "0"))
+# Recording (any backend): every successful LLM call and every /game request is appended to
+# this gzip JSON-lines file, for offline replay. Record with a single worker. Empty disables it.
+LLM_RECORD_PATH = os.environ.get("LLM_RECORD_PATH", "")
+# Replay: recorded latencies are multiplied by LLM_REPLAY_LATENCY_SCALE (0 answers instantly).
+LLM_REPLAY_PATH = os.environ.get("LLM_REPLAY_PATH", "")
+LLM_REPLAY_LATENCY_SCALE = float(os.environ.get("LLM_REPLAY_LATENCY_SCALE", "1.0"))
+
+# Debug logging of the full quest network and player state (spoilers, and costly under load).
+LOG_SPOILERS = os.environ.get("LOG_SPOILERS", "0") == "1"
+
+# Gemini explicit context caching of the stable Interaction prompt prefix (rules + villager
+# profile). Falls back to sending the full prompt if the provider rejects cache creation.
+GEMINI_CONTEXT_CACHE = os.environ.get("GEMINI_CONTEXT_CACHE", "1") == "1"
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+
+# Speculative replies (opt-in): after each turn, pre-generate the villager's answer to each
+# suggested player response. Per game at most SPECULATION_MAX_IN_FLIGHT calls run at once,
+# and each turn may spend SPECULATION_TOKEN_BUDGET estimated prompt tokens on them.
+SPECULATION_ENABLED = os.environ.get("SPECULATION_ENABLED", "0") == "1"
+SPECULATION_MAX_IN_FLIGHT = int(os.environ.get("SPECULATION_MAX_IN_FLIGHT", "2"))
+SPECULATION_TOKEN_BUDGET = int(os.environ.get("SPECULATION_TOKEN_BUDGET", "4000"))
+SPECULATION_TTL_SECONDS = float(os.environ.get("SPECULATION_TTL_SECONDS", "300"))
+
+# World generation: "progressive" builds a quest-network skeleton first and writes each
+# villager's clues in separate concurrent calls (a new game is playable after the skeleton);
+# "single" uses one WorldBuilder call for the whole network.
+WORLD_BUILD_MODE = os.environ.get("WORLD_BUILD_MODE", "progressive")
+WORLD_FILL_MAX_GAMES = int(os.environ.get("WORLD_FILL_MAX_GAMES", "1000"))
+
+# Quest-network validation: a generated network is regenerated only when fewer than this
+# fraction of its nodes survive local repair.
+QUEST_MIN_VALID_FRACTION = float(os.environ.get("QUEST_MIN_VALID_FRACTION", "0.5"))
+
+# LLM resilience. Per-attempt deadlines in seconds by prompt type ("default" covers the rest).
+def _parse_float_map(spec):
+    return {key.strip(): float(value) for key, _, value in (entry.partition("=") for entry in spec.split(",") if "=" in entry)}
+
+LLM_ATTEMPT_TIMEOUTS = _parse_float_map(os.environ.get(
+    "LLM_ATTEMPT_TIMEOUTS", "default=30,Interaction=15,VillagerNodes=30,WorldSkeleton=45,WorldBuilder=90",
+))
+# The circuit breaker opens when LLM_BREAKER_ERROR_RATE of the last LLM_BREAKER_WINDOW attempts
+# failed (with at least LLM_BREAKER_MIN_CALLS recorded) and refuses calls for the cooldown.
+LLM_BREAKER_WINDOW = int(os.environ.get("LLM_BREAKER_WINDOW", "20"))
+LLM_BREAKER_ERROR_RATE = float(os.environ.get("LLM_BREAKER_ERROR_RATE", "0.5"))
+LLM_BREAKER_MIN_CALLS = int(os.environ.get("LLM_BREAKER_MIN_CALLS", "10"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.environ.get("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+# Hedged requests (off unless prompt types are listed, e.g. "Interaction"): a second request
+# is sent when the first is slower than the recent LLM_HEDGE_PERCENTILE latency.
+LLM_HEDGE_PROMPT_TYPES = [t.strip() for t in os.environ.get("LLM_HEDGE_PROMPT_TYPES", "").split(",") if t.strip()]
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_DELAY_MS = float(os.environ.get("LLM_HEDGE_MIN_DELAY_MS", "300"))
+# When an Interaction call fails (or the breaker is open), answer from local templates instead of erroring.
+LLM_FALLBACK_DIALOGUE = os.environ.get("LLM_FALLBACK_DIALOGUE", "1") == "1"
+# Sampling temperature per prompt type, e.g. "VillagerNodes=0"; unlisted types use the model's default.
+LLM_TEMPERATURES = _parse_float_map(os.environ.get("LLM_TEMPERATURES", ""))
+
+# LLM response cache: a reply is reused for a byte-identical request (same model, prompt
+# type, prompt and generation config). LLM_CACHE_POLICY sets, per prompt type, "always",
+# "never", "deterministic" (only while that type's temperature is 0, so nothing while
+# LLM_TEMPERATURES is unset) or "opening" (only a villager's first line, at familiarity 0 with
+# no conversation yet); "default" covers the rest. StoryGenerator's prompt never changes, so
+# caching it would hand every game the same story.
+LLM_CACHE_POLICY = {
+    key.strip(): value.strip()
+    for key, _, value in (entry.partition("=") for entry in os.environ.get(
+        "LLM_CACHE_POLICY", "default=deterministic,StoryGenerator=never,Interaction=opening",
+    ).split(",") if "=" in entry)
+}
+# Memory tier (LRU, per worker) and the optional disk tier (SQLite, shared by every worker
+# and kept across restarts; empty path disables it), each evicting least recently used replies.
+LLM_CACHE_MEMORY_MB = float(os.environ.get("LLM_CACHE_MEMORY_MB", "32"))
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "")
+LLM_CACHE_DISK_MB = float(os.environ.get("LLM_CACHE_DISK_MB", "512"))
+
+# Model routing. Besides "gemini" (the LLM_BACKEND above), LLM_BACKENDS names servers that
+# speak the OpenAI chat completions API, as "name=base_url" pairs, e.g.
+# "local=http://127.0.0.1:8081/v1". A backend's key, if it needs one, is read from
+# LLM_BACKEND_<NAME>_API_KEY. Backends listed in LLM_BACKENDS_WITH_CONTEXT also receive the
+# prompt's context; only llm_stub_server.py understands it.
+LLM_BACKENDS = {
+    name.strip(): url.strip()
+    for name, _, url in (entry.partition("=") for entry in os.environ.get("LLM_BACKENDS", "").split(",") if "=" in entry)
+}
+LLM_BACKEND_API_KEYS = {name: os.environ.get(f"LLM_BACKEND_{name.upper()}_API_KEY", "") for name in LLM_BACKENDS}
+LLM_BACKENDS_WITH_CONTEXT = [n.strip() for n in os.environ.get("LLM_BACKENDS_WITH_CONTEXT", "").split(",") if n.strip()]
+
+# LLM_ROUTES maps a prompt type, optionally for one difficulty, to a fallback chain of
+# "backend:model" targets, preferred first, separated by ">". Entries are separated by ";":
+#   "Interaction=gemini:gemini-2.5-flash-lite>local:qwen2.5-7b;WorldBuilder@Hard=gemini:gemini-2.5-pro"
+# Difficulty only narrows prompt types whose context carries it (the world-building ones).
+# Unrouted prompt types use gemini with the default model. A call skips a target while its
+# p95 latency is above LLM_ROUTE_SLOW_MS, or while more than LLM_ROUTE_SHED_QUEUE calls wait
+# for a slot (0 disables either check); the last target in a chain always takes the call.
+def _parse_llm_routes(spec):
+    routes = {}
+    for entry in spec.split(";"):
+        key, _, chain = entry.partition("=")
+        if not chain.strip():
+            continue
+        prompt_type, _, difficulty = key.strip().partition("@")
+        routes[(prompt_type, difficulty or None)] = [
+            tuple(target.strip().split(":", 1)) for target in chain.split(">") if ":" in target
+        ]
+    return routes
+
+LLM_ROUTES = _parse_llm_routes(os.environ.get("LLM_ROUTES", ""))
+LLM_ROUTE_SLOW_MS = float(os.environ.get("LLM_ROUTE_SLOW_MS", "0"))
+LLM_ROUTE_SHED_QUEUE = int(os.environ.get("LLM_ROUTE_SHED_QUEUE", "0"))
+
+# JSON encoding and parsing: "auto" uses orjson when it is installed and the stdlib json
+# module otherwise; "orjson" or "stdlib" force one.
+JSON_BACKEND = os.environ.get("JSON_BACKEND", "auto")
@@ -0,0 +1,188 @@
+# game_logic/dialogue_tier.py
+# A cheaper dialogue path for villagers who have nothing to reveal right now.
+
+import itertools
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from .metrics import METRICS
+from .llm_schemas import parse_dialogue
+
+# When a villager is PERMANENTLY_EXHAUSTED or HAS_LOCKED_CLUES the Interaction prompt only
+# asks for a farewell or a polite refusal, so a full Gemini round-trip is rarely worth it.
+# Each status can be routed to one of these tiers (see FAST_DIALOGUE_TIERS in config.py):
+#   "llm"      - the normal full Interaction call (default)
+#   "template" - lines built locally from the villager's personality traits, no LLM call
+#   "cache"    - LLM lines cached per (villager, status, familiarity) and reused
+#   "model"    - the normal prompt, sent to a smaller/cheaper model
+FAST_TIER_STATUSES = ("PERMANENTLY_EXHAUSTED", "HAS_LOCKED_CLUES")
+
+# Lines keyed by the villager's dominant personality trait
+TEMPLATE_LINES = {
+    "PERMANENTLY_EXHAUSTED": {
+        "helpfulness": ["I've told you everything I know, friend. I wish it were more.", "That's all I have for you. Be careful out there."],
+        "fearfulness": ["Please, I've said all I can. Don't come asking again.", "I've nothing more... and I'd rather not think about it."],
+        "mystery": ["The rest is not mine to tell. The village will show you, in time.", "What I knew, you now carry. Listen to the wind."],
+        "sarcasm": ["You've squeezed me dry already. Go bother someone else.", "Unless you want the weather report, we're done here."],
+        "humor": ["If I knew more, I'd charge you for it. Off you go!", "I'm all talked out. Even my tongue needs a rest."],
+        "verbosity": ["I've gone over it all with you, every last piece of it, and there's nothing I've held back.", "There's no more to tell, I'm afraid. I've said my piece."],
+    },
+    "HAS_LOCKED_CLUES": {
+        "helpfulness": ["I want to help, truly, but it isn't the right time yet.", "There's more, but I can't say it. Not yet."],
+        "fearfulness": ["I... I can't talk about that. Not here, not now.", "Some things are dangerous to say out loud. Come back later."],
+        "mystery": ["Some doors open only when you're ready to walk through them.", "You're asking the right questions. The answers aren't ready for you."],
+        "sarcasm": ["And I should trust you because...? Try again later.", "Nice try. You'll need more than that before I talk."],
+        "humor": ["Ha! Not so fast. You'll have to earn that one.", "Buy me a drink sometime. Then maybe we'll talk."],
+        "verbosity": ["There is more to it, I won't pretend otherwise, but I can't share it with you just yet.", "I could say more, but it isn't the time. Come find me again."],
+    },
+}
+CLOSING_RESPONSES = {
+    "PERMANENTLY_EXHAUSTED": "Thank you. Goodbye.",
+    "HAS_LOCKED_CLUES": "I understand. I'll come back later.",
+}
+DOMINANT_TRAITS = ("fearfulness", "mystery", "sarcasm", "humor", "helpfulness", "verbosity")
+
+# Used only when the LLM is unavailable and the villager has a clue to reveal
+FALLBACK_LEAD_INS = {
+    "helpfulness": "Listen closely, this matters.",
+    "fearfulness": "I shouldn't be saying this, but...",
+    "mystery": "The village whispers, if you know how to listen.",
+    "sarcasm": "Fine, since you clearly won't leave me be.",
+    "humor": "Alright, alright, here's a juicy one for you.",
+    "verbosity": "Let me tell you something I've been turning over in my mind for days.",
+}
+FALLBACK_IDLE_LINE = "Give me a moment, my thoughts are all tangled today. Ask me again shortly."
+
+class FastDialogueTier:
+    def __init__(self, llm_api, tiers: Dict[str, str], small_model_name: str, cache_size: int = 512, cache_variants: int = 3):
+        self.llm_api = llm_api
+        self.tiers = {status: tier for status, tier in tiers.items() if status in FAST_TIER_STATUSES}
+        self.small_model_name = small_model_name
+        self.cache_size = cache_size
+        self.cache_variants = max(1, cache_variants)
+        # (villager, status, familiarity) -> list of cached {"npc_dialogue", "player_responses"}
+        self._cache: "OrderedDict[tuple, list]" = OrderedDict()
+        self._templates = {}
+        # Rotates through lines/variants so repeated visits don't get the exact same sentence
+        self._rotation = itertools.count()
+        self.served: Dict[str, int] = {}
+
+    def handles(self, status: str) -> bool:
+        return self.tiers.get(status, "llm") != "llm"
+
+    def respond(self, npc_name: str, context: dict) -> dict:
+        """Blocking variant of respond_async, for the script path."""
+        tier = self.tiers[context["conversational_status"]]
+        if tier == "template":
+            return self._served(tier, self._template_reply(npc_name, context))
+        cached = self._cache_lookup(npc_name, context) if tier == "cache" else None
+        if cached is not None:
+            return self._served("cache_hit", cached)
+        model_name = self.small_model_name if tier == "model" else None
+        dialogue_data = parse_dialogue(self.llm_api.generate_content("Interaction", context, model_name=model_name))
+        return self._served(tier, self._after_llm(tier, npc_name, context, dialogue_data))
+
+    async def respond_async(self, npc_name: str, context: dict) -> dict:
+        tier = self.tiers[context["conversational_status"]]
+        if tier == "template":
+            return self._served(tier, self._template_reply(npc_name, context))
+        cached = self._cache_lookup(npc_name, context) if tier == "cache" else None
+        if cached is not None:
+            return self._served("cache_hit", cached)
+        model_name = self.small_model_name if tier == "model" else None
+        dialogue_data = parse_dialogue(await self.llm_api.generate_content_async("Interaction", context, model_name=model_name))
+        return self._served(tier, self._after_llm(tier, npc_name, context, dialogue_data))
+
+    def fallback_reply(self, npc_name: str, context: dict) -> dict:
+        """
+        A reply built without the LLM, for when the call failed or the circuit breaker is open.
+        Clues that can be revealed are still revealed, verbatim, so an outage doesn't stall the game.
+        """
+        status = context["conversational_status"]
+        if status in FAST_TIER_STATUSES:
+            return self._served("fallback", self._template_reply(npc_name, context))
+        context_node = context.get("context_node") or {}
+        if status == "CAN_REVEAL" and context_node.get("content"):
+            traits = (context["villagerProfile"] or {}).get("personality_traits", {})
+            dominant = max(DOMINANT_TRAITS, key=lambda trait: traits.get(trait, 0))
+            return self._served("fallback", {
+                "npc_dialogue": f"{FALLBACK_LEAD_INS[dominant]} {context_node['content']}",
+                "player_responses": ["Thank you. I'll look into it."],
+                "node_revealed_id": context_node.get("node_id"),
+                "new_familiarity_level": context["familiarity_level"],
+            })
+        return self._served("fallback", {
+            "npc_dialogue": FALLBACK_IDLE_LINE,
+            "player_responses": ["I'll come back later."],
+            "node_revealed_id": None,
+            "new_familiarity_level": context["familiarity_level"],
+        })
+
+    def _served(self, tier: str, dialogue_data: dict) -> dict:
+        self.served[tier] = self.served.get(tier, 0) + 1
+        METRICS.inc("echoes_fast_dialogue_total", tier=tier)
+        return dialogue_data
+
+    # ---------- template tier ---------- #
+
+    def _template_reply(self, npc_name: str, context: dict) -> dict:
+        status = context["conversational_status"]
+        lines = self._templates.get((npc_name, status))
+        if lines is None:
+            lines = self._build_template_lines(context["villagerProfile"] or {}, status)
+            self._templates[(npc_name, status)] = lines
+        line = lines[next(self._rotation) % len(lines)]
+        if context["familiarity_level"] == 0:
+            line = f"I'm {npc_name.split()[0]}. {line}"
+        return self._fast_reply(context, line)
+
+    def _build_template_lines(self, villager_profile: dict, status: str) -> list:
+        traits = villager_profile.get("personality_traits", {})
+        dominant = max(DOMINANT_TRAITS, key=lambda trait: traits.get(trait, 0))
+        return TEMPLATE_LINES[status][dominant]
+
+    # ---------- cache tier ---------- #
+
+    def _cache_key(self, npc_name: str, context: dict) -> tuple:
+        return (npc_name, context["conversational_status"], context["familiarity_level"])
+
+    def _cache_lookup(self, npc_name: str, context: dict) -> Optional[dict]:
+        key = self._cache_key(npc_name, context)
+        variants = self._cache.get(key)
+        # Keep asking the LLM until the key has a few variants, then only reuse them
+        if variants is None or len(variants) < self.cache_variants:
+            return None
+        self._cache.move_to_end(key)
+        cached = variants[next(self._rotation) % len(variants)]
+        return self._fast_reply(context, cached["npc_dialogue"], cached["player_responses"])
+
+    def _after_llm(self, tier: str, npc_name: str, context: dict, dialogue_data: dict) -> dict:
+        if tier != "cache" or not dialogue_data.get("npc_dialogue"):
+            return dialogue_data
+        key = self._cache_key(npc_name, context)
+        self._cache.setdefault(key, []).append({
+            "npc_dialogue": dialogue_data["npc_dialogue"],
+            "player_responses": dialogue_data.get("player_responses") or [CLOSING_RESPONSES[context["conversational_status"]]],
+        })
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return dialogue_data
+
+    # ---------- shared ---------- #
+
+    def _fast_reply(self, context: dict, npc_dialogue: str, player_responses: Optional[list] = None) -> dict:
+        status = context["conversational_status"]
+        familiarity = context["familiarity_level"]
+        # A clue locked only behind familiarity must stay reachable without the LLM deciding
+        # to raise familiarity, so a polite visit earns the usual +1 step.
+        context_node = context.get("context_node") or {}
+        required_familiarity = context_node.get("required_familiarity")
+        if status == "HAS_LOCKED_CLUES" and required_familiarity is not None and familiarity < required_familiarity:
+            familiarity = min(5, familiarity + 1)
+        return {
+            "npc_dialogue": npc_dialogue,
+            "player_responses": (player_responses or [CLOSING_RESPONSES[status]])[:1],
+            "node_revealed_id": None,
+            "new_familiarity_level": familiarity,
+        }
@@ -1,170 +1,538 @@
 # game_logic/engine.py
 # The core GameEngine that manages the entire game lifecycle.
 
-import json
+import asyncio
+import time
 import traceback
-from .state_manager import GameState
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from .state_manager import GameState, QuestNode, ROSTER, quest_nodes_from_dicts
 from .llm_calls import GeminiAPI
-from config import VILLAGER_ROSTER, FAMILIARITY_LEVELS
+from .memory import ConversationMemory
+from .quest_index import QuestIndex
+from .dialogue_tier import FastDialogueTier
+from .streaming import JSONStringFieldStreamer
+from .llm_schemas import parse_llm_json, parse_dialogue
+from . import fast_json
+from .speculation import SpeculativeReplies
+from .world_builder import ProgressiveWorldBuilder
+from .quest_validator import validate_and_repair
+from .llm_resilience import LLMError
+from .llm_scheduler import LLMOverloadedError, llm_work
+from .metrics import METRICS
+from config import (
+    VILLAGER_ROSTER, FAMILIARITY_LEVELS, LOG_SPOILERS,
+    MEMORY_WINDOW_TURNS, MEMORY_HISTORY_TOKENS, MEMORY_SUMMARY_TOKENS, MEMORY_KNOWLEDGE_TOKENS,
+    FAST_DIALOGUE_TIERS, FAST_DIALOGUE_MODEL, FAST_DIALOGUE_CACHE_SIZE, FAST_DIALOGUE_CACHE_VARIANTS,
+    SPECULATION_ENABLED, SPECULATION_MAX_IN_FLIGHT, SPECULATION_TOKEN_BUDGET, SPECULATION_TTL_SECONDS,
+    WORLD_BUILD_MODE, WORLD_FILL_MAX_GAMES, QUEST_MIN_VALID_FRACTION, LLM_FALLBACK_DIALOGUE,
+)
+
+OPENING_KNOWLEDGE_SUMMARY = "You've just woken up in a cozy cottage. A kind old man named Arthur tells you he found you unconscious by a car wreck on the edge of the woods. He says he searched the area but saw no sign of your friends. As he speaks, you remember a faint, desperate call in your mind: 'Help us... find us...' You've just thanked him and stepped outside into the village square to begin your search."
+
+@dataclass(slots=True)
+class PreparedTurn:
+    """A turn whose reply has been generated but not yet applied to the game (see commit_interaction_turn)."""
+    npc_name: str
+    player_input: str
+    dialogue_data: dict
+    read_version: int # The game's version the reply was generated from
+    node_contents: Dict[str, str] = field(default_factory=dict) # Clue text filled in while preparing
+
+# Applies a prepared turn to a game and persists it, returning the game it ended up in;
+# main.py passes one built on game_store.commit_turn
+TurnCommitter = Callable[[GameState, PreparedTurn], GameState]
 
 class GameEngine:
-    def __init__(self, api_key: str):
-        self.llm_api = GeminiAPI(api_key)
+    def __init__(self, api_key: str, llm_api=None):
+        # llm_api lets callers swap in another GeminiAPI implementation (e.g. FakeLLM)
+        self.llm_api = llm_api if llm_api is not None else GeminiAPI(api_key)
+        self.memory = ConversationMemory(
+            window_turns=MEMORY_WINDOW_TURNS,
+            history_token_budget=MEMORY_HISTORY_TOKENS,
+            summary_token_budget=MEMORY_SUMMARY_TOKENS,
+            knowledge_token_budget=MEMORY_KNOWLEDGE_TOKENS,
+        )
+        self.dialogue_tier = FastDialogueTier(
+            self.llm_api,
+            tiers=FAST_DIALOGUE_TIERS,
+            small_model_name=FAST_DIALOGUE_MODEL,
+            cache_size=FAST_DIALOGUE_CACHE_SIZE,
+            cache_variants=FAST_DIALOGUE_CACHE_VARIANTS,
+        )
+        # Opt-in: pre-generate replies to the suggested player responses (async path only)
+        self.speculator = SpeculativeReplies(
+            self.llm_api,
+            max_in_flight=SPECULATION_MAX_IN_FLIGHT,
+            token_budget=SPECULATION_TOKEN_BUDGET,
+            ttl_seconds=SPECULATION_TTL_SECONDS,
+        ) if SPECULATION_ENABLED else None
+        # Skeleton-first world generation; None means the single WorldBuilder call
+        self.world_builder = ProgressiveWorldBuilder(
+            self.llm_api, max_games=WORLD_FILL_MAX_GAMES,
+        ) if WORLD_BUILD_MODE == "progressive" else None
+
+    # ================= NEW GAME ================= #
+    # A "world" is everything the LLM generates for a playthrough: story_theme,
+    # inaccessible_locations, correct_location and quest_network. It is generated
+    # independently of any GameState so it can be built ahead of time (see WorldPool).
+    # The blocking and async variants share every step except the LLM calls themselves.
+    # In progressive mode the quest network comes from a WorldSkeleton call and each
+    # villager's clue text is written separately (see ProgressiveWorldBuilder); with
+    # lazy=True generate_world_async returns right after the skeleton.
 
     def start_new_game(self, game_id: str, num_inaccessible_locations: int, difficulty: str) -> GameState:
-        game_state = GameState(game_id, difficulty)
-        
-        # 1. Generate the core story idea
+        world = self.generate_world(num_inaccessible_locations, difficulty)
+        return self.build_game_state(game_id, difficulty, world)
+
+    async def start_new_game_async(self, game_id: str, num_inaccessible_locations: int, difficulty: str) -> GameState:
+        world = await self.generate_world_async(num_inaccessible_locations, difficulty)
+        return self.build_game_state(game_id, difficulty, world)
+
+    def generate_world(self, num_inaccessible_locations: int, difficulty: str) -> dict:
+        print("Attempting to generate story idea...")
+        story_idea_json = self.llm_api.generate_content("StoryGenerator", {"num_inaccessible_locations": num_inaccessible_locations})
+        world = self._parse_story_idea(story_idea_json)
+
         try:
-            print("Attempting to generate story idea...")
-            story_context = {"num_inaccessible_locations": num_inaccessible_locations}
-            story_idea_json = self.llm_api.generate_content("StoryGenerator", story_context)
-            story_idea = json.loads(story_idea_json)
-            print("Story idea generated successfully.")
-        except (json.JSONDecodeError, ValueError, KeyError) as e:
-            print(f"--- CRITICAL ERROR: Failed to generate or parse story idea. Error: {e} ---")
+            print("Attempting to generate quest network...")
+            world_context = self._world_context(world, difficulty)
+            prompt_type = self._quest_network_prompt_type()
+            quest_network = self._parse_quest_network(self.llm_api.generate_content(prompt_type, world_context))
+            if not self._repair_quest_network(quest_network, difficulty):
+                # Only regenerate when local repair could not save the structure
+                print("--- CRITICAL: Generated quest network is unusable. Regenerating once... ---")
+                quest_network = self._parse_quest_network(self.llm_api.generate_content(prompt_type, world_context))
+                if not self._repair_quest_network(quest_network, difficulty):
+                    quest_network = {}
+            world["quest_network"] = self._finalize_quest_network(self._prepare_quest_network(quest_network))
+            if self.world_builder is not None:
+                self.world_builder.fill_all(world, difficulty)
+        except LLMError:
+            # Typed provider errors reach the API layer as-is (e.g. 503 while the breaker is open)
+            raise
+        except Exception as e:
+            print(f"--- CRITICAL ERROR: Failed to generate or parse quest network. Error: {e} ---")
             traceback.print_exc()
-            raise Exception("Could not initialize game story.") from e
+            raise Exception("Could not initialize game world.") from e
+
+        return world
+
+    async def generate_world_async(self, num_inaccessible_locations: int, difficulty: str, lazy: bool = False) -> dict:
+        print("Attempting to generate story idea...")
+        story_idea_json = await self.llm_api.generate_content_async("StoryGenerator", {"num_inaccessible_locations": num_inaccessible_locations})
+        world = self._parse_story_idea(story_idea_json)
+
+        try:
+            print("Attempting to generate quest network...")
+            world_context = self._world_context(world, difficulty)
+            prompt_type = self._quest_network_prompt_type()
+            quest_network = self._parse_quest_network(await self.llm_api.generate_content_async(prompt_type, world_context))
+            if not self._repair_quest_network(quest_network, difficulty):
+                print("--- CRITICAL: Generated quest network is unusable. Regenerating once... ---")
+                quest_network = self._parse_quest_network(await self.llm_api.generate_content_async(prompt_type, world_context))
+                if not self._repair_quest_network(quest_network, difficulty):
+                    quest_network = {}
+            world["quest_network"] = self._finalize_quest_network(self._prepare_quest_network(quest_network))
+            if self.world_builder is not None and not lazy:
+                await self.world_builder.fill_all_async(world, difficulty)
+        except LLMError:
+            # Typed provider errors reach the API layer as-is (e.g. 503 while the breaker is open)
+            raise
+        except Exception as e:
+            print(f"--- CRITICAL ERROR: Failed to generate or parse quest network. Error: {e} ---")
+            traceback.print_exc()
+            raise Exception("Could not initialize game world.") from e
+
+        return world
+
+    def build_game_state(self, game_id: str, difficulty: str, world: dict) -> GameState:
+        game_state = GameState(game_id, difficulty)
+
+        game_state.story_theme = world.get("story_theme")
+        game_state.inaccessible_locations = world.get("inaccessible_locations", [])
+        game_state.correct_location = world.get("correct_location")
+        game_state.quest_network = world["quest_network"]
+        game_state.quest_index = QuestIndex(game_state.quest_network)
+
+        game_state.player_state.knowledge_summary = OPENING_KNOWLEDGE_SUMMARY
+
+        game_state.villagers = ROSTER
 
-        game_state.story_theme = story_idea.get("story_theme")
-        game_state.inaccessible_locations = story_idea.get("inaccessible_locations", [])
-        game_state.correct_location = story_idea.get("correct_location")
-        
-        game_state.player_state["knowledge_summary"] = "You've just woken up in a cozy cottage. A kind old man named Arthur tells you he found you unconscious by a car wreck on the edge of the woods. He says he searched the area but saw no sign of your friends. As he speaks, you remember a faint, desperate call in your mind: 'Help us... find us...' You've just thanked him and stepped outside into the village square to begin your search."
-        
-        game_state.villagers = VILLAGER_ROSTER
-        
         # Initialize state for all villagers
         for v in game_state.villagers:
             game_state.full_npc_memory[v["name"]] = []
-            game_state.player_state["familiarity"][v["name"]] = 0
+            game_state.player_state.familiarity[v["name"]] = 0
             # BUG FIX: Re-added initialization for unproductive_turns
-            game_state.player_state["unproductive_turns"][v["name"]] = 0
+            game_state.player_state.unproductive_turns[v["name"]] = 0
 
-        # 2. Build the detailed Quest Network
+        return game_state
+
+    def start_world_fill(self, game_state: GameState):
+        """Starts writing the clue text of a lazily generated world in the background."""
+        if self.world_builder is not None:
+            # The fill tasks inherit this tag. A batch first started by a turn (ensure_villager_async)
+            # inherits the turn's interactive tag instead.
+            with llm_work(priority="world", game_id=game_state.game_id):
+                self.world_builder.start(game_state)
+
+    def _parse_story_idea(self, story_idea_json: str) -> dict:
+        # 1. The core story idea
         try:
-            print("Attempting to generate quest network...")
-            world_context = {
-                "correctLocation": game_state.correct_location,
-                "villagers": game_state.villagers,
-                "difficulty": difficulty,
-                "story_theme": game_state.story_theme
+            story_idea = self._loads("StoryGenerator", story_idea_json)
+            print("Story idea generated successfully.")
+        except (ValueError, KeyError) as e:
+            print(f"--- CRITICAL ERROR: Failed to generate or parse story idea. Error: {e} ---")
+            traceback.print_exc()
+            raise Exception("Could not initialize game story.") from e
+
+        return {
+            "story_theme": story_idea.get("story_theme"),
+            "inaccessible_locations": story_idea.get("inaccessible_locations", []),
+            "correct_location": story_idea.get("correct_location"),
+        }
+
+    def _world_context(self, world: dict, difficulty: str) -> dict:
+        # 2. Context for the detailed Quest Network
+        return {
+            "correctLocation": world["correct_location"],
+            "villagers": VILLAGER_ROSTER,
+            "difficulty": difficulty,
+            "story_theme": world["story_theme"]
+        }
+
+    def _quest_network_prompt_type(self) -> str:
+        return "WorldSkeleton" if self.world_builder is not None else "WorldBuilder"
+
+    def _prepare_quest_network(self, quest_network: dict) -> dict:
+        if self.world_builder is not None:
+            return self.world_builder.prepare_skeleton(quest_network)
+        return quest_network
+
+    def _repair_quest_network(self, quest_network: dict, difficulty: str) -> bool:
+        """Validates and locally repairs a network in place. False means it has to be regenerated."""
+        report = validate_and_repair(
+            quest_network, VILLAGER_ROSTER, difficulty,
+            # Skeleton nodes get their content later, villager by villager
+            require_content=self.world_builder is None,
+            min_valid_fraction=QUEST_MIN_VALID_FRACTION,
+        )
+        print(f"Quest network check: {report.summary()}")
+        for kind, amount in report.repairs.items():
+            METRICS.inc("echoes_quest_repairs_total", amount, kind=kind)
+        METRICS.inc("echoes_quest_networks_total", outcome="regenerate" if not report.salvageable else ("repaired" if report.repairs else "valid"))
+        return report.salvageable
+
+    def _parse_quest_network(self, quest_network_json: str) -> dict:
+        # Log raw response for debugging if empty or not parseable
+        try:
+            quest_network = self._loads("WorldBuilder", quest_network_json)
+        except Exception as parse_exc:
+            print(f"--- ERROR parsing quest network JSON: {parse_exc} ---")
+            print("Raw quest_network_json:", quest_network_json)
+            return {}
+        return quest_network if isinstance(quest_network, dict) else {}
+
+    def _finalize_quest_network(self, quest_network: dict) -> List[QuestNode]:
+        # Final check: if still missing nodes, use a conservative fallback to prevent crash
+        if not quest_network.get("nodes"):
+            print("--- FALLBACK: Using minimal quest network to continue startup. ---")
+            fallback_villager_name = VILLAGER_ROSTER[0]["name"] if VILLAGER_ROSTER else "Arthur"
+            quest_network = {
+                "nodes": [
+                    {
+                        "node_id": "node1",
+                        "villager_name": fallback_villager_name,
+                        "content": "A fallback clue (engine-generated) — the real generator failed.",
+                        "type": "Information",
+                        "priority": 5,
+                        "key_clue": True,
+                        "preconditions": [],
+                        "required_familiarity": None
+                    }
+                ]
             }
-            quest_network_json = self.llm_api.generate_content("WorldBuilder", world_context)
-            # Log raw response for debugging if empty or not parseable
-            try:
-                game_state.quest_network = json.loads(quest_network_json)
-            except Exception as parse_exc:
-                print(f"--- ERROR parsing quest network JSON: {parse_exc} ---")
-                print("Raw quest_network_json:", quest_network_json)
-                game_state.quest_network = {}
-
-            if not game_state.quest_network.get("nodes"):
-                # Attempt one quick retry before failing
-                print("--- CRITICAL: Generated quest network missing 'nodes'. Retrying once... ---")
-                retry_json = self.llm_api.generate_content("WorldBuilder", world_context)
-                try:
-                    game_state.quest_network = json.loads(retry_json)
-                except Exception as retry_parse_exc:
-                    print(f"Retry parse failed: {retry_parse_exc}")
-                    print("Raw retry_json:", retry_json)
-                    game_state.quest_network = {}
-
-            # Final check: if still missing nodes, use a conservative fallback to prevent crash
-            if not game_state.quest_network.get("nodes"):
-                print("--- FALLBACK: Using minimal quest network to continue startup. ---")
-                fallback_villager_name = game_state.villagers[0]["name"] if game_state.villagers else "Arthur"
-                game_state.quest_network = {
-                    "nodes": [
-                        {
-                            "node_id": "node1",
-                            "villager_name": fallback_villager_name,
-                            "content": "A fallback clue (engine-generated) — the real generator failed.",
-                            "type": "Information",
-                            "priority": 5,
-                            "key_clue": True,
-                            "preconditions": [],
-                            "required_familiarity": None
-                        }
-                    ]
-                }
-
-            print("Quest network generated successfully.")
-            
+
+        print("Quest network generated successfully.")
+
+        if LOG_SPOILERS:
             print("\n\n" + "="*20 + " GENERATED QUEST NETWORK (SPOILERS) " + "="*20)
-            print(json.dumps(game_state.quest_network, indent=2))
+            print(fast_json.dumps(quest_network, indent=True))
             print("="*70 + "\n\n")
+        # From here on the network lives as QuestNode objects (world pool, game state)
+        return quest_nodes_from_dicts(quest_network["nodes"])
 
-        except (json.JSONDecodeError, ValueError, KeyError, Exception) as e:
-            print(f"--- CRITICAL ERROR: Failed to generate or parse quest network. Error: {e} ---")
-            traceback.print_exc()
-            raise Exception("Could not initialize game world.") from e
+    def _loads(self, prompt_type: str, text: str):
+        return parse_llm_json(prompt_type, text)
+
+    # ================= INTERACTION ================= #
+
+    def get_quest_index(self, game_state: GameState) -> QuestIndex:
+        # Games loaded from a persistent store arrive without an index; build it on first use
+        if game_state.quest_index is None:
+            game_state.quest_index = QuestIndex(game_state.quest_network, game_state.player_state.discovered_nodes)
+        return game_state.quest_index
 
-        return game_state
-    
     def get_villager_clue_status(self, game_state: GameState, npc_name: str):
-        undiscovered_nodes = [
-            node for node in game_state.quest_network.get("nodes", [])
-            if node["villager_name"] == npc_name and node["node_id"] not in game_state.player_state["discovered_nodes"]
-        ]
+        familiarity = game_state.player_state.familiarity.get(npc_name, 0)
+        return self.get_quest_index(game_state).villager_status(npc_name, familiarity)
+
+    def get_frustration(self, game_state: GameState, npc_name: str) -> dict:
+        # FIX: Add a check to ensure the content is not None before calling .lower()
+        return {"friends": len([
+            turn for turn in game_state.full_npc_memory.get(npc_name, [])
+            if turn.content and "friend" in turn.content.lower()
+        ])}
 
-        if not undiscovered_nodes:
-            return "PERMANENTLY_EXHAUSTED", None
+    def process_interaction_turn(self, game_state: GameState, npc_name: str, player_input: str, frustration: dict):
+        if self.world_builder is not None:
+            self.world_builder.ensure_villager(game_state, npc_name)
+        interaction_context = self._build_interaction_context(game_state, npc_name, player_input, frustration)
+        try:
+            if self.dialogue_tier.handles(interaction_context["conversational_status"]):
+                dialogue_data = self.dialogue_tier.respond(npc_name, interaction_context)
+            else:
+                dialogue_data = parse_dialogue(self.llm_api.generate_content("Interaction", interaction_context))
+        except LLMError as e:
+            dialogue_data = self._fallback_dialogue(npc_name, interaction_context, e)
+        return self._apply_dialogue_turn(game_state, npc_name, player_input, dialogue_data)
+
+    async def prepare_interaction_turn_async(self, game_state: GameState, npc_name: str, player_input: str, frustration: dict) -> PreparedTurn:
+        """
+        The slow half of a turn: waits for the villager's clues and the reply without
+        changing the player's state. commit_interaction_turn applies the result.
+        """
+        node_contents = {}
+        if self.world_builder is not None:
+            node_contents = await self.world_builder.ensure_villager_async(game_state, npc_name)
+        read_version = game_state.version
+        interaction_context = self._build_interaction_context(game_state, npc_name, player_input, frustration)
+        try:
+            if self.dialogue_tier.handles(interaction_context["conversational_status"]):
+                # Locked or exhausted villagers only say goodbye, so skip the full LLM call
+                self._forget_speculation(game_state)
+                dialogue_data = await self.dialogue_tier.respond_async(npc_name, interaction_context)
+            else:
+                dialogue_data = parse_dialogue(await self._interaction_reply_async(game_state, interaction_context))
+        except LLMError as e:
+            dialogue_data = self._fallback_dialogue(npc_name, interaction_context, e)
+        return PreparedTurn(npc_name, player_input, dialogue_data, read_version, node_contents)
 
-        sorted_nodes = sorted(undiscovered_nodes, key=lambda x: x.get('priority', 0), reverse=True)
+    def commit_interaction_turn(self, game_state: GameState, turn: PreparedTurn):
+        """
+        Applies a prepared turn. Never awaits, and works on any version of the game: the
+        clue text is only filled where still missing, and the familiarity and discovery
+        rules are checked against the game as it is now.
+        """
+        if turn.node_contents:
+            self.world_builder.apply_contents(game_state, turn.node_contents)
+        self._apply_dialogue_turn(game_state, turn.npc_name, turn.player_input, turn.dialogue_data)
 
-        for node in sorted_nodes:
-            preconditions_met = all(p in game_state.player_state["discovered_nodes"] for p in node.get("preconditions", []))
-            current_familiarity = game_state.player_state["familiarity"].get(npc_name, 0)
-            required_familiarity = node.get("required_familiarity")
-            familiarity_met = required_familiarity is None or current_familiarity >= required_familiarity
+    def _commit_turn(self, game_state: GameState, turn: PreparedTurn, commit: Optional[TurnCommitter]) -> GameState:
+        if commit is None:
+            self.commit_interaction_turn(game_state, turn)
+            return game_state
+        return commit(game_state, turn)
 
-            if preconditions_met and familiarity_met:
-                return "CAN_REVEAL", node
+    async def process_interaction_turn_async(self, game_state: GameState, npc_name: str, player_input: str, frustration: dict,
+                                             commit: Optional[TurnCommitter] = None) -> dict:
+        """Prepares and commits one turn; without `commit` it is applied to game_state in place."""
+        turn = await self.prepare_interaction_turn_async(game_state, npc_name, player_input, frustration)
+        game_state = self._commit_turn(game_state, turn, commit)
+        self._speculate_next_turns(game_state, npc_name, turn.dialogue_data)
+        return turn.dialogue_data
 
-        return "HAS_LOCKED_CLUES", sorted_nodes[0]
+    async def process_interaction_batch_async(self, game_state: GameState, turns: List[Tuple[str, str]],
+                                              commit: Optional[TurnCommitter] = None) -> list:
+        """
+        Plays several (npc_name, player_input) turns of one game, e.g. from /interact/batch.
 
-    def process_interaction_turn(self, game_state: GameState, npc_name: str, player_input: str, frustration: dict):
+        Different villagers' turns run concurrently; one villager's turns run in order, each
+        seeing the replies before it. Repeats of a turn (same villager and input) are played
+        once and share its reply. Each turn is committed as soon as its reply is ready, so
+        the turns apply one at a time, each on top of the ones that finished before it.
+        Returns, per turn, the dialogue data or the exception it raised.
+        """
+        results = [None] * len(turns)
+        # The latest committed version of the game; each turn is played against it
+        current = [game_state]
+        # npc_name -> {player_input -> indexes of the turns asking it}, in request order
+        by_villager: Dict[str, Dict[str, List[int]]] = {}
+        for index, (npc_name, player_input) in enumerate(turns):
+            by_villager.setdefault(npc_name, {}).setdefault(player_input, []).append(index)
+
+        async def villager_turns(npc_name: str, inputs: Dict[str, List[int]]):
+            for player_input, indexes in inputs.items():
+                try:
+                    state = current[0]
+                    turn = await self.prepare_interaction_turn_async(
+                        state, npc_name, player_input, self.get_frustration(state, npc_name),
+                    )
+                    current[0] = state = self._commit_turn(state, turn, commit)
+                    self._speculate_next_turns(state, npc_name, turn.dialogue_data)
+                    outcome = turn.dialogue_data
+                except Exception as e:
+                    outcome = e
+                for index in indexes:
+                    results[index] = outcome
+                METRICS.inc("echoes_interact_batch_turns_total", outcome="played")
+                if len(indexes) > 1:
+                    METRICS.inc("echoes_interact_batch_turns_total", len(indexes) - 1, outcome="deduplicated")
+
+        await asyncio.gather(*(villager_turns(npc_name, inputs) for npc_name, inputs in by_villager.items()))
+        return results
+
+    async def stream_interaction_turn(self, game_state: GameState, npc_name: str, player_input: str, frustration: dict,
+                                      commit: Optional[TurnCommitter] = None):
+        """
+        Async generator for streamed turns. Yields ("token", text) events while the npc_dialogue
+        is being generated, then a single ("final", dialogue_data, timings, game_state) event,
+        game_state being the game the turn was committed to.
+
+        The turn is only committed once the whole reply has arrived and parsed, so a stream
+        that fails or is abandoned half-way leaves the game untouched.
+        """
+        started = time.perf_counter()
+        first_token_at = None
+        node_contents = {}
+        if self.world_builder is not None:
+            node_contents = await self.world_builder.ensure_villager_async(game_state, npc_name)
+        read_version = game_state.version
+        interaction_context = self._build_interaction_context(game_state, npc_name, player_input, frustration)
+
+        dialogue_data = None
+        if self.dialogue_tier.handles(interaction_context["conversational_status"]):
+            self._forget_speculation(game_state)
+            try:
+                dialogue_data = await self.dialogue_tier.respond_async(npc_name, interaction_context)
+            except LLMError as e:
+                dialogue_data = self._fallback_dialogue(npc_name, interaction_context, e)
+        elif self.speculator is not None:
+            speculated = await self.speculator.claim(game_state.game_id, interaction_context)
+            if speculated is not None:
+                try:
+                    dialogue_data = parse_dialogue(speculated)
+                except LLMError:
+                    pass  # A malformed speculative reply is just a miss; stream a live one
+
+        if dialogue_data is not None:
+            # Already complete (fast tier or speculation); send it as a single token
+            first_token_at = time.perf_counter()
+            yield ("token", dialogue_data.get("npc_dialogue") or "")
+        else:
+            streamer = JSONStringFieldStreamer("npc_dialogue")
+            try:
+                async for chunk in self.llm_api.stream_content_async("Interaction", interaction_context):
+                    text = streamer.feed(chunk)
+                    if text:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        yield ("token", text)
+            except LLMError as e:
+                # Once tokens have reached the player a different fallback line would contradict them
+                if first_token_at is not None:
+                    raise
+                dialogue_data = self._fallback_dialogue(npc_name, interaction_context, e)
+                first_token_at = time.perf_counter()
+                yield ("token", dialogue_data.get("npc_dialogue") or "")
+            if dialogue_data is None:
+                dialogue_data = parse_dialogue(streamer.json_text)
+
+        turn = PreparedTurn(npc_name, player_input, dialogue_data, read_version, node_contents)
+        game_state = self._commit_turn(game_state, turn, commit)
+        self._speculate_next_turns(game_state, npc_name, dialogue_data)
+        finished = time.perf_counter()
+        timings = {
+            "ttft_ms": round(((first_token_at or finished) - started) * 1000, 1),
+            "total_ms": round((finished - started) * 1000, 1),
+        }
+        METRICS.observe("echoes_stream_ttft_seconds", (first_token_at or finished) - started)
+        METRICS.observe("echoes_stream_total_seconds", finished - started)
+        print(f"--- Streamed turn with {npc_name}: first token {timings['ttft_ms']} ms, total {timings['total_ms']} ms ---")
+        yield ("final", dialogue_data, timings, game_state)
+
+    def _fallback_dialogue(self, npc_name: str, interaction_context: dict, error: LLMError) -> dict:
+        # An overloaded queue is not an outage: the client should back off and retry (HTTP 429)
+        if not LLM_FALLBACK_DIALOGUE or isinstance(error, LLMOverloadedError):
+            raise error
+        print(f"--- LLM unavailable for {npc_name} ({error}); answering from the fallback tier ---")
+        return self.dialogue_tier.fallback_reply(npc_name, interaction_context)
+
+    # ---------- speculative replies ---------- #
+
+    async def _interaction_reply_async(self, game_state: GameState, interaction_context: dict) -> str:
+        """Raw Interaction reply: the matching speculative one if there is one, otherwise a live call."""
+        if self.speculator is not None:
+            text = await self.speculator.claim(game_state.game_id, interaction_context)
+            if text is not None:
+                return text
+        return await self.llm_api.generate_content_async("Interaction", interaction_context)
+
+    def _speculate_next_turns(self, game_state: GameState, npc_name: str, dialogue_data: dict):
+        suggestions = dialogue_data.get("player_responses") or []
+        if self.speculator is None or not suggestions:
+            return
+        # Built from the state after this turn, exactly as the next /interact would build it
+        base_context = self._build_interaction_context(game_state, npc_name, "", self.get_frustration(game_state, npc_name))
+        if self.dialogue_tier.handles(base_context["conversational_status"]):
+            return
+        self.speculator.speculate(game_state.game_id, [
+            {**base_context, "player_last_response": suggestion} for suggestion in suggestions
+        ])
+
+    def _forget_speculation(self, game_state: GameState):
+        if self.speculator is not None:
+            self.speculator.forget(game_state.game_id)
+
+    def _build_interaction_context(self, game_state: GameState, npc_name: str, player_input: str, frustration: dict) -> dict:
         clue_status, context_node = self.get_villager_clue_status(game_state, npc_name)
 
         villager_profile = next((v for v in game_state.villagers if v["name"] == npc_name), None)
-        
-        familiarity = game_state.player_state["familiarity"].get(npc_name, 0)
-        
-        dialogue_turn = self.llm_api.generate_content("Interaction", {
+
+        familiarity = game_state.player_state.familiarity.get(npc_name, 0)
+
+        # chatHistory, conversation_summary and player_knowledge_summary, each within its token budget
+        memory_sections = self.memory.build_prompt_sections(game_state, npc_name)
+
+        return {
             "villagerProfile": villager_profile,
-            "chatHistory": game_state.full_npc_memory.get(npc_name, []),
             "player_last_response": player_input,
             "conversational_status": clue_status,
-            "context_node": context_node,
+            "context_node": context_node.to_dict() if context_node is not None else None,
             "frustration": frustration,
-            "player_knowledge_summary": game_state.player_state["knowledge_summary"],
             "familiarity_level": familiarity,
             "familiarity_description": FAMILIARITY_LEVELS.get(familiarity, "Unknown"),
-        })
-        
-        dialogue_data = json.loads(dialogue_turn)
-        
-        game_state.full_npc_memory[npc_name].append({"role": "player", "content": player_input})
-        game_state.full_npc_memory[npc_name].append({"role": "npc", "content": dialogue_data.get("npc_dialogue")})
-        
+            **memory_sections,
+        }
+
+    def _apply_dialogue_turn(self, game_state: GameState, npc_name: str, player_input: str, dialogue_data: dict) -> dict:
+        with METRICS.span("engine_update"):
+            self._update_player_state(game_state, npc_name, player_input, dialogue_data)
+
+        if LOG_SPOILERS:
+            print("\n\n" + "-"*20 + " CURRENT PLAYER STATE " + "-"*20)
+            print(fast_json.dumps(game_state.player_state.to_dict(), indent=True, default=str))
+            print("-"*60 + "\n\n")
+
+        return dialogue_data
+
+    def _update_player_state(self, game_state: GameState, npc_name: str, player_input: str, dialogue_data: dict):
+        self.memory.record_turn(game_state, npc_name, player_input, dialogue_data.get("npc_dialogue"))
+
         # LOGIC FIX: Enforce the "+1" familiarity rule in the engine
         new_familiarity = dialogue_data.get("new_familiarity_level")
         if new_familiarity is not None:
-            old_familiarity = game_state.player_state["familiarity"].get(npc_name, 0)
+            old_familiarity = game_state.player_state.familiarity.get(npc_name, 0)
             # Cap the increase at a maximum of 1
             if new_familiarity > old_familiarity + 1:
                 new_familiarity = old_familiarity + 1
-            game_state.player_state["familiarity"][npc_name] = new_familiarity
+            game_state.player_state.familiarity[npc_name] = new_familiarity
+            if new_familiarity != old_familiarity:
+                game_state.record_event("familiarity", npc=npc_name, level=new_familiarity)
 
         revealed_node_id = dialogue_data.get("node_revealed_id")
-        if revealed_node_id and revealed_node_id not in game_state.player_state["discovered_nodes"]:
-            game_state.player_state["discovered_nodes"].append(revealed_node_id)
-            all_discovered_content = [node['content'] for node in game_state.quest_network.get('nodes', []) if node['node_id'] in game_state.player_state['discovered_nodes']]
-            game_state.player_state["knowledge_summary"] = "Key points discovered so far: " + "; ".join(all_discovered_content)
-
-        print("\n\n" + "-"*20 + " CURRENT PLAYER STATE " + "-"*20)
-        print(json.dumps(game_state.player_state, indent=2, default=str))
-        print("-"*60 + "\n\n")
-
-        return dialogue_data
\ No newline at end of file
+        quest_index = self.get_quest_index(game_state)
+        if revealed_node_id and quest_index.discover(revealed_node_id):
+            game_state.player_state.discovered_nodes.append(revealed_node_id)
+            game_state.player_state.knowledge_summary = "Key points discovered so far: " + "; ".join(quest_index.discovered_contents())
+            game_state.record_event("node_discovered", node_id=revealed_node_id, knowledge_summary=game_state.player_state.knowledge_summary)
@@ -0,0 +1,354 @@
+# game_logic/event_log.py
+# Durable game persistence: an append-only event log plus periodic snapshots, so games survive restarts.
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import List, Optional
+
+from . import fast_json
+from .game_store import GameStore
+from .metrics import METRICS
+from .state_manager import GameState, ChatTurn
+
+# ---------- replay ---------- #
+
+def _apply_chat(game_state: GameState, data: dict):
+    history = game_state.full_npc_memory.setdefault(data["npc"], [])
+    history.extend(ChatTurn.from_dict(message) for message in data["messages"])
+    del history[:2 * data.get("evicted", 0)]
+    if data.get("summary") is not None:
+        game_state.npc_summaries[data["npc"]] = data["summary"]
+
+def _apply_familiarity(game_state: GameState, data: dict):
+    game_state.player_state.familiarity[data["npc"]] = data["level"]
+
+def _apply_node_discovered(game_state: GameState, data: dict):
+    if data["node_id"] not in game_state.player_state.discovered_nodes:
+        game_state.player_state.discovered_nodes.append(data["node_id"])
+    game_state.player_state.knowledge_summary = data["knowledge_summary"]
+
+def _apply_node_content(game_state: GameState, data: dict):
+    contents = data["contents"]
+    for node in game_state.quest_network:
+        if node.node_id in contents:
+            node.content = contents[node.node_id]
+            node.beat = None
+
+EVENT_APPLIERS = {
+    "chat": _apply_chat,
+    "familiarity": _apply_familiarity,
+    "node_discovered": _apply_node_discovered,
+    "node_content": _apply_node_content,
+}
+
+def apply_event(game_state: GameState, kind: str, data: dict):
+    applier = EVENT_APPLIERS.get(kind)
+    if applier is None:
+        print(f"--- EVENT LOG: skipping unknown event '{kind}' for game {game_state.game_id} ---")
+        return
+    applier(game_state, data)
+
+# ---------- log file ---------- #
+
+class GameEventLog:
+    """
+    SQLite (WAL) file holding the latest snapshot of each game and the events since it.
+
+    Writers never touch the disk: append() and snapshot() only queue encoded records, and
+    a background thread commits everything queued in one transaction every
+    `flush_interval` seconds (group commit). A crash loses at most that interval.
+
+    A snapshot replaces the game's previous snapshot and deletes the events it covers, so
+    replaying a game never reads more than one snapshot and `snapshot_every` events.
+    """
+
+    PURGE_EVERY_N_FLUSHES = 200
+
+    def __init__(self, path: str, flush_interval: float = 0.05, ttl_seconds: float = 3600.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots (game_id TEXT PRIMARY KEY, state BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY AUTOINCREMENT, game_id TEXT NOT NULL, event TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS events_by_game ON events (game_id, seq)")
+        # Serializes flushes on the writer connection
+        self._db_lock = threading.Lock()
+        # Rehydrating requests read on their own connection: under WAL they see the last
+        # commit without waiting for a group commit in progress
+        self._read_conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._read_lock = threading.Lock()
+        # Records waiting for the next group commit: ("snapshot" | "events" | "delete", game_id, payload)
+        self._queue: List[tuple] = []
+        self._queue_lock = threading.Lock()
+        # The records in the group commit running right now, which load() replays from memory too
+        self._committing: List[tuple] = []
+        self._wakeup = threading.Event()
+        self._closed = False
+        self.stats_counts = {"events": 0, "snapshots": 0, "flushes": 0, "rehydrated": 0}
+        self._writer = threading.Thread(target=self._run_writer, name="game-event-log", daemon=True)
+        self._writer.start()
+
+    def append(self, game_id: str, events: List[tuple], version: Optional[int] = None):
+        """Queues one write's events; the last carries the game's version after it, if given."""
+        encoded = [fast_json.dumps([kind, data]) for kind, data in events]
+        if version is not None and events:
+            kind, data = events[-1]
+            encoded[-1] = fast_json.dumps([kind, data, version])
+        with self._queue_lock:
+            self._queue.append(("events", game_id, encoded))
+
+    def snapshot(self, game_state: GameState):
+        # Serialized now (the game keeps changing); compressed later on the writer thread
+        encoded = fast_json.dumpb(game_state.to_dict())
+        with self._queue_lock:
+            self._queue.append(("snapshot", game_state.game_id, encoded))
+
+    def delete(self, game_id: str):
+        with self._queue_lock:
+            self._queue.append(("delete", game_id, None))
+
+    def load(self, game_id: str) -> Optional[GameState]:
+        """
+        Rebuilds a game from its snapshot and the events after it, or returns None.
+
+        Never waits for the writer: records for the game still queued, or in the group commit
+        running right now, are replayed from memory on top of what the file holds. Each carries
+        the game's version after its write, and versions only grow, so a record the read
+        already saw on disk is skipped.
+        """
+        with self._queue_lock:
+            pending = [entry for entry in self._committing + self._queue if entry[1] == game_id]
+        with self._read_lock:
+            # One read transaction, so a commit landing in between cannot split snapshot and events
+            self._read_conn.execute("BEGIN")
+            try:
+                row = self._read_conn.execute("SELECT state, updated_at FROM snapshots WHERE game_id = ?", (game_id,)).fetchone()
+                events = self._read_conn.execute(
+                    "SELECT event FROM events WHERE game_id = ? ORDER BY seq", (game_id,),
+                ).fetchall() if row is not None else []
+            finally:
+                self._read_conn.execute("COMMIT")
+        if row is not None and not pending and self.ttl_seconds and time.time() - row[1] > self.ttl_seconds:
+            self.delete(game_id)
+            return None
+
+        with METRICS.span("event_log_replay"):
+            game_state = GameState.from_dict(fast_json.loads(zlib.decompress(row[0]))) if row is not None else None
+            for (event,) in events:
+                self._replay(game_state, event)
+            game_state = self._replay_pending(game_state, pending, len(events))
+        if game_state is None:
+            return None
+        self.stats_counts["rehydrated"] += 1
+        print(f"--- EVENT LOG: rehydrated game {game_id} from its snapshot + {game_state.events_since_snapshot} event(s) ---")
+        return game_state
+
+    @staticmethod
+    def _replay(game_state: GameState, event: str):
+        kind, data, *version = fast_json.loads(event)
+        apply_event(game_state, kind, data)
+        if version:
+            game_state.version = version[0]
+
+    def _replay_pending(self, game_state: Optional[GameState], pending: List[tuple], since_snapshot: int) -> Optional[GameState]:
+        for kind, _, payload in pending:
+            if kind == "delete":
+                game_state = None
+            elif kind == "snapshot":
+                snapshot = fast_json.loads(payload)
+                if game_state is None or snapshot.get("version", 0) > game_state.version:
+                    game_state, since_snapshot = GameState.from_dict(snapshot), 0
+            elif game_state is not None:
+                _, _, *version = fast_json.loads(payload[-1])
+                if not version or version[0] > game_state.version:
+                    for event in payload:
+                        self._replay(game_state, event)
+                    since_snapshot += len(payload)
+        if game_state is not None:
+            game_state.events_since_snapshot = since_snapshot
+        return game_state
+
+    def flush(self):
+        """Commits everything queued so far, in one transaction."""
+        # The swap happens under the database lock so two flushes can never commit out of order
+        with self._db_lock:
+            with self._queue_lock:
+                queued, self._queue = self._queue, []
+                self._committing = queued
+            if not queued:
+                return
+            try:
+                with METRICS.span("event_log_flush"):
+                    self._commit(queued)
+            finally:
+                with self._queue_lock:
+                    self._committing = []
+
+    def _commit(self, queued: List[tuple]):
+        now = time.time()
+        touched = set()
+        self._conn.execute("BEGIN")
+        try:
+            for kind, game_id, payload in queued:
+                if kind == "events":
+                    self._conn.executemany("INSERT INTO events (game_id, event) VALUES (?, ?)", [(game_id, e) for e in payload])
+                    self.stats_counts["events"] += len(payload)
+                    METRICS.inc("echoes_event_log_records_total", len(payload), kind="event")
+                    touched.add(game_id)
+                elif kind == "snapshot":
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO snapshots (game_id, state, updated_at) VALUES (?, ?, ?)",
+                        (game_id, zlib.compress(payload), now),
+                    )
+                    self._conn.execute("DELETE FROM events WHERE game_id = ?", (game_id,))
+                    self.stats_counts["snapshots"] += 1
+                    METRICS.inc("echoes_event_log_records_total", kind="snapshot")
+                    touched.discard(game_id)
+                else:
+                    self._conn.execute("DELETE FROM snapshots WHERE game_id = ?", (game_id,))
+                    self._conn.execute("DELETE FROM events WHERE game_id = ?", (game_id,))
+                    touched.discard(game_id)
+            if touched:
+                self._conn.executemany("UPDATE snapshots SET updated_at = ? WHERE game_id = ?", [(now, g) for g in touched])
+            self.stats_counts["flushes"] += 1
+            if self.ttl_seconds and self.stats_counts["flushes"] % self.PURGE_EVERY_N_FLUSHES == 0:
+                cutoff = now - self.ttl_seconds
+                self._conn.execute("DELETE FROM events WHERE game_id IN (SELECT game_id FROM snapshots WHERE updated_at < ?)", (cutoff,))
+                self._conn.execute("DELETE FROM snapshots WHERE updated_at < ?", (cutoff,))
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self._writer.join(timeout=5.0)
+        self.flush()
+        with self._read_lock:
+            self._read_conn.close()
+
+    def stats(self) -> dict:
+        with self._queue_lock:
+            queued = len(self._queue)
+        return {"path": self.path, "queued": queued, **self.stats_counts}
+
+    def _run_writer(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                # Keep the writer alive; the records are lost, the next snapshot covers them
+                print(f"--- EVENT LOG: flush failed: {e} ---")
+
+# ---------- store ---------- #
+
+class DurableGameStore(GameStore):
+    """
+    Wraps an in-memory store with a GameEventLog. The inner store must hand back the same
+    GameState on every get(), since the events a turn records are kept on it.
+
+    Each write logs only what the turn changed (the game's pending events), or a full
+    snapshot for a new game and after every `snapshot_every` events. A get() that misses
+    the inner store, e.g. after a restart or an eviction, rehydrates the game from the log.
+    Ids the log does not have either are remembered for `miss_ttl` seconds, so repeated
+    lookups of an unknown or expired game (each one a 404) do not go to disk.
+    """
+
+    MAX_MISSES = 10000
+
+    def __init__(self, inner: GameStore, log: GameEventLog, snapshot_every: int = 50, miss_ttl: float = 5.0):
+        self.inner = inner
+        self.log = log
+        self.snapshot_every = max(1, snapshot_every)
+        self.miss_ttl = miss_ttl
+        # game_id -> monotonic time the miss stops counting, oldest first
+        self._misses: "OrderedDict[str, float]" = OrderedDict()
+
+    def get(self, game_id: str) -> Optional[GameState]:
+        game_state = self.inner.get(game_id)
+        if game_state is None:
+            if self._known_missing(game_id):
+                return None
+            game_state = self.log.load(game_id)
+            if game_state is None:
+                self._remember_miss(game_id)
+                return None
+            game_state.pending_events = []
+            self.inner.put(game_state)
+        return game_state
+
+    def _known_missing(self, game_id: str) -> bool:
+        expires = self._misses.get(game_id)
+        if expires is None:
+            return False
+        if time.monotonic() < expires:
+            return True
+        del self._misses[game_id]
+        return False
+
+    def _remember_miss(self, game_id: str):
+        if not self.miss_ttl:
+            return
+        self._misses.pop(game_id, None)
+        self._misses[game_id] = time.monotonic() + self.miss_ttl
+        while len(self._misses) > self.MAX_MISSES:
+            self._misses.popitem(last=False)
+
+    def put(self, game_state: GameState):
+        self._misses.pop(game_state.game_id, None)
+        self._log(game_state)
+        self.inner.put(game_state)
+
+    def version(self, game_id: str) -> Optional[int]:
+        version = self.inner.version(game_id)
+        if version is None:
+            # Rehydrate a game that is only in the log
+            game_state = self.get(game_id)
+            version = game_state.version if game_state is not None else None
+        return version
+
+    def put_if_version(self, game_state: GameState, expected_version: int) -> bool:
+        # Only a write that won goes into the log
+        if not self.inner.put_if_version(game_state, expected_version):
+            return False
+        self._log(game_state)
+        return True
+
+    def _log(self, game_state: GameState):
+        with METRICS.span("event_log_write"):
+            events = game_state.pending_events or []
+            since_snapshot = game_state.events_since_snapshot
+            if since_snapshot is None or since_snapshot + len(events) >= self.snapshot_every:
+                self.log.snapshot(game_state)
+                game_state.events_since_snapshot = 0
+            elif events:
+                self.log.append(game_state.game_id, events, version=game_state.version)
+                game_state.events_since_snapshot = since_snapshot + len(events)
+            game_state.pending_events = []
+
+    def delete(self, game_id: str):
+        self.inner.delete(game_id)
+        self.log.delete(game_id)
+
+    def close(self):
+        self.log.close()
+        self.inner.close()
+
+    def stats(self) -> dict:
+        return {**self.inner.stats(), "event_log": self.log.stats()}
@@ -0,0 +1,168 @@
+# game_logic/fake_llm.py
+# A deterministic, offline stand-in for Gemini, used for load tests and benchmarks.
+
+import asyncio
+import json
+import math
+import random
+import time
+
+from .llm_calls import GeminiAPI
+from config import LLM_MAX_CONCURRENCY
+
+FAKE_STORY_THEMES = [
+    ("The villagers trade outsiders' memories to keep their own from fading.", ["The Old Mill", "The Bell Tower", "The Root Cellar", "The Chapel Crypt", "The Dry Well", "The Hunter's Lodge"]),
+    ("A sentient tree in the woods lures travellers in for a seasonal ritual.", ["The Hollow Oak", "The Sap House", "The Bramble Maze", "The Stone Circle", "The Seed Barn", "The Fern Gully"]),
+    ("A hive-mind fungus has spread beneath the village fields.", ["The Mushroom Cave", "The Granary", "The Rot Pit", "The Spore Garden", "The Tannery", "The Cold Store"]),
+]
+
+# (node count, key clue count) per difficulty, mirroring the WorldBuilder prompt
+FAKE_NETWORK_SIZES = {"Very Easy": (8, 2), "Easy": (16, 3), "Medium": (26, 4), "Hard": (36, 6)}
+
+FAKE_DIALOGUE_LINES = [
+    "I've seen strange lights by the fields at night, and I don't like it one bit.",
+    "You're not from around here. Folk keep to themselves lately, and with good reason.",
+    "There's a chill in the air that wasn't there last harvest. Mind where you walk.",
+]
+
+def _normalize_difficulty(difficulty):
+    key = str(difficulty or "Medium").replace("_", " ").title()
+    return key if key in FAKE_NETWORK_SIZES else "Medium"
+
+class FakeLLM(GeminiAPI):
+    """
+    Drop-in replacement for GeminiAPI that never touches the network.
+
+    Only the model-call methods are replaced, so prompt building, retries and the
+    in-flight cap behave exactly as with Gemini. Responses are canned but consistent with
+    the context (Interaction replies reveal the node the engine asked for). Latency is
+    drawn from a log-normal distribution around `latency_ms` (scaled per prompt type),
+    and `error_rate` / `malformed_rate` inject provider errors and unparseable output.
+    Everything is driven by a seeded RNG, so a run is repeatable.
+    """
+
+    # WorldBuilder replies are far longer than Interaction ones
+    LATENCY_SCALE = {"StoryGenerator": 2.0, "WorldBuilder": 6.0, "WorldSkeleton": 2.5, "VillagerNodes": 1.5, "Interaction": 1.0}
+
+    def __init__(self, seed: int = 0, latency_ms: float = 0.0, latency_sigma: float = 0.5,
+                 error_rate: float = 0.0, malformed_rate: float = 0.0, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        super().__init__(api_key=None, max_concurrency=max_concurrency)
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self._rng = random.Random(seed)
+        self.calls = {}
+        print(f"✅ Fake LLM configured (seed={seed}, latency={latency_ms}ms, error_rate={error_rate}).")
+
+    def _configure_model(self, api_key):
+        return "fake"
+
+    def _get_model(self, model_name=None):
+        return self.model
+
+    # ---------- model calls ---------- #
+
+    def _call_model(self, prompt_type, context, prompt, model_name=None) -> str:
+        delay, text = self._plan_reply(prompt_type, context)
+        time.sleep(delay)
+        self._record_tokens(prompt_type, prompt, text)
+        return text
+
+    async def _call_model_async(self, prompt_type, context, prompt, model_name=None) -> str:
+        delay, text = self._plan_reply(prompt_type, context)
+        await asyncio.sleep(delay)
+        self._record_tokens(prompt_type, prompt, text)
+        return text
+
+    async def _stream_model_async(self, prompt_type, context, prompt, model_name=None):
+        delay, text = self._plan_reply(prompt_type, context)
+        self._record_tokens(prompt_type, prompt, text)
+        # Spread the reply over a handful of chunks, the first one arriving after a third of the latency
+        chunk_size = max(1, len(text) // 8)
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        await asyncio.sleep(delay / 3)
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(delay * 2 / 3 / len(chunks))
+
+    # ---------- canned replies ---------- #
+
+    def _plan_reply(self, prompt_type, context):
+        """Draws the latency, fault and reply for one call up front, so the RNG sequence stays deterministic."""
+        self.calls[prompt_type] = self.calls.get(prompt_type, 0) + 1
+        delay = 0.0
+        if self.latency_ms > 0:
+            scale = self.LATENCY_SCALE.get(prompt_type, 1.0)
+            delay = self.latency_ms * scale * math.exp(self._rng.gauss(0.0, self.latency_sigma)) / 1000.0
+        if self._rng.random() < self.error_rate:
+            raise RuntimeError(f"FakeLLM injected error for {prompt_type}")
+        if self._rng.random() < self.malformed_rate:
+            return delay, "Sorry, I can't help with that."
+
+        builders = {
+            "StoryGenerator": self._fake_story,
+            "WorldBuilder": self._fake_quest_network,
+            "WorldSkeleton": self._fake_skeleton,
+            "VillagerNodes": self._fake_villager_nodes,
+            "Interaction": self._fake_interaction,
+        }
+        return delay, json.dumps(builders[prompt_type](context))
+
+    def _fake_story(self, context):
+        theme, locations = self._rng.choice(FAKE_STORY_THEMES)
+        count = max(1, min(len(locations), int(context.get("num_inaccessible_locations", 3))))
+        chosen = locations[:count]
+        return {"story_theme": theme, "inaccessible_locations": chosen, "correct_location": self._rng.choice(chosen)}
+
+    def _fake_quest_network(self, context):
+        node_count, key_clue_count = FAKE_NETWORK_SIZES[_normalize_difficulty(context.get("difficulty"))]
+        names = [v["name"] for v in context["villagers"]]
+        key_positions = set(self._rng.sample(range(node_count), key_clue_count))
+        nodes = []
+        for i in range(node_count):
+            node_id = f"node{i + 1}"
+            # Mostly shallow chains, so a scripted player can actually finish the game
+            preconditions = [f"node{self._rng.randint(1, i)}"] if i and self._rng.random() < 0.4 else []
+            nodes.append({
+                "node_id": node_id,
+                "villager_name": names[i % len(names)],
+                "content": f"Clue {i + 1}: something about {context['correctLocation']} feels wrong.",
+                "type": "TalkToVillager" if self._rng.random() < 0.3 else "Information",
+                "priority": self._rng.randint(1, 5),
+                "key_clue": i in key_positions,
+                "preconditions": preconditions,
+                "required_familiarity": self._rng.choice([None, None, 1, 2]),
+            })
+        return {"nodes": nodes}
+
+    def _fake_skeleton(self, context):
+        network = self._fake_quest_network(context)
+        for node in network["nodes"]:
+            node["beat"] = node.pop("content")
+        return network
+
+    def _fake_villager_nodes(self, context):
+        return {"nodes": [
+            {"node_id": node["node_id"], "content": f"{context['villager']['name']} says: {node['beat']}"}
+            for node in context["nodes"]
+        ]}
+
+    def _fake_interaction(self, context):
+        status = context.get("conversational_status")
+        context_node = context.get("context_node") or {}
+        familiarity = context.get("familiarity_level", 0)
+        if status == "CAN_REVEAL":
+            dialogue = f"{self._rng.choice(FAKE_DIALOGUE_LINES)} {context_node.get('content', '')}"
+            responses = ["Tell me more.", "Who else knows about this?", "Thank you."][:self._rng.randint(1, 3)]
+            revealed = context_node.get("node_id")
+        else:
+            dialogue = self._rng.choice(FAKE_DIALOGUE_LINES)
+            responses = ["Goodbye."] if status in ("PERMANENTLY_EXHAUSTED", "HAS_LOCKED_CLUES") else ["Tell me more."]
+            revealed = None
+        return {
+            "npc_dialogue": dialogue,
+            "player_responses": responses,
+            "node_revealed_id": revealed,
+            "new_familiarity_level": min(5, familiarity + 1),
+        }
@@ -0,0 +1,137 @@
+# game_logic/fast_json.py
+# One JSON layer for the whole server: orjson when it is installed, the stdlib otherwise, plus a
+# tolerant extractor that finds the JSON object inside fenced or chatty model output.
+
+import json
+import re
+from typing import Optional, Union
+
+from config import JSON_BACKEND
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if JSON_BACKEND == "orjson" and orjson is None:
+    print("--- JSON_BACKEND=orjson but orjson is not installed; using the stdlib json module ---")
+BACKEND = "orjson" if orjson is not None and JSON_BACKEND != "stdlib" else "stdlib"
+
+# Both backends raise this (orjson's error subclasses it), so callers keep catching one type
+JSONDecodeError = json.JSONDecodeError
+
+def dumpb(obj, indent: bool = False, sort_keys: bool = False, default=None) -> bytes:
+    """Compact UTF-8 JSON bytes (two-space indented with indent=True)."""
+    if BACKEND == "orjson":
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=default, option=option)
+    return dumps(obj, indent=indent, sort_keys=sort_keys, default=default).encode("utf-8")
+
+def dumps(obj, indent: bool = False, sort_keys: bool = False, default=None) -> str:
+    if BACKEND == "orjson":
+        return dumpb(obj, indent=indent, sort_keys=sort_keys, default=default).decode("utf-8")
+    return json.dumps(
+        obj, ensure_ascii=False, sort_keys=sort_keys, default=default,
+        indent=2 if indent else None, separators=None if indent else (",", ":"),
+    )
+
+def loads(data: Union[str, bytes]):
+    if BACKEND == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
+
+# ---------- extracting the object from model output ---------- #
+
+# Outside a string only braces and quotes matter; inside one, only quotes and backslashes
+_STRUCTURAL = re.compile(r'[{}"\\]')
+
+class JSONObjectScanner:
+    """
+    Finds the first complete top-level JSON object in text that arrives in chunks.
+
+    Model replies sometimes wrap the object in a ```json fence or a sentence of chatter.
+    feed() tracks brace depth and string state across chunks, jumping between structural
+    characters with a regex instead of walking every character, and records where the
+    object starts and ends. The text is only sliced once, by text().
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0  # characters fed before the current chunk
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+
+    @property
+    def complete(self) -> bool:
+        return self.end is not None
+
+    def feed(self, chunk: str) -> bool:
+        """Scans one more chunk. Returns True once the object is complete."""
+        if not chunk or self.end is not None:
+            self._chunks.append(chunk)
+            return self.end is not None
+        self._chunks.append(chunk)
+        offset = self._offset
+        self._offset += len(chunk)
+
+        position = 0
+        if self._escaped:
+            # A backslash ended the previous chunk; this chunk's first character is escaped
+            self._escaped = False
+            position = 1
+        if self.start is None:
+            begin = chunk.find("{", position)
+            if begin == -1:
+                return False
+            self.start = offset + begin
+            position = begin
+
+        search = _STRUCTURAL.search
+        match = search(chunk, position)
+        while match is not None:
+            char = match.group()
+            position = match.end()
+            if self._in_string:
+                if char == "\\":
+                    if position == len(chunk):
+                        self._escaped = True
+                        return False
+                    position += 1  # the escaped character can never end the string
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = offset + position
+                    return True
+            match = search(chunk, position)
+        return False
+
+    def text(self) -> str:
+        """The object's text (to the end if it never closed); all of the text if none started."""
+        joined = self._chunks[0] if len(self._chunks) == 1 else "".join(self._chunks)
+        self._chunks = [joined]
+        if self.start is None:
+            return joined.strip()
+        return joined[self.start:self.end]
+
+def extract_json(text: str) -> str:
+    """The first JSON object in a model reply; the stripped reply itself if there is none."""
+    stripped = text.strip()
+    # The common case: the model returned just the object (response_mime_type is JSON)
+    if stripped.startswith("{") and stripped.endswith("}"):
+        return stripped
+    scanner = JSONObjectScanner()
+    scanner.feed(text)
+    return scanner.text()
@@ -0,0 +1,318 @@
+# game_logic/game_store.py
+# Storage backends for live GameState objects, replacing the unbounded per-process dict.
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from . import fast_json
+from .metrics import METRICS
+from .state_manager import GameState
+
+class GameStore:
+    """
+    Interface shared by every backend.
+
+    The server calls get() once at the start of a request (games are loaded lazily,
+    only when a player touches them) and writes once at the end of a turn that changed
+    the game, so each backend sees at most one write per turn. Turns are written with
+    put_if_version() (see commit_turn); put() is for new games.
+    """
+
+    # True if games outlive the process, so wrapping the store in an event log buys nothing
+    durable = False
+
+    def get(self, game_id: str) -> Optional[GameState]:
+        raise NotImplementedError
+
+    def put(self, game_state: GameState):
+        raise NotImplementedError
+
+    def version(self, game_id: str) -> Optional[int]:
+        """The stored game's version, or None if there is no such game."""
+        game_state = self.get(game_id)
+        return game_state.version if game_state is not None else None
+
+    def put_if_version(self, game_state: GameState, expected_version: int) -> bool:
+        """
+        Writes the game only if the stored copy is still at expected_version, bumping
+        game_state.version. Returns False (and writes nothing) if another writer got there first.
+
+        This default is only atomic within one process, which is all an in-process store
+        needs: the event loop runs it without interruption.
+        """
+        if self.version(game_state.game_id) != expected_version:
+            return False
+        game_state.version = expected_version + 1
+        self.put(game_state)
+        return True
+
+    def delete(self, game_id: str):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__}
+
+    def close(self):
+        """Releases files and connections at shutdown."""
+
+def _estimate_size(game_state: GameState) -> int:
+    return game_state.sizeof()
+
+class MemoryGameStore(GameStore):
+    """
+    In-process LRU store with idle TTL and max-games/max-bytes bounds.
+
+    Fastest backend, but it only works with a single worker process.
+    """
+
+    def __init__(self, max_games: int = 10000, max_bytes: int = 0, ttl_seconds: float = 3600.0):
+        self.max_games = max_games
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # game_id -> (game_state, size_in_bytes, last_access)
+        self._games: "OrderedDict[str, tuple]" = OrderedDict()
+        self._total_bytes = 0
+        self.evictions = 0
+
+    def get(self, game_id: str) -> Optional[GameState]:
+        entry = self._games.get(game_id)
+        if entry is None:
+            return None
+        game_state, size, last_access = entry
+        now = time.monotonic()
+        if self.ttl_seconds and now - last_access > self.ttl_seconds:
+            self._remove(game_id)
+            self.evictions += 1
+            return None
+        self._games[game_id] = (game_state, size, now)
+        self._games.move_to_end(game_id)
+        return game_state
+
+    def put(self, game_state: GameState):
+        # Sizing walks every object the game holds (a deep getsizeof), so only pay for it when a byte bound is set
+        size = _estimate_size(game_state) if self.max_bytes else 0
+        self._remove(game_state.game_id)
+        self._games[game_state.game_id] = (game_state, size, time.monotonic())
+        self._total_bytes += size
+        self._evict()
+
+    def delete(self, game_id: str):
+        self._remove(game_id)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "games": len(self._games),
+            "bytes": self._total_bytes,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, game_id: str):
+        entry = self._games.pop(game_id, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+
+    def _evict(self):
+        now = time.monotonic()
+        # Least recently used games sit at the front, so expired ones are found first
+        while self._games:
+            game_id, (_, _, last_access) = next(iter(self._games.items()))
+            over_ttl = self.ttl_seconds and now - last_access > self.ttl_seconds
+            over_count = self.max_games and len(self._games) > self.max_games
+            over_bytes = self.max_bytes and self._total_bytes > self.max_bytes
+            if not (over_ttl or over_count or over_bytes):
+                break
+            self._remove(game_id)
+            self.evictions += 1
+
+class SQLiteGameStore(GameStore):
+    """
+    Stores each game as a compressed JSON row in a SQLite database.
+
+    Any worker process pointed at the same file can serve any game, which is what
+    lets gunicorn run more than one worker. Expired rows are purged periodically.
+    """
+
+    PURGE_EVERY_N_WRITES = 500
+    durable = True
+
+    def __init__(self, path: str, ttl_seconds: float = 3600.0):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS games (game_id TEXT PRIMARY KEY, state BLOB NOT NULL, updated_at REAL NOT NULL,"
+            " version INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(games)")}
+        if "version" not in columns:
+            # Databases written before games were versioned
+            self._conn.execute("ALTER TABLE games ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._writes = 0
+
+    def get(self, game_id: str) -> Optional[GameState]:
+        with self._lock:
+            row = self._conn.execute("SELECT state, updated_at FROM games WHERE game_id = ?", (game_id,)).fetchone()
+        if row is None:
+            return None
+        state, updated_at = row
+        if self.ttl_seconds and time.time() - updated_at > self.ttl_seconds:
+            self.delete(game_id)
+            return None
+        return GameState.from_dict(fast_json.loads(zlib.decompress(state)))
+
+    def put(self, game_state: GameState):
+        state = zlib.compress(fast_json.dumpb(game_state.to_dict()))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO games (game_id, state, updated_at, version) VALUES (?, ?, ?, ?)",
+                (game_state.game_id, state, time.time(), game_state.version),
+            )
+            self._after_write()
+
+    def version(self, game_id: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM games WHERE game_id = ?", (game_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def put_if_version(self, game_state: GameState, expected_version: int) -> bool:
+        # A compare-and-swap in one statement, so it holds across worker processes too
+        game_state.version = expected_version + 1
+        state = zlib.compress(fast_json.dumpb(game_state.to_dict()))
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE games SET state = ?, updated_at = ?, version = ? WHERE game_id = ? AND version = ?",
+                (state, time.time(), game_state.version, game_state.game_id, expected_version),
+            )
+            if cursor.rowcount == 0:
+                game_state.version = expected_version
+                return False
+            self._after_write()
+        return True
+
+    def _after_write(self):
+        self._writes += 1
+        if self.ttl_seconds and self._writes % self.PURGE_EVERY_N_WRITES == 0:
+            self._conn.execute("DELETE FROM games WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+
+    def delete(self, game_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM games WHERE game_id = ?", (game_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM games").fetchone()
+        return {"backend": "sqlite", "path": self.path, "games": count}
+
+class ShardedGameStore(GameStore):
+    """Spreads games over several stores by a stable hash of the game id."""
+
+    def __init__(self, shards: List[GameStore]):
+        if not shards:
+            raise ValueError("ShardedGameStore needs at least one shard.")
+        self.shards = shards
+
+    @property
+    def durable(self) -> bool:
+        return all(shard.durable for shard in self.shards)
+
+    def _shard_for(self, game_id: str) -> GameStore:
+        return self.shards[zlib.crc32(game_id.encode("utf-8")) % len(self.shards)]
+
+    def get(self, game_id: str) -> Optional[GameState]:
+        return self._shard_for(game_id).get(game_id)
+
+    def put(self, game_state: GameState):
+        self._shard_for(game_state.game_id).put(game_state)
+
+    def version(self, game_id: str) -> Optional[int]:
+        return self._shard_for(game_id).version(game_id)
+
+    def put_if_version(self, game_state: GameState, expected_version: int) -> bool:
+        return self._shard_for(game_state.game_id).put_if_version(game_state, expected_version)
+
+    def delete(self, game_id: str):
+        self._shard_for(game_id).delete(game_id)
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+    def stats(self) -> dict:
+        return {"backend": "sharded", "shards": [shard.stats() for shard in self.shards]}
+
+class GameConflictError(Exception):
+    """A turn could not be committed: other writers kept changing the game first."""
+
+def commit_turn(store: GameStore, game_state: GameState, read_version: int,
+                apply: Callable[[GameState], None], max_attempts: int = 5) -> Optional[GameState]:
+    """
+    Applies a played turn to its game and writes it: the short critical section of a turn.
+
+    `game_state` is the game the turn was played against, read at `read_version`; the slow
+    part (waiting on the model) happened without holding anything. If another turn
+    committed in the meantime, the latest version is read back and `apply` runs on that
+    instead, so neither turn's changes are lost. The write is a compare-and-swap on the
+    version, retried the same way if another worker wins the race. `apply` must not await
+    and must be safe to run on any version of the game.
+
+    Returns the game as written, or None if it no longer exists. Raises GameConflictError
+    after max_attempts lost races.
+    """
+    target, expected = game_state, read_version
+    rebased = False
+    for _ in range(max(1, max_attempts)):
+        stored = store.version(game_state.game_id)
+        if stored is None:
+            return None
+        if stored != expected:
+            target = store.get(game_state.game_id)
+            if target is None:
+                return None
+            expected, rebased = target.version, True
+        apply(target)
+        if store.put_if_version(target, expected):
+            METRICS.inc("echoes_game_commits_total", outcome="rebased" if rebased else "clean")
+            return target
+        # Lost the compare-and-swap; read the winner's version on the next pass
+        expected = None
+    METRICS.inc("echoes_game_commits_total", outcome="conflict")
+    raise GameConflictError(f"Game {game_state.game_id} kept changing; the turn was not saved.")
+
+def create_game_store(backend: str, max_games: int, max_bytes: int, ttl_seconds: float,
+                      sqlite_path: str, num_shards: int, shard_backend: str) -> GameStore:
+    """Builds the store selected in config.py."""
+    if backend == "memory":
+        return MemoryGameStore(max_games=max_games, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+    if backend == "sqlite":
+        return SQLiteGameStore(sqlite_path, ttl_seconds=ttl_seconds)
+    if backend == "sharded":
+        num_shards = max(1, num_shards)
+        if shard_backend == "sqlite":
+            root, ext = os.path.splitext(sqlite_path)
+            shards = [SQLiteGameStore(f"{root}_{i}{ext}", ttl_seconds=ttl_seconds) for i in range(num_shards)]
+        else:
+            # Split the global bounds evenly; 0 keeps meaning "unbounded"
+            shard_max_games = max(1, max_games // num_shards) if max_games else 0
+            shard_max_bytes = max(1, max_bytes // num_shards) if max_bytes else 0
+            shards = [
+                MemoryGameStore(max_games=shard_max_games, max_bytes=shard_max_bytes, ttl_seconds=ttl_seconds)
+                for _ in range(num_shards)
+            ]
+        return ShardedGameStore(shards)
+    raise ValueError(f"Unknown game store backend '{backend}'.")
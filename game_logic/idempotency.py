@@ -0,0 +1,101 @@
+# game_logic/idempotency.py
+# Idempotency-Key support: retried requests get the original result instead of redoing the work.
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Tuple
+
+from . import fast_json
+from .metrics import METRICS
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a request with a different body."""
+
+class _Entry:
+    __slots__ = ("fingerprint", "task", "expires")
+
+    def __init__(self, fingerprint: str, task: asyncio.Task, expires: float):
+        self.fingerprint = fingerprint
+        self.task = task
+        self.expires = expires
+
+class IdempotencyCache:
+    """
+    Results of recent requests that carried an Idempotency-Key, per key.
+
+    The first request with a key runs its handler as a task. A duplicate that arrives
+    while it is still running awaits the same task (coalesced), and one that arrives
+    later gets the stored result (replayed) until it is `ttl_seconds` old. Because the
+    work runs in its own task, a client that times out and disconnects does not cancel
+    the call its retry is about to attach to.
+
+    Only successful results are kept: a request that raised is forgotten once its
+    waiters have seen the error, so a retry runs it again. A key sent again with a
+    different request body raises IdempotencyKeyReused. Results live in this process
+    only; with several workers a retry that lands on another worker runs anew.
+    """
+
+    def __init__(self, ttl_seconds: float = 600.0, max_keys: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max(1, max_keys)
+        # Insertion order is expiry order, so expired entries are found at the front
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.stats_counts = {"new": 0, "coalesced": 0, "replayed": 0, "mismatch": 0}
+
+    @staticmethod
+    def fingerprint(body) -> str:
+        return hashlib.sha1(fast_json.dumpb(body, sort_keys=True, default=str)).hexdigest()
+
+    async def run(self, key: str, fingerprint: str, handler: Callable[[], Awaitable]) -> Tuple[object, str]:
+        """
+        Returns (result, outcome): outcome is "new" if handler ran for this call, otherwise
+        "coalesced" or "replayed". Must run on the event loop.
+        """
+        self._expire()
+        entry = self._entries.get(key)
+        if entry is not None and entry.task.done() and (entry.task.cancelled() or entry.task.exception() is not None):
+            entry = None  # A failure that was not cleaned up yet; run again
+        if entry is None:
+            entry = _Entry(fingerprint, asyncio.ensure_future(handler()), time.monotonic() + self.ttl_seconds)
+            entry.task.add_done_callback(lambda task: self._forget_failure(key, task))
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            outcome = "new"
+        elif entry.fingerprint != fingerprint:
+            self._count("mismatch")
+            raise IdempotencyKeyReused(key)
+        else:
+            outcome = "replayed" if entry.task.done() else "coalesced"
+        self._count(outcome)
+        # shield: this caller going away must not cancel the work other callers share
+        return await asyncio.shield(entry.task), outcome
+
+    def _forget_failure(self, key: str, task: asyncio.Task):
+        if task.cancelled() or task.exception() is not None:
+            entry = self._entries.get(key)
+            if entry is not None and entry.task is task:
+                del self._entries[key]
+
+    def _expire(self):
+        now = time.monotonic()
+        excess = len(self._entries) - self.max_keys
+        expired = []
+        for key, entry in self._entries.items():
+            if entry.expires > now and excess <= 0:
+                break
+            # Requests still running are never dropped (they are bounded by the server's
+            # concurrency), but they are skipped rather than holding back the entries after them
+            if entry.task.done():
+                expired.append(key)
+                excess -= 1
+        for key in expired:
+            del self._entries[key]
+
+    def _count(self, outcome: str):
+        self.stats_counts[outcome] += 1
+        METRICS.inc("echoes_idempotency_requests_total", outcome=outcome)
+
+    def stats(self) -> dict:
+        return {"keys": len(self._entries), "ttl_seconds": self.ttl_seconds, **self.stats_counts}
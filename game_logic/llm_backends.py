@@ -0,0 +1,234 @@
+# game_logic/llm_backends.py
+# Where each LLM call goes: backends that reach a model, and the router that picks backend and model per call.
+
+import asyncio
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import fast_json
+from .metrics import METRICS
+
+class LLMBackend:
+    """
+    One way of reaching models. GeminiAPI builds the prompt, applies retries, deadlines and
+    the scheduler, and hands the call itself to the backend its router picked.
+    """
+
+    name = "backend"
+
+    def generate(self, prompt_type: str, context: dict, prompt: str, model: str, generation_config: dict, timeout: float) -> str:
+        raise NotImplementedError
+
+    async def generate_async(self, prompt_type: str, context: dict, prompt: str, model: str, generation_config: dict,
+                             timeout: float) -> str:
+        raise NotImplementedError
+
+    async def stream_async(self, prompt_type: str, context: dict, prompt: str, model: str, generation_config: dict,
+                           timeout: float):
+        """Async generator of text chunks."""
+        raise NotImplementedError
+        yield
+
+class OpenAICompatibleBackend(LLMBackend):
+    """
+    Any server that speaks the OpenAI chat completions API: a local inference server
+    (vLLM, llama.cpp, Ollama), a hosted one, or llm_stub_server.py for tests.
+
+    Calls go through `requests` in a worker thread, so they never block the event loop.
+    The prompt type is sent in an X-Echoes-Prompt-Type header. With send_context=True the
+    prompt's context is sent too, in an "echoes_context" field, which only the stub server
+    understands (a real server may reject the unknown field).
+    """
+
+    def __init__(self, name: str, base_url: str, api_key: str = "", send_context: bool = False,
+                 max_connections: int = 32, on_usage: Optional[Callable] = None):
+        self.name = name
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.api_key = api_key
+        self.send_context = send_context
+        # on_usage(prompt_type, prompt, text, usage) records token counts (GeminiAPI._record_tokens)
+        self.on_usage = on_usage
+        self._session = requests.Session()
+        self._session.mount(self.url.split("/", 3)[0] + "//", HTTPAdapter(pool_maxsize=max_connections))
+
+    def _request(self, prompt_type: str, context: dict, prompt: str, model: str, generation_config: dict, stream: bool):
+        payload = {"model": model, "messages": [{"role": "user", "content": prompt}], "stream": stream}
+        if generation_config.get("response_mime_type") == "application/json":
+            payload["response_format"] = {"type": "json_object"}
+        if "temperature" in generation_config:
+            payload["temperature"] = generation_config["temperature"]
+        if stream:
+            payload["stream_options"] = {"include_usage": True}
+        if self.send_context:
+            payload["echoes_context"] = context
+        headers = {"Content-Type": "application/json", "X-Echoes-Prompt-Type": prompt_type}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return fast_json.dumpb(payload, default=str), headers
+
+    def _record_usage(self, prompt_type: str, prompt: str, text: str, usage: Optional[dict]):
+        if self.on_usage is not None:
+            usage = usage or {}
+            self.on_usage(prompt_type, prompt, text, SimpleNamespace(
+                prompt_token_count=usage.get("prompt_tokens"), candidates_token_count=usage.get("completion_tokens"),
+            ))
+
+    def generate(self, prompt_type, context, prompt, model, generation_config, timeout) -> str:
+        body, headers = self._request(prompt_type, context, prompt, model, generation_config, stream=False)
+        response = self._session.post(self.url, data=body, headers=headers, timeout=timeout)
+        response.raise_for_status()
+        reply = fast_json.loads(response.content)
+        text = reply["choices"][0]["message"]["content"] or ""
+        self._record_usage(prompt_type, prompt, text, reply.get("usage"))
+        return text
+
+    async def generate_async(self, prompt_type, context, prompt, model, generation_config, timeout) -> str:
+        return await asyncio.to_thread(self.generate, prompt_type, context, prompt, model, generation_config, timeout)
+
+    async def stream_async(self, prompt_type, context, prompt, model, generation_config, timeout):
+        body, headers = self._request(prompt_type, context, prompt, model, generation_config, stream=True)
+        response = await asyncio.to_thread(
+            self._session.post, self.url, data=body, headers=headers, timeout=timeout, stream=True,
+        )
+        received, usage = [], None
+        try:
+            response.raise_for_status()
+            lines = response.iter_lines()
+            while True:
+                # Server-sent events: one "data: {...}" line per chunk, then "data: [DONE]"
+                line = await asyncio.to_thread(next, lines, None)
+                if line is None:
+                    break
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                event = fast_json.loads(data)
+                usage = event.get("usage") or usage
+                for choice in event.get("choices") or []:
+                    text = (choice.get("delta") or {}).get("content")
+                    if text:
+                        received.append(text)
+                        yield text
+        finally:
+            response.close()
+        self._record_usage(prompt_type, prompt, "".join(received), usage)
+
+# ---------- routing ---------- #
+
+class RouteTarget(NamedTuple):
+    backend: str
+    model: str
+
+    def __str__(self) -> str:
+        return f"{self.backend}:{self.model}"
+
+class _TargetLatency:
+    """Latencies of a target's calls over the last `window` seconds."""
+
+    def __init__(self, window: float, min_samples: int):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=200)
+
+    def observe(self, seconds: float):
+        self._samples.append((time.monotonic(), seconds))
+
+    def p95(self) -> Optional[float]:
+        cutoff = time.monotonic() - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(seconds for _, seconds in self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+class LLMRouter:
+    """
+    Picks the backend and model for each LLM call.
+
+    A route maps a prompt type, optionally narrowed to one difficulty ("WorldBuilder@Hard"),
+    to a fallback chain of targets, preferred first and cheapest last. Prompt types without
+    a route use `default_target`. A call goes to the first target in the chain that is not
+    shedding load; the last one always accepts. A target sheds load while its p95 latency
+    for the prompt type (world builds run far longer than dialogue turns) over the last
+    `window` seconds is above `slow_seconds`, or while more than `shed_queue`
+    calls are waiting for a scheduler slot. Slow samples age out of the window, so a
+    target that recovers gets traffic again. A retry after a failed attempt starts one
+    step further down the chain.
+    """
+
+    def __init__(self, routes: Dict[Tuple[str, Optional[str]], List[Tuple[str, str]]], backends: Dict[str, LLMBackend],
+                 default_target: RouteTarget, slow_seconds: float = 0.0, shed_queue: int = 0,
+                 window: float = 60.0, min_samples: int = 5):
+        self.backends = backends
+        # Clients send difficulty in any case ("medium", "Medium"), so it is matched lowercased
+        self.routes = {
+            (prompt_type, difficulty.lower() if difficulty else None): [RouteTarget(*target) for target in chain]
+            for (prompt_type, difficulty), chain in routes.items() if chain
+        }
+        for chain in self.routes.values():
+            for target in chain:
+                if target.backend not in backends:
+                    raise ValueError(f"LLM route target {target} names an unknown backend; known: {sorted(backends)}.")
+        self.default_chain = [default_target]
+        self.slow_seconds = slow_seconds
+        self.shed_queue = shed_queue
+        self.window = window
+        self.min_samples = min_samples
+        self._latency: Dict[Tuple[str, RouteTarget], _TargetLatency] = {}
+
+    def chain(self, prompt_type: str, difficulty: Optional[str] = None) -> List[RouteTarget]:
+        return (self.routes.get((prompt_type, str(difficulty).lower())) if difficulty else None) \
+            or self.routes.get((prompt_type, None)) or self.default_chain
+
+    def choose(self, prompt_type: str, difficulty: Optional[str], attempt: int, queue_depth: int) -> RouteTarget:
+        chain = self.chain(prompt_type, difficulty)
+        for target in chain[min(attempt - 1, len(chain) - 1):-1]:
+            reason = self._shedding(prompt_type, target, queue_depth)
+            if reason is None:
+                return self._routed(prompt_type, target)
+            METRICS.inc("echoes_llm_route_shed_total", prompt_type=prompt_type, target=str(target), reason=reason)
+        return self._routed(prompt_type, chain[-1])
+
+    def _shedding(self, prompt_type: str, target: RouteTarget, queue_depth: int) -> Optional[str]:
+        if self.shed_queue and queue_depth > self.shed_queue:
+            return "load"
+        latency = self._latency.get((prompt_type, target))
+        p95 = latency.p95() if latency is not None else None
+        if self.slow_seconds and p95 is not None and p95 > self.slow_seconds:
+            return "slow"
+        return None
+
+    def _routed(self, prompt_type: str, target: RouteTarget) -> RouteTarget:
+        METRICS.inc("echoes_llm_route_calls_total", prompt_type=prompt_type, target=str(target))
+        return target
+
+    def observe(self, prompt_type: str, target: RouteTarget, seconds: float):
+        """Records how long a call to target took, without queueing."""
+        latency = self._latency.get((prompt_type, target))
+        if latency is None:
+            latency = self._latency[(prompt_type, target)] = _TargetLatency(self.window, self.min_samples)
+        latency.observe(seconds)
+
+    def backend(self, target: RouteTarget) -> LLMBackend:
+        return self.backends[target.backend]
+
+    def stats(self) -> dict:
+        return {
+            "routes": {
+                (f"{prompt_type}@{difficulty}" if difficulty else prompt_type): [str(t) for t in chain]
+                for (prompt_type, difficulty), chain in self.routes.items()
+            },
+            "default": str(self.default_chain[0]),
+            "p95_ms": {
+                f"{prompt_type} {target}": round(p95 * 1000, 1)
+                for (prompt_type, target), latency in self._latency.items() if (p95 := latency.p95()) is not None
+            },
+        }
@@ -1,58 +1,602 @@
 # game_logic/llm_calls.py
 # Contains the GeminiAPI class and all prompt engineering logic.
 
-import json
 import time
+import asyncio
+from datetime import timedelta
 import google.generativeai as genai
+from google.generativeai import caching
+from .metrics import METRICS
+from . import fast_json
+from .fast_json import extract_json
+from .memory import estimate_tokens
+from .llm_resilience import LLMError, LLMTimeoutError, LLMUnavailableError, CircuitBreaker, LatencyTracker
+from .llm_schemas import parse_llm_json
+from .response_cache import LLMResponseCache
+from .llm_backends import LLMBackend, LLMRouter, OpenAICompatibleBackend, RouteTarget
+from .llm_scheduler import LLMScheduler, LLMOverloadedError, LLM_PRIORITY, LLM_GAME_ID
+from config import (
+    LLM_MAX_CONCURRENCY, LLM_TOKENS_PER_MINUTE, LLM_MAX_QUEUE, GEMINI_CONTEXT_CACHE, GEMINI_CONTEXT_CACHE_TTL_SECONDS,
+    LLM_ATTEMPT_TIMEOUTS, LLM_BREAKER_WINDOW, LLM_BREAKER_ERROR_RATE, LLM_BREAKER_MIN_CALLS,
+    LLM_BREAKER_COOLDOWN_SECONDS, LLM_HEDGE_PROMPT_TYPES, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_DELAY_MS,
+    LLM_TEMPERATURES, LLM_CACHE_POLICY, LLM_CACHE_MEMORY_MB, LLM_CACHE_PATH, LLM_CACHE_DISK_MB,
+    LLM_BACKENDS, LLM_BACKEND_API_KEYS, LLM_BACKENDS_WITH_CONTEXT, LLM_ROUTES, LLM_ROUTE_SLOW_MS, LLM_ROUTE_SHED_QUEUE,
+)
+
+DEFAULT_MODEL_NAME = 'gemini-2.5-flash-lite'
+GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+# Quest network shape per difficulty, shared by the WorldBuilder and WorldSkeleton prompts
+DIFFICULTY_SETTINGS = {
+    'Very Easy': {
+        'node_count': "8",
+        'key_clue_count': 2,
+        'final_clue_instruction': "The final clue must be extremely direct and explicitly state where to go.",
+        'difficulty_instructions': "Clues must be direct and obvious. Avoid riddles or metaphors.",
+        'type_instruction': "Generate **exactly 2 nodes** of type 'TalkToVillager' to guide the player. The rest should be 'Information'.",
+    },
+    'Easy': {
+        'node_count': "15-20",
+        'key_clue_count': 3,
+        'final_clue_instruction': "The final clue should be a strong hint, making the answer clear.",
+        'difficulty_instructions': "Clues should be mostly straightforward.",
+        'type_instruction': "You may use a mix of 'Information' and 'TalkToVillager' nodes.",
+    },
+    'Medium': {
+        'node_count': "25-30",
+        'key_clue_count': 4,
+        'final_clue_instruction': "The final clue must be cryptic. Do not state the answer directly.",
+        'difficulty_instructions': "Clues should require some thought and interpretation.",
+        'type_instruction': "Create a web-like structure with a good mix of 'Information' and 'TalkToVillager' nodes.",
+    },
+    'Hard': {
+        'node_count': "35-40",
+        'key_clue_count': 6,
+        'final_clue_instruction': "The final clue must be extremely cryptic, requiring significant deduction.",
+        'difficulty_instructions': "Clues must be cryptic and often misleading. Use riddles and metaphors.",
+        'type_instruction': "Create a complex web using many 'TalkToVillager' nodes to interconnect clues.",
+    },
+}
+
+def canonical_difficulty(difficulty: str) -> str:
+    """"hard" -> "Hard": the prompts know the DIFFICULTY_SETTINGS names; unknown names pass through."""
+    names = {name.lower(): name for name in DIFFICULTY_SETTINGS}
+    return names.get(str(difficulty).strip().lower(), difficulty)
+
+class GeminiBackend(LLMBackend):
+    """
+    Gemini, through GeminiAPI's own model-call methods, so the subclasses that replace
+    those (FakeLLM, ReplayLLM) stand in for it when it is routed to.
+    """
+
+    name = "gemini"
+
+    def __init__(self, api: "GeminiAPI"):
+        self.api = api
+
+    def _check_configured(self, prompt_type):
+        if not self.api.model:
+            raise LLMUnavailableError("Gemini model is not configured.", prompt_type)
+
+    def generate(self, prompt_type, context, prompt, model, generation_config, timeout) -> str:
+        self._check_configured(prompt_type)
+        return self.api._call_model(prompt_type, context, prompt, model)
+
+    async def generate_async(self, prompt_type, context, prompt, model, generation_config, timeout) -> str:
+        self._check_configured(prompt_type)
+        return await self.api._call_model_async(prompt_type, context, prompt, model)
+
+    async def stream_async(self, prompt_type, context, prompt, model, generation_config, timeout):
+        self._check_configured(prompt_type)
+        async for text in self.api._stream_model_async(prompt_type, context, prompt, model):
+            yield text
 
 class GeminiAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 context_cache: bool = GEMINI_CONTEXT_CACHE, context_cache_ttl: int = GEMINI_CONTEXT_CACHE_TTL_SECONDS):
+        self.model = self._configure_model(api_key)
+        # Extra models (e.g. a cheaper one for the fast dialogue tier), created on first use
+        self._models = {DEFAULT_MODEL_NAME: self.model}
+        # Admission control for async LLM calls: concurrency cap, TPM budget, priorities
+        self.max_concurrency = max(1, max_concurrency)
+        self.scheduler = LLMScheduler(self.max_concurrency, tokens_per_minute=LLM_TOKENS_PER_MINUTE, max_queue=LLM_MAX_QUEUE)
+        # Interaction prompt prefixes, and the Gemini cached contents holding them, per villager
+        self._villager_prefixes = {}
+        self.context_cache = context_cache
+        self.context_cache_ttl = context_cache_ttl
+        self._cached_models = {}
+        self._cache_locks = {}
+        # villager -> (monotonic time to try again, failures in a row) after a failed upload
+        self._cache_backoff = {}
+        # Tail-latency guards: per-attempt deadlines, a circuit breaker and optional hedging
+        self.attempt_timeouts = dict(LLM_ATTEMPT_TIMEOUTS)
+        self.breaker = CircuitBreaker(
+            window=LLM_BREAKER_WINDOW,
+            error_rate=LLM_BREAKER_ERROR_RATE,
+            min_calls=LLM_BREAKER_MIN_CALLS,
+            cooldown_seconds=LLM_BREAKER_COOLDOWN_SECONDS,
+        )
+        self.latencies = LatencyTracker()
+        self.hedge_prompt_types = set(LLM_HEDGE_PROMPT_TYPES)
+        # Set to a SessionRecorder (see recording.py) to capture every successful call for replay
+        self.recorder = None
+        self.hedge_percentile = LLM_HEDGE_PERCENTILE
+        self.hedge_min_delay = LLM_HEDGE_MIN_DELAY_MS / 1000.0
+        self.temperatures = dict(LLM_TEMPERATURES)
+        # Replies reused for byte-identical requests, per prompt type policy (see response_cache.py)
+        self.response_cache = LLMResponseCache(
+            LLM_CACHE_POLICY,
+            memory_max_bytes=int(LLM_CACHE_MEMORY_MB * 1024 * 1024),
+            disk_path=LLM_CACHE_PATH,
+            disk_max_bytes=int(LLM_CACHE_DISK_MB * 1024 * 1024),
+        )
+        # Which backend and model serve each call, with fallbacks (see llm_backends.py)
+        self.backends = {"gemini": GeminiBackend(self)}
+        for name, base_url in LLM_BACKENDS.items():
+            self.backends[name] = OpenAICompatibleBackend(
+                name, base_url, api_key=LLM_BACKEND_API_KEYS.get(name, ""), send_context=name in LLM_BACKENDS_WITH_CONTEXT,
+                max_connections=self.max_concurrency, on_usage=self._record_tokens,
+            )
+        self.router = LLMRouter(
+            LLM_ROUTES, self.backends, RouteTarget("gemini", DEFAULT_MODEL_NAME),
+            slow_seconds=LLM_ROUTE_SLOW_MS / 1000.0, shed_queue=LLM_ROUTE_SHED_QUEUE,
+        )
+
+    def _configure_model(self, api_key):
         try:
             genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-flash-lite')
+            model = genai.GenerativeModel(DEFAULT_MODEL_NAME)
             print("✅ Gemini API configured successfully.")
+            return model
         except Exception as e:
             print(f"❌ Error configuring Gemini API: {e}")
-            self.model = None
+            return None
 
     def _clean_json_response(self, text_response):
-        text_response = text_response.strip()
-        if text_response.startswith("```json"):
-            text_response = text_response[7:]
-        if text_response.endswith("```"):
-            text_response = text_response[:-3]
-        return text_response.strip()
-
-    def generate_content(self, prompt_type, context):
-        if not self.model: return "{}"
-        print(f"\n--- 🤖 Live Gemini API Call ({prompt_type}) ---")
-        
+        # Finds the object even when the model wraps it in a fence or adds a sentence around it
+        with METRICS.span("json_clean"):
+            return extract_json(text_response)
+
+    def _get_model(self, model_name=None):
+        if not self.model or not model_name:
+            return self.model
+        if model_name not in self._models:
+            self._models[model_name] = genai.GenerativeModel(model_name)
+        return self._models[model_name]
+
+    def _build_prompt(self, prompt_type, context):
         prompts = {
             "StoryGenerator": self._create_story_generator_prompt,
             "WorldBuilder": self._create_world_builder_prompt,
+            "WorldSkeleton": self._create_world_skeleton_prompt,
+            "VillagerNodes": self._create_villager_nodes_prompt,
             "Interaction": self._create_interaction_prompt,
         }
-        prompt = prompts.get(prompt_type, lambda _: "")(context)
-        if not prompt: 
+        with METRICS.span("prompt_build", prompt_type=prompt_type):
+            prompt = prompts.get(prompt_type, lambda _: "")(context)
+        if not prompt:
             print(f"--- ERROR: No prompt found for type '{prompt_type}' ---")
-            return "{}"
+        return prompt
+
+    def generate_content(self, prompt_type, context, model_name=None):
+        """Blocking variant, kept for scripts. The server uses generate_content_async. Raises LLMError on failure."""
+        chain = self._route_chain(prompt_type, context, model_name)
+        prompt = self._build_prompt(prompt_type, context)
+        if not prompt:
+            raise LLMError(f"No prompt found for type '{prompt_type}'", prompt_type)
+        cache_key, cached = self._cached_reply(prompt_type, context, prompt, chain[0].model)
+        if cached is not None:
+            return cached
+        print(f"\n--- 🤖 Live Gemini API Call ({prompt_type}) ---")
 
         print("--- Sending Prompt to Gemini... (This may take a moment) ---")
         max_attempts = 3
         delay = 1.0
         for attempt in range(1, max_attempts + 1):
+            self._check_breaker(prompt_type)
+            target = self._choose_target(prompt_type, context, model_name, attempt)
+            started = time.perf_counter()
             try:
-                response = self.model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
-                text = response.text if hasattr(response, "text") else str(response)
-                return self._clean_json_response(text)
+                with METRICS.span("llm_call", prompt_type=prompt_type):
+                    text = self.router.backend(target).generate(
+                        prompt_type, context, prompt, target.model, self._generation_config(prompt_type), self._attempt_timeout(prompt_type),
+                    )
             except Exception as e:
-                print(f"❌ Gemini API error (attempt {attempt}/{max_attempts}): {e}")
-                if attempt < max_attempts:
-                    time.sleep(delay)
-                    delay *= 2
-                else:
-                    print("--- Gemini API failed after retries, returning empty JSON string. ---")
-                    return "{}"
+                error = self._attempt_failed(prompt_type, e, attempt, max_attempts, retrying=attempt < max_attempts, target=target)
+                if attempt == max_attempts:
+                    raise error from e
+                time.sleep(delay)
+                delay *= 2
+                continue
+            self.router.observe(prompt_type, target, time.perf_counter() - started)
+            self._attempt_succeeded(prompt_type, prompt, text, time.perf_counter() - started)
+            self._record_exchange(prompt_type, context, prompt, text, time.perf_counter() - started)
+            return self._cache_reply(cache_key if target == chain[0] else None, prompt_type, self._clean_json_response(text))
+
+    async def generate_content_async(self, prompt_type, context, model_name=None):
+        """Non-blocking variant: awaits the Gemini call so the event loop keeps serving other games."""
+        chain = self._route_chain(prompt_type, context, model_name)
+        prompt = self._build_prompt(prompt_type, context)
+        if not prompt:
+            raise LLMError(f"No prompt found for type '{prompt_type}'", prompt_type)
+        cache_key, cached = self._cached_reply(prompt_type, context, prompt, chain[0].model)
+        if cached is not None:
+            return cached
+        print(f"\n--- 🤖 Live Gemini API Call ({prompt_type}, async) ---")
+
+        max_attempts = 3
+        delay = 1.0
+        for attempt in range(1, max_attempts + 1):
+            self._check_breaker(prompt_type)
+            target = self._choose_target(prompt_type, context, model_name, attempt)
+            started = time.perf_counter()
+            try:
+                text = await self._hedged_call_async(prompt_type, context, prompt, target)
+            except LLMOverloadedError:
+                # Retrying would only queue again; let the caller back off (HTTP 429)
+                raise
+            except Exception as e:
+                error = self._attempt_failed(prompt_type, e, attempt, max_attempts, retrying=attempt < max_attempts, target=target)
+                if attempt == max_attempts:
+                    raise error from e
+                await asyncio.sleep(delay)
+                delay *= 2
+                continue
+            self._attempt_succeeded(prompt_type, prompt, text, time.perf_counter() - started)
+            return self._cache_reply(cache_key if target == chain[0] else None, prompt_type, self._clean_json_response(text))
+
+    async def stream_content_async(self, prompt_type, context, model_name=None):
+        """
+        Async generator yielding raw text chunks as Gemini produces them.
+
+        A failed attempt is only retried if nothing has been yielded yet; once text has
+        reached the caller a retry would duplicate it, so an LLMError is raised instead.
+        The per-attempt deadline applies to the wait for each chunk.
+        """
+        chain = self._route_chain(prompt_type, context, model_name)
+        prompt = self._build_prompt(prompt_type, context)
+        if not prompt:
+            raise LLMError(f"No prompt found for type '{prompt_type}'", prompt_type)
+        cache_key, cached = self._cached_reply(prompt_type, context, prompt, chain[0].model)
+        if cached is not None:
+            # The whole reply at once; the caller's streamer handles it like any chunk
+            yield cached
+            return
+        print(f"\n--- 🤖 Live Gemini API Call ({prompt_type}, streaming) ---")
+
+        max_attempts = 3
+        delay = 1.0
+        timeout = self._attempt_timeout(prompt_type)
+        for attempt in range(1, max_attempts + 1):
+            self._check_breaker(prompt_type)
+            target = self._choose_target(prompt_type, context, model_name, attempt)
+            started = time.perf_counter()
+            yielded = False
+            received = []
+            stream = self.router.backend(target).stream_async(
+                prompt_type, context, prompt, target.model, self._generation_config(prompt_type), timeout,
+            )
+            try:
+                async with self._llm_slot(prompt_type, prompt):
+                    called_at = time.perf_counter()
+                    with METRICS.span("llm_call", prompt_type=prompt_type, streamed="true"):
+                        while True:
+                            try:
+                                text = await asyncio.wait_for(stream.__anext__(), timeout)
+                            except StopAsyncIteration:
+                                break
+                            yielded = True
+                            received.append(text)
+                            yield text
+            except LLMOverloadedError:
+                raise
+            except Exception as e:
+                retrying = not yielded and attempt < max_attempts
+                error = self._attempt_failed(prompt_type, e, attempt, max_attempts, retrying=retrying, target=target)
+                if not retrying:
+                    raise error from e
+                await asyncio.sleep(delay)
+                delay *= 2
+                continue
+            finally:
+                await stream.aclose()
+            text = "".join(received)
+            self.scheduler.charge(estimate_tokens(text))
+            self.router.observe(prompt_type, target, time.perf_counter() - called_at)
+            self._attempt_succeeded(prompt_type, prompt, text, time.perf_counter() - started)
+            self._record_exchange(prompt_type, context, prompt, text, time.perf_counter() - called_at)
+            self._cache_reply(cache_key if target == chain[0] else None, prompt_type, self._clean_json_response(text))
+            return
+
+    # ---------- routing ---------- #
+
+    def _route_chain(self, prompt_type, context, model_name):
+        """
+        The targets this call may go to, preferred first. An explicit model_name (the fast
+        dialogue tier) pins the call to that Gemini model. Raises LLMUnavailableError when
+        the chain only has Gemini and Gemini is not configured.
+        """
+        chain = [RouteTarget("gemini", model_name)] if model_name else self.router.chain(prompt_type, context.get("difficulty"))
+        if not self.model and all(target.backend == "gemini" for target in chain):
+            raise LLMUnavailableError("Gemini model is not configured.", prompt_type)
+        return chain
+
+    def _choose_target(self, prompt_type, context, model_name, attempt) -> RouteTarget:
+        if model_name:
+            return RouteTarget("gemini", model_name)
+        return self.router.choose(prompt_type, context.get("difficulty"), attempt, self.scheduler.queue_depth)
+
+    # ---------- response cache ---------- #
+
+    def _generation_config(self, prompt_type) -> dict:
+        temperature = self.temperatures.get(prompt_type)
+        return GENERATION_CONFIG if temperature is None else {**GENERATION_CONFIG, "temperature": temperature}
+
+    def _cached_reply(self, prompt_type, context, prompt, model_name):
+        """
+        (cache key, cached reply): the key is None when this request may not be cached. Keys
+        use the route's preferred model; a reply from a fallback target is not stored.
+        """
+        generation_config = self._generation_config(prompt_type)
+        if not self.response_cache.cacheable(prompt_type, generation_config, context):
+            return None, None
+        key = self.response_cache.key(model_name, prompt_type, prompt, generation_config)
+        return key, self.response_cache.get(key, prompt_type)
+
+    def _cache_reply(self, cache_key, prompt_type, text):
+        """Stores a cleaned reply under cache_key and returns it. Replies that fail to parse are not kept."""
+        if cache_key is not None:
+            try:
+                parse_llm_json(prompt_type, text)
+            except ValueError:
+                return text
+            self.response_cache.put(cache_key, prompt_type, text)
+        return text
+
+    # ---------- deadlines, hedging and the circuit breaker ---------- #
+
+    def _attempt_timeout(self, prompt_type) -> float:
+        return self.attempt_timeouts.get(prompt_type, self.attempt_timeouts.get("default", 30.0))
+
+    def _check_breaker(self, prompt_type):
+        if not self.breaker.allow():
+            METRICS.inc("echoes_llm_calls_total", prompt_type=prompt_type, outcome="rejected")
+            raise LLMUnavailableError(
+                f"LLM circuit breaker is open; {prompt_type} call refused.", prompt_type, retry_after=self.breaker.retry_after(),
+            )
+
+    def _llm_slot(self, prompt_type, prompt):
+        """A scheduler slot for this call, prioritised by whoever the work is for (see llm_work())."""
+        priority = LLM_PRIORITY.get() or ("interactive" if prompt_type == "Interaction" else "world")
+        return self.scheduler.slot(priority, LLM_GAME_ID.get(), estimate_tokens(prompt))
+
+    async def _timed_call_async(self, prompt_type, context, prompt, target) -> str:
+        # Only hold a slot for the call itself, not for the backoff sleep.
+        timeout = self._attempt_timeout(prompt_type)
+        backend = self.router.backend(target)
+        async with self._llm_slot(prompt_type, prompt):
+            called_at = time.perf_counter()
+            try:
+                with METRICS.span("llm_call", prompt_type=prompt_type):
+                    text = await asyncio.wait_for(
+                        backend.generate_async(prompt_type, context, prompt, target.model, self._generation_config(prompt_type), timeout),
+                        timeout,
+                    )
+            except asyncio.TimeoutError:
+                # A call that hit its deadline was at least that slow
+                self.router.observe(prompt_type, target, time.perf_counter() - called_at)
+                raise
+        self.router.observe(prompt_type, target, time.perf_counter() - called_at)
+        self.scheduler.charge(estimate_tokens(text))
+        self._record_exchange(prompt_type, context, prompt, text, time.perf_counter() - called_at)
+        return text
+
+    def _hedge_delay(self, prompt_type):
+        """How long to wait before a hedged second request, or None for no hedge."""
+        if prompt_type not in self.hedge_prompt_types or self.breaker.state != "closed":
+            return None
+        p95 = self.latencies.percentile(prompt_type, self.hedge_percentile)
+        return None if p95 is None else max(p95, self.hedge_min_delay)
+
+    async def _hedged_call_async(self, prompt_type, context, prompt, target) -> str:
+        """
+        One attempt. If it is still running after the recent p95 latency, a second identical
+        request is sent and whichever succeeds first wins; the other is cancelled.
+        """
+        primary = asyncio.ensure_future(self._timed_call_async(prompt_type, context, prompt, target))
+        hedge_delay = self._hedge_delay(prompt_type)
+        if hedge_delay is None:
+            return await primary
+
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+            if done:
+                return primary.result()
+            METRICS.inc("echoes_llm_hedges_total", prompt_type=prompt_type, outcome="launched")
+            hedge = asyncio.ensure_future(self._timed_call_async(prompt_type, context, prompt, target))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            METRICS.inc("echoes_llm_hedges_total", prompt_type=prompt_type, outcome="won")
+                        return task.result()
+            # Both failed; report the original request's error
+            return primary.result()
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def _attempt_succeeded(self, prompt_type, prompt, text, seconds):
+        self.breaker.record_success()
+        self.latencies.observe(prompt_type, seconds)
+        self._record_call(prompt_type, prompt, text)
+
+    def _attempt_failed(self, prompt_type, error, attempt, max_attempts, retrying, target=None) -> LLMError:
+        """Records a failed attempt and returns the typed error to raise if it was the last one."""
+        if isinstance(error, LLMError):
+            return error
+        timed_out = (isinstance(error, (asyncio.TimeoutError, TimeoutError))
+                     or type(error).__name__ in ("DeadlineExceeded", "ReadTimeout", "ConnectTimeout"))
+        reason = f"timed out after {self._attempt_timeout(prompt_type):.0f}s" if timed_out else str(error)
+        print(f"❌ LLM error (attempt {attempt}/{max_attempts}, {prompt_type}, {target or 'gemini'}): {reason}")
+        self.breaker.record_failure()
+        self._record_failure(prompt_type, retrying=retrying)
+        error_class = LLMTimeoutError if timed_out else LLMError
+        return error_class(f"{prompt_type} call failed after {attempt} attempt(s): {reason}", prompt_type)
+
+    # ---------- instrumentation ---------- #
+
+    def _record_call(self, prompt_type, prompt, text):
+        METRICS.inc("echoes_llm_calls_total", prompt_type=prompt_type, outcome="ok")
+        METRICS.inc("echoes_llm_prompt_chars_total", len(prompt), prompt_type=prompt_type)
+        METRICS.inc("echoes_llm_response_chars_total", len(text), prompt_type=prompt_type)
+
+    def _record_exchange(self, prompt_type, context, prompt, text, seconds):
+        """Hands a successful call to the session recorder, if one is attached. seconds excludes queueing."""
+        if self.recorder is not None:
+            self.recorder.record_llm(prompt_type, context, prompt, text, seconds, game_id=LLM_GAME_ID.get())
+
+    def _record_failure(self, prompt_type, retrying):
+        if retrying:
+            METRICS.inc("echoes_llm_retries_total", prompt_type=prompt_type)
+        else:
+            METRICS.inc("echoes_llm_calls_total", prompt_type=prompt_type, outcome="error")
+
+    def _record_tokens(self, prompt_type, prompt, text, usage=None):
+        """Token counts as reported by the provider, estimated from characters when it reports none."""
+        prompt_tokens = getattr(usage, "prompt_token_count", None) or estimate_tokens(prompt)
+        response_tokens = getattr(usage, "candidates_token_count", None) or estimate_tokens(text)
+        cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+        METRICS.inc("echoes_llm_prompt_tokens_total", prompt_tokens, prompt_type=prompt_type)
+        METRICS.inc("echoes_llm_response_tokens_total", response_tokens, prompt_type=prompt_type)
+        if cached_tokens:
+            METRICS.inc("echoes_llm_cached_tokens_total", cached_tokens, prompt_type=prompt_type)
+
+    # ---------- provider-side context caching ---------- #
+    # The Interaction prefix (rules + villager profile) is uploaded once per villager as a
+    # Gemini CachedContent; each turn then only sends the per-turn suffix. A failed upload
+    # is retried for that villager after a backoff (CONTEXT_CACHE_RETRY_SECONDS, doubling up
+    # to CONTEXT_CACHE_MAX_RETRY_SECONDS); only a model that rejects caching outright turns
+    # it off for the process.
+
+    CONTEXT_CACHE_RETRY_SECONDS = 30.0
+    CONTEXT_CACHE_MAX_RETRY_SECONDS = 1800.0
+
+    def _cacheable_prefix(self, prompt_type, context, prompt, model_name):
+        """Returns (villager_name, prefix) if this call can use a cached prefix, else None."""
+        if not self.context_cache or prompt_type != "Interaction" or model_name not in (None, DEFAULT_MODEL_NAME):
+            return None
+        prefix = self._interaction_prefix(context)
+        if not prompt.startswith(prefix):
+            return None
+        return (context.get('villagerProfile') or {}).get('name', ''), prefix
+
+    def _fresh_cached_model(self, villager_name):
+        entry = self._cached_models.get(villager_name)
+        # Leave a minute of slack so a turn never lands on an expiring cache
+        if entry and entry[1] > time.time() + 60:
+            return entry[0]
+        return None
+
+    def _cache_backing_off(self, villager_name):
+        backoff = self._cache_backoff.get(villager_name)
+        return backoff is not None and time.monotonic() < backoff[0]
+
+    @staticmethod
+    def _caching_unsupported(error):
+        """True for errors saying the model cannot cache at all, as opposed to transient or per-prefix ones."""
+        message = str(error).lower()
+        return type(error).__name__ in ("InvalidArgument", "FailedPrecondition", "NotFound") and "support" in message
+
+    def _create_cached_model(self, villager_name, prefix):
+        if self._cache_backing_off(villager_name):
+            return None
+        try:
+            cached = caching.CachedContent.create(
+                model=f"models/{DEFAULT_MODEL_NAME}",
+                display_name=f"echoes-interaction-{villager_name}"[:128],
+                system_instruction=prefix,
+                ttl=timedelta(seconds=self.context_cache_ttl),
+            )
+            model = genai.GenerativeModel.from_cached_content(cached)
+        except Exception as e:
+            if self._caching_unsupported(e):
+                print(f"--- Context caching unsupported, sending full prompts instead: {e} ---")
+                self.context_cache = False
+                return None
+            # Quota, 5xx, or a prefix under the model's minimum cacheable size: try this villager again later
+            failures = self._cache_backoff.get(villager_name, (0.0, 0))[1] + 1
+            retry_in = min(self.CONTEXT_CACHE_MAX_RETRY_SECONDS, self.CONTEXT_CACHE_RETRY_SECONDS * 2 ** (failures - 1))
+            self._cache_backoff[villager_name] = (time.monotonic() + retry_in, failures)
+            print(f"--- Context caching failed for {villager_name}, full prompts for {retry_in:.0f}s: {e} ---")
+            return None
+        self._cache_backoff.pop(villager_name, None)
+        self._cached_models[villager_name] = (model, time.time() + self.context_cache_ttl)
+        print(f"--- Cached Interaction prefix for {villager_name} ---")
+        return model
+
+    def _resolve_model(self, prompt_type, context, prompt, model_name):
+        """Returns (model, contents): a cached-prefix model with only the suffix, or the plain model and full prompt."""
+        cacheable = self._cacheable_prefix(prompt_type, context, prompt, model_name)
+        if cacheable:
+            villager_name, prefix = cacheable
+            model = self._fresh_cached_model(villager_name) or self._create_cached_model(villager_name, prefix)
+            if model is not None:
+                return model, prompt[len(prefix):]
+        return self._get_model(model_name), prompt
+
+    async def _resolve_model_async(self, prompt_type, context, prompt, model_name):
+        cacheable = self._cacheable_prefix(prompt_type, context, prompt, model_name)
+        if cacheable:
+            villager_name, prefix = cacheable
+            model = self._fresh_cached_model(villager_name)
+            if model is None:
+                # One upload per villager even when several games talk to them at once
+                async with self._cache_locks.setdefault(villager_name, asyncio.Lock()):
+                    model = self._fresh_cached_model(villager_name)
+                    if model is None and self.context_cache and not self._cache_backing_off(villager_name):
+                        model = await asyncio.to_thread(self._create_cached_model, villager_name, prefix)
+            if model is not None:
+                return model, prompt[len(prefix):]
+        return self._get_model(model_name), prompt
+
+    # ---------- model calls ---------- #
+    # The only methods that talk to Gemini, reached through GeminiBackend. Test doubles (see
+    # FakeLLM) override these and keep the prompt building, routing, retries and concurrency cap above.
+
+    def _call_model(self, prompt_type, context, prompt, model_name=None) -> str:
+        model, contents = self._resolve_model(prompt_type, context, prompt, model_name)
+        response = model.generate_content(
+            contents, generation_config=self._generation_config(prompt_type), request_options={"timeout": self._attempt_timeout(prompt_type)},
+        )
+        text = response.text if hasattr(response, "text") else str(response)
+        self._record_tokens(prompt_type, prompt, text, getattr(response, "usage_metadata", None))
+        return text
+
+    async def _call_model_async(self, prompt_type, context, prompt, model_name=None) -> str:
+        model, contents = await self._resolve_model_async(prompt_type, context, prompt, model_name)
+        response = await model.generate_content_async(contents, generation_config=self._generation_config(prompt_type))
+        text = response.text if hasattr(response, "text") else str(response)
+        self._record_tokens(prompt_type, prompt, text, getattr(response, "usage_metadata", None))
+        return text
+
+    async def _stream_model_async(self, prompt_type, context, prompt, model_name=None):
+        model, contents = await self._resolve_model_async(prompt_type, context, prompt, model_name)
+        response = await model.generate_content_async(contents, generation_config=self._generation_config(prompt_type), stream=True)
+        received = []
+        usage = None
+        async for chunk in response:
+            text = chunk.text if hasattr(chunk, "text") else str(chunk)
+            # The final chunk carries the usage totals for the whole stream
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            if text:
+                received.append(text)
+                yield text
+        self._record_tokens(prompt_type, prompt, "".join(received), usage)
 
     def _create_story_generator_prompt(self, context):
         return f"""
@@ -87,30 +631,12 @@ class GeminiAPI:
 
     def _create_world_builder_prompt(self, context):
         difficulty = context.get('difficulty', 'Medium')
-        if difficulty == 'Very Easy':
-            node_count = "8"
-            key_clue_count = 2
-            final_clue_instruction = "The final clue must be extremely direct and explicitly state where to go."
-            difficulty_instructions = "Clues must be direct and obvious. Avoid riddles or metaphors."
-            type_instruction = "Generate **exactly 2 nodes** of type 'TalkToVillager' to guide the player. The rest should be 'Information'."
-        elif difficulty == 'Easy':
-            node_count = "15-20"
-            key_clue_count = 3
-            final_clue_instruction = "The final clue should be a strong hint, making the answer clear."
-            difficulty_instructions = "Clues should be mostly straightforward."
-            type_instruction = "You may use a mix of 'Information' and 'TalkToVillager' nodes."
-        elif difficulty == 'Hard':
-            node_count = "35-40"
-            key_clue_count = 6
-            final_clue_instruction = "The final clue must be extremely cryptic, requiring significant deduction."
-            difficulty_instructions = "Clues must be cryptic and often misleading. Use riddles and metaphors."
-            type_instruction = "Create a complex web using many 'TalkToVillager' nodes to interconnect clues."
-        else: # Medium
-            node_count = "25-30"
-            key_clue_count = 4
-            final_clue_instruction = "The final clue must be cryptic. Do not state the answer directly."
-            difficulty_instructions = "Clues should require some thought and interpretation."
-            type_instruction = "Create a web-like structure with a good mix of 'Information' and 'TalkToVillager' nodes."
+        settings = DIFFICULTY_SETTINGS.get(difficulty, DIFFICULTY_SETTINGS['Medium'])
+        node_count = settings['node_count']
+        key_clue_count = settings['key_clue_count']
+        final_clue_instruction = settings['final_clue_instruction']
+        difficulty_instructions = settings['difficulty_instructions']
+        type_instruction = settings['type_instruction']
 
         return f"""
         You are a world-class narrative designer generating a "Quest Network" for the game "Village of Echoes".
@@ -143,40 +669,99 @@ class GeminiAPI:
         -   **{final_clue_instruction}**
 
         **Game Data for Context:**
-        -   Villagers: {json.dumps(context['villagers'], indent=2)}
+        -   Villagers: {fast_json.dumps(context['villagers'], indent=True)}
 
         Output ONLY the raw JSON object containing the "nodes" list.
         """
 
-     # ================= INTERACTION ================= #
-    def _create_interaction_prompt(self, context):
-        conversational_status = context.get('conversational_status')
-        context_node = context.get('context_node')
-        turn_objective = ""
-        
-        json_task_instruction = "Generate a JSON object with: npc_dialogue (string), player_responses (list of 1–3 options), node_revealed_id (string or null), new_familiarity_level (0–5)."
-
-        if conversational_status == "PERMANENTLY_EXHAUSTED":
-            turn_objective = "You can no longer provide new clues. Deliver a final, reflective farewell."
-            json_task_instruction = "Generate a JSON object with: npc_dialogue (string), player_responses (EXACTLY ONE polite closing option), node_revealed_id (null), new_familiarity_level (0–5)."
-        elif conversational_status == "HAS_LOCKED_CLUES":
-            turn_objective = "You cannot yet reveal a clue. Hint gently why (trust, timing, secrecy) and end politely."
-            json_task_instruction = "Generate a JSON object with: npc_dialogue (string), player_responses (EXACTLY ONE polite closing option), node_revealed_id (null), new_familiarity_level (0–5)."
-        elif conversational_status == "CAN_REVEAL":
-            turn_objective = "MANDATORY: Reveal the current clue NOW. Integrate the content naturally into your dialogue, and set node_revealed_id. This is not optional."
+    # ================= PROGRESSIVE WORLD BUILDING ================= #
+    # WorldSkeleton lays out the whole network without clue text; VillagerNodes then writes
+    # the clue text for one villager's nodes. See game_logic/world_builder.py.
+
+    def _create_world_skeleton_prompt(self, context):
+        difficulty = context.get('difficulty', 'Medium')
+        settings = DIFFICULTY_SETTINGS.get(difficulty, DIFFICULTY_SETTINGS['Medium'])
+        villagers = "\n".join(f"        -   {v['name']} ({v['title']})" for v in context['villagers'])
+
+        return f"""
+        You are a world-class narrative designer planning the skeleton of a "Quest Network" for the game "Village of Echoes".
+
+        The correct location is: **{context['correctLocation']}**.
+        The difficulty is: **{difficulty.upper()}**.
+        The core secret of the village is: **{context['story_theme']}**
+
+        Plan the structure only. The full clue text is written later, villager by villager, from your `beat`.
+
+        **Node Structure:**
+        -   `node_id`: A simple, unique, sequential string, like "node1", "node2", "node3", etc.
+        -   `villager_name`: Who provides this node. Must be one of the villagers listed below.
+        -   `beat`: One short sentence (max 15 words) saying what this clue reveals.
+        -   `type`: "Information" or "TalkToVillager".
+        -   `priority`: Importance order (1=Minor, 5=Major).
+        -   `key_clue`: A boolean (true/false).
+        -   `preconditions`: List of earlier `node_id` strings required.
+        -   `required_familiarity`: An integer from 1-5, or `null`.
+
+        **Generation Requirements ({difficulty.upper()}):**
+        -   Generate a network of **{settings['node_count']} nodes**, spread across the villagers.
+        -   Designate **exactly {settings['key_clue_count']} nodes** as `key_clue: true`, chained so each key clue builds on the previous one.
+        -   {settings['type_instruction']}
+        -   Preconditions may only point to nodes with a smaller number, so the network has no cycles.
+
+        **Villagers:**
+{villagers}
+
+        Output ONLY the raw JSON object containing the "nodes" list.
+        """
+
+    def _create_villager_nodes_prompt(self, context):
+        difficulty = context.get('difficulty', 'Medium')
+        settings = DIFFICULTY_SETTINGS.get(difficulty, DIFFICULTY_SETTINGS['Medium'])
 
         return f"""
+        You are a world-class narrative designer writing clues for the game "Village of Echoes".
+
+        The correct location is: **{context['correctLocation']}**.
+        The difficulty is: **{difficulty.upper()}**.
+        The core secret of the village is: **{context['story_theme']}**
+
+        Write the `content` of every clue below. They are all told by this villager:
+        {fast_json.dumps(context['villager'])}
+
+        **Guiding Principles:**
+        - If `type` is `Information`, the `content` is a direct clue the player learns with complete brief of clue history, direction and reason.
+        - If `type` is `TalkToVillager`, the `content` **MUST** explicitly name the villager to talk to, give a clear reason and say where they can be found. Other villagers: {', '.join(context['other_villagers'])}.
+        - Clues must come from this villager's personality and their role in the secret.
+        - Stay faithful to each clue's `beat`. Clues the player has already learned are listed for continuity.
+        - **Difficulty:** {settings['difficulty_instructions']}
+        - If one of these is the last key clue: {settings['final_clue_instruction']}
+
+        **Clues to write:**
+        {fast_json.dumps(context['nodes'])}
+
+        **Earlier clues they build on:**
+        {fast_json.dumps(context['preceding'])}
+
+        Output ONLY a raw JSON object: {{"nodes": [{{"node_id": "...", "content": "..."}}]}}
+        """
+
+     # ================= INTERACTION ================= #
+    # The Interaction prompt is laid out stable-first so the provider can cache everything
+    # before the per-turn part: a static prefix shared by every call, a per-villager prefix
+    # (the profile), then the per-turn suffix. Both prefixes are built once and reused.
+
+    INTERACTION_STATIC_PREFIX = """
         You are both a **villager actor** and a **game director** in the horror game "Village of Echoes".  
         Your goal: deliver immersive dialogue that feels authentic *while progressing the game*.  
 
         --- DIRECTOR'S RULES (Unbreakable) ---
-        1. Roleplay naturally as {context['villagerProfile']['name']}.  
+        1. Roleplay naturally as the villager described under VILLAGER PROFILE.  
         2. Stay immersive: Do NOT break character or mention the "game system."  
         3. Never mention the player's "friends" unless the player explicitly brings them up.  
         4. Keep responses smooth and natural: ~2 sentences, with tone matching the villager.  
-        5. Adjust tone based on familiarity level: {context['familiarity_level']} ({context['familiarity_description']}).  
+        5. Adjust tone based on the familiarity level given under THIS TURN.  
            - If "Unknown", introduce yourself naturally.  
-        6. Do not repeat information the player already knows: `{context['player_knowledge_summary']}`.  
+        6. Do not repeat information the player already knows (see PLAYER KNOWLEDGE).  
         7. If a clue is revealed, weave it in *naturally with flavor*, not as a raw fact dump.
 
         **NOTE: Whenver mentioned this is the staring prompt of the conversation, then just introduce yourself if familarity:Unknown or talk about the recent thing that you discoverd with that villager from the knowledges-summary**
@@ -212,7 +797,7 @@ class GeminiAPI:
 
         6) HOSTILITY / BRIBES / EMOTIONAL STATES
            - Hostile player: de-escalate, offer a guarded hint or refuse to help. Offer responses that let the player back down or press.
-           - Bribe/plea: consult `villagerProfile` morality/traits and act accordingly (accept with consequences, or refuse and give a hint).
+           - Bribe/plea: consult the VILLAGER PROFILE morality/traits and act accordingly (accept with consequences, or refuse and give a hint).
            - Frightened player: reassure and give a safe next step (e.g., "Find the doctor; he'll come with you.").
 
         7) REPETITION & CLARIFICATION
@@ -227,15 +812,52 @@ class GeminiAPI:
            - Always include 1–3 realistic `player_responses` (e.g., "Ask Old Mara by the river.", "Search the Ossified Grove.", "Goodbye.").
            - Ensure any suggested action is actionable within the game (name a villager or a specific place/thing).
            - If you suggest a search, indicate *what to look for* (e.g., "check under the millstones for footprints").
-    
+        """
+
+    INTERACTION_OBJECTIVES = {
+        "PERMANENTLY_EXHAUSTED": "You can no longer provide new clues. Deliver a final, reflective farewell.",
+        "HAS_LOCKED_CLUES": "You cannot yet reveal a clue. Hint gently why (trust, timing, secrecy) and end politely.",
+        "CAN_REVEAL": "MANDATORY: Reveal the current clue NOW. Integrate the content naturally into your dialogue, and set node_revealed_id. This is not optional.",
+    }
+    INTERACTION_OPEN_INSTRUCTION = "Generate a JSON object with: npc_dialogue (string), player_responses (list of 1–3 options), node_revealed_id (string or null), new_familiarity_level (0–5)."
+    INTERACTION_CLOSING_INSTRUCTION = "Generate a JSON object with: npc_dialogue (string), player_responses (EXACTLY ONE polite closing option), node_revealed_id (null), new_familiarity_level (0–5)."
+
+    def _interaction_prefix(self, context):
+        """Static prefix + villager profile. Built once per villager; the roster never changes mid-game."""
+        profile = context.get('villagerProfile') or {}
+        name = profile.get('name', '')
+        prefix = self._villager_prefixes.get(name)
+        if prefix is None:
+            prefix = self.INTERACTION_STATIC_PREFIX + f"""
+        --- VILLAGER PROFILE ---
+        {fast_json.dumps(profile, indent=True)}
+        """
+            self._villager_prefixes[name] = prefix
+        return prefix
+
+    def _create_interaction_prompt(self, context):
+        conversational_status = context.get('conversational_status')
+        turn_objective = self.INTERACTION_OBJECTIVES.get(conversational_status, "")
+        if conversational_status in ("PERMANENTLY_EXHAUSTED", "HAS_LOCKED_CLUES"):
+            json_task_instruction = self.INTERACTION_CLOSING_INSTRUCTION
+        else:
+            json_task_instruction = self.INTERACTION_OPEN_INSTRUCTION
+
+        return self._interaction_prefix(context) + f"""
+        --- PLAYER KNOWLEDGE ---
+        {context['player_knowledge_summary']}
 
         --- BACKGROUND KNOWLEDGE ---
-        Current clue node (if any): {json.dumps(context_node)}
+        Current clue node (if any): {fast_json.dumps(context.get('context_node'))}
 
-        --- CONVERSATION HISTORY ---
-        {json.dumps(context['chatHistory'], indent=2)}
+        --- EARLIER CONVERSATION (summary) ---
+        {context.get('conversation_summary') or "(none)"}
+
+        --- CONVERSATION HISTORY (most recent) ---
+        {fast_json.dumps(context['chatHistory'], indent=True)}
 
         --- THIS TURN ---
+        - Familiarity level: {context['familiarity_level']} ({context['familiarity_description']})
         - Objective: {turn_objective}  
         - The player’s last line: "{context['player_last_response']}"
 
@@ -244,4 +866,3 @@ class GeminiAPI:
 
         Respond ONLY with the raw JSON object.
         """
-
@@ -0,0 +1,117 @@
+# game_logic/llm_resilience.py
+# Typed LLM errors, a circuit breaker and a latency tracker that keep LLM tail latency bounded.
+
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+class LLMError(Exception):
+    """An LLM call that produced no usable reply. Replaces the old silent "{}" result."""
+
+    def __init__(self, message: str, prompt_type: str = "", retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.prompt_type = prompt_type
+        self.retry_after = retry_after
+
+class LLMTimeoutError(LLMError):
+    """Every attempt ran past its per-attempt deadline."""
+
+class LLMUnavailableError(LLMError):
+    """The circuit breaker is open (or no model is configured): the call was not attempted."""
+
+class CircuitBreaker:
+    """
+    Fails LLM calls fast while the provider is having a bad time.
+
+    Outcomes of the last `window` attempts are kept. Once at least `min_calls` are recorded
+    and the failure rate reaches `error_rate`, the breaker opens for `cooldown_seconds`:
+    calls are refused without touching the provider. After the cooldown a single probe call
+    is let through (half-open); it closes the breaker on success and re-opens it on failure.
+    """
+
+    def __init__(self, window: int = 20, error_rate: float = 0.5, min_calls: int = 10, cooldown_seconds: float = 30.0):
+        self.window = max(1, window)
+        self.error_rate = error_rate
+        self.min_calls = max(1, min_calls)
+        self.cooldown_seconds = cooldown_seconds
+        self._outcomes: Deque[bool] = deque(maxlen=self.window)
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self.opened_count = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown_seconds:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            # A probe that never reported back (e.g. its request was cancelled) is replaced after a cooldown
+            probe_lost = time.monotonic() - self._probe_started >= self.cooldown_seconds
+            if self.state == "half_open" and (not self._probe_in_flight or probe_lost):
+                self._probe_in_flight = True
+                self._probe_started = time.monotonic()
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self.state == "closed":
+                return 0.0
+            return max(1.0, self.cooldown_seconds - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            if self.state == "half_open":
+                print("--- LLM circuit breaker closed: provider is answering again ---")
+                self.state = "closed"
+                self._outcomes.clear()
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == "half_open":
+                self._open()
+                return
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if self.state == "closed" and len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_rate:
+                self._open()
+
+    def _open(self):
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self.opened_count += 1
+        print(f"--- LLM circuit breaker OPEN for {self.cooldown_seconds:.0f}s: failing calls fast ---")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": self._outcomes.count(False),
+                "opened": self.opened_count,
+            }
+
+class LatencyTracker:
+    """Recent successful call latencies per prompt type, for the hedging delay."""
+
+    def __init__(self, samples: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self._size = samples
+
+    def observe(self, prompt_type: str, seconds: float):
+        self._samples.setdefault(prompt_type, deque(maxlen=self._size)).append(seconds)
+
+    def percentile(self, prompt_type: str, pct: float) -> Optional[float]:
+        samples = self._samples.get(prompt_type)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
@@ -0,0 +1,233 @@
+# game_logic/llm_scheduler.py
+# Admission control for async LLM calls: priority classes, per-game fairness, a tokens-per-minute
+# budget and a bounded queue.
+
+import asyncio
+import contextvars
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, Dict, Optional
+
+from .metrics import METRICS
+from .llm_resilience import LLMError
+
+# Highest priority first. Interactive turns are what a player is staring at; world builds
+# are a player waiting on /game/new; background work (pool refills, speculation) can wait.
+PRIORITIES = ("interactive", "world", "background")
+
+# Who the current LLM work is for. Set by the API layer (and background workers) with
+# llm_work(); GeminiAPI reads them when it asks the scheduler for a slot.
+LLM_PRIORITY: contextvars.ContextVar = contextvars.ContextVar("llm_priority", default=None)
+LLM_GAME_ID: contextvars.ContextVar = contextvars.ContextVar("llm_game_id", default=None)
+
+@contextmanager
+def llm_work(priority: Optional[str] = None, game_id: Optional[str] = None):
+    """Tags LLM calls made inside the block (and tasks created from it) with a priority and game."""
+    tokens = []
+    if priority is not None:
+        tokens.append((LLM_PRIORITY, LLM_PRIORITY.set(priority)))
+    if game_id is not None:
+        tokens.append((LLM_GAME_ID, LLM_GAME_ID.set(game_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+class LLMOverloadedError(LLMError):
+    """The LLM queue is full; the caller should come back after retry_after seconds (HTTP 429)."""
+
+class _Waiter:
+    __slots__ = ("future", "tokens", "priority", "enqueued", "granted")
+
+    def __init__(self, future: asyncio.Future, tokens: int, priority: str):
+        self.future = future
+        self.tokens = tokens
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+class LLMScheduler:
+    """
+    Decides which queued LLM call runs next.
+
+    - At most `max_concurrency` calls are in flight.
+    - Waiting calls are served strictly by priority class; within a class, games take
+      turns (round-robin), so one game's burst cannot starve the others.
+    - With `tokens_per_minute` set, a token bucket of that size refills continuously;
+      a call is admitted only when its estimated prompt tokens are available, and response
+      tokens are charged once known.
+    - At most `max_queue` calls wait. When full, a new call evicts the newest waiter of a
+      lower class if there is one, otherwise it is refused with LLMOverloadedError.
+    """
+
+    def __init__(self, max_concurrency: int, tokens_per_minute: int = 0, max_queue: int = 200):
+        self.max_concurrency = max(1, max_concurrency)
+        self.tokens_per_minute = max(0, tokens_per_minute)
+        self.max_queue = max(0, max_queue)
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._queued = 0
+        self._in_flight = 0
+        self._tokens = float(self.tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._timer = None
+        self._avg_call_seconds = 1.0
+        self.rejected: Dict[str, int] = {p: 0 for p in PRIORITIES}
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str], game_id: Optional[str], tokens: int):
+        await self.acquire(priority, game_id, tokens)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - started)
+
+    async def acquire(self, priority: Optional[str], game_id: Optional[str], tokens: int):
+        priority = priority if priority in self._queues else "world"
+        self._refill()
+        if not self._queued and self._in_flight < self.max_concurrency and self._has_tokens(tokens):
+            self._grant(tokens)
+            METRICS.observe("echoes_llm_queue_wait_seconds", 0.0, priority=priority)
+            return
+
+        if self._queued >= self.max_queue and not self._evict_below(priority):
+            self._reject(priority)
+            raise LLMOverloadedError(
+                f"LLM queue is full ({self._queued} waiting).", retry_after=self.retry_after(),
+            )
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), tokens, priority)
+        self._queues[priority].setdefault(game_id or "", deque()).append(waiter)
+        self._queued += 1
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.granted:
+                self._release(0.0)
+            else:
+                self._remove(waiter, game_id or "")
+            raise
+        METRICS.observe("echoes_llm_queue_wait_seconds", time.monotonic() - waiter.enqueued, priority=priority)
+
+    def charge(self, tokens: int):
+        """Charges tokens only known after the call (the response) against the budget."""
+        if self.tokens_per_minute:
+            self._refill()
+            self._tokens -= tokens
+
+    @property
+    def queue_depth(self) -> int:
+        """Calls waiting for a slot, across priorities."""
+        return self._queued
+
+    def retry_after(self) -> float:
+        return max(1.0, math.ceil(self._queued * self._avg_call_seconds / self.max_concurrency))
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queued": {p: sum(len(q) for q in self._queues[p].values()) for p in PRIORITIES},
+            "max_queue": self.max_queue,
+            "tokens_available": round(self._tokens) if self.tokens_per_minute else None,
+            "tokens_per_minute": self.tokens_per_minute or None,
+            "rejected": dict(self.rejected),
+        }
+
+    # ---------- internals ---------- #
+
+    def _refill(self):
+        if not self.tokens_per_minute:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.tokens_per_minute, self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60.0)
+        self._refilled_at = now
+
+    def _has_tokens(self, tokens: int) -> bool:
+        # A call bigger than the whole bucket still goes through once the bucket is full
+        return not self.tokens_per_minute or self._tokens >= min(tokens, self.tokens_per_minute)
+
+    def _grant(self, tokens: int):
+        self._in_flight += 1
+        if self.tokens_per_minute:
+            self._tokens -= tokens
+
+    def _release(self, seconds: float):
+        self._in_flight -= 1
+        if seconds:
+            self._avg_call_seconds = 0.9 * self._avg_call_seconds + 0.1 * seconds
+        self._dispatch()
+
+    def _head(self):
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            if queue:
+                game_id, waiters = next(iter(queue.items()))
+                return queue, game_id, waiters
+        return None
+
+    def _dispatch(self):
+        self._refill()
+        while self._in_flight < self.max_concurrency and self._queued:
+            queue, game_id, waiters = self._head()
+            waiter = waiters[0]
+            if not self._has_tokens(waiter.tokens):
+                self._wake_after_refill(waiter.tokens)
+                return
+            waiters.popleft()
+            # Round-robin: this game goes to the back of its class
+            if waiters:
+                queue.move_to_end(game_id)
+            else:
+                del queue[game_id]
+            self._queued -= 1
+            if waiter.future.done():
+                continue
+            self._grant(waiter.tokens)
+            waiter.granted = True
+            waiter.future.set_result(None)
+
+    def _wake_after_refill(self, tokens: int):
+        if self._timer is not None:
+            return
+        missing = min(tokens, self.tokens_per_minute) - self._tokens
+        delay = max(0.01, missing * 60.0 / self.tokens_per_minute)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._on_refill_timer)
+
+    def _on_refill_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def _remove(self, waiter: _Waiter, game_id: str):
+        waiters = self._queues[waiter.priority].get(game_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self._queued -= 1
+            if not waiters:
+                del self._queues[waiter.priority][game_id]
+
+    def _evict_below(self, priority: str) -> bool:
+        """Makes room for a `priority` call by refusing the newest waiter of a lower class."""
+        for lower in reversed(PRIORITIES[PRIORITIES.index(priority) + 1:]):
+            queue = self._queues[lower]
+            if not queue:
+                continue
+            game_id = max(queue, key=lambda g: queue[g][-1].enqueued)
+            waiter = queue[game_id].pop()
+            if not queue[game_id]:
+                del queue[game_id]
+            self._queued -= 1
+            self._reject(lower)
+            waiter.future.set_exception(LLMOverloadedError(
+                "Dropped from the LLM queue for higher-priority work.", retry_after=self.retry_after(),
+            ))
+            return True
+        return False
+
+    def _reject(self, priority: str):
+        self.rejected[priority] += 1
+        METRICS.inc("echoes_llm_rejected_total", priority=priority)
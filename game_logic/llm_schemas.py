@@ -0,0 +1,51 @@
+# game_logic/llm_schemas.py
+# The JSON shapes the model is asked for, validated straight from the reply text.
+
+from typing import List, Optional
+
+from pydantic import ConfigDict, TypeAdapter, with_config
+from typing_extensions import NotRequired, TypedDict
+
+from . import fast_json
+from .llm_resilience import LLMError
+from .metrics import METRICS
+
+# TypedDicts rather than BaseModels: validate_json() parses and checks the reply in one pass
+# and hands back a plain dict, which is what the engine and the game state already use.
+# Keys the model adds beyond these are dropped.
+
+@with_config(ConfigDict(coerce_numbers_to_str=True))
+class InteractionReply(TypedDict):
+    npc_dialogue: str
+    player_responses: NotRequired[List[str]]
+    new_familiarity_level: NotRequired[Optional[int]]
+    node_revealed_id: NotRequired[Optional[str]]
+
+class StoryIdea(TypedDict):
+    story_theme: str
+    correct_location: str
+    inaccessible_locations: NotRequired[List[str]]
+
+REPLY_ADAPTERS = {
+    "Interaction": TypeAdapter(InteractionReply),
+    "StoryGenerator": TypeAdapter(StoryIdea),
+}
+
+def parse_llm_json(prompt_type: str, text: str):
+    """
+    Parses a (cleaned) model reply. Prompt types with a schema are validated in the same
+    pass; the others are parsed with the fast JSON backend. Raises ValueError when the
+    reply is not JSON or does not match its schema.
+    """
+    adapter = REPLY_ADAPTERS.get(prompt_type)
+    with METRICS.span("json_parse", prompt_type=prompt_type):
+        if adapter is None:
+            return fast_json.loads(text)
+        return adapter.validate_json(text)
+
+def parse_dialogue(text: str) -> dict:
+    """An Interaction reply; a malformed one counts as a failed call, so the fallback tier can answer."""
+    try:
+        return parse_llm_json("Interaction", text)
+    except ValueError as e:
+        raise LLMError(f"Malformed Interaction reply: {e}", "Interaction") from e
@@ -0,0 +1,91 @@
+# game_logic/memory.py
+# Keeps per-villager conversation memory bounded so the Interaction prompt stays the same size all game.
+
+import math
+from .state_manager import GameState, ChatTurn
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), good enough for budgeting prompt sections."""
+    return math.ceil(len(text) / 4) if text else 0
+
+def clip_to_tokens(text: str, budget: int, keep: str = "head") -> str:
+    """Trims text to roughly `budget` tokens, keeping its head or its tail."""
+    if not text or estimate_tokens(text) <= budget:
+        return text or ""
+    max_chars = max(0, budget * 4 - 3)
+    if keep == "tail":
+        return "..." + text[-max_chars:]
+    return text[:max_chars] + "..."
+
+class ConversationMemory:
+    """
+    Bounded memory for each villager conversation, in three parts:
+
+    - a sliding window of the last `window_turns` exchanges, kept verbatim in
+      game_state.full_npc_memory,
+    - a rolling summary per villager (game_state.npc_summaries). Each exchange that
+      falls out of the window is folded into it, so the summary is updated
+      incrementally and never rebuilt from the full history,
+    - a token budget for each prompt section (history, summary, knowledge).
+    """
+
+    def __init__(self, window_turns: int, history_token_budget: int, summary_token_budget: int, knowledge_token_budget: int):
+        self.window_turns = max(1, window_turns)
+        self.history_token_budget = history_token_budget
+        self.summary_token_budget = summary_token_budget
+        self.knowledge_token_budget = knowledge_token_budget
+
+    def record_turn(self, game_state: GameState, npc_name: str, player_input: str, npc_dialogue: str):
+        history = game_state.full_npc_memory.setdefault(npc_name, [])
+        history.append(ChatTurn("player", player_input))
+        history.append(ChatTurn("npc", npc_dialogue))
+
+        # Each exchange is a player line followed by an npc line
+        evicted_exchanges = 0
+        while len(history) > self.window_turns * 2:
+            evicted = history[:2]
+            del history[:2]
+            self._fold_into_summary(game_state, npc_name, evicted)
+            evicted_exchanges += 1
+        # The resulting summary is logged, so replaying the log never depends on these settings
+        game_state.record_event(
+            "chat", npc=npc_name, messages=[turn.to_dict() for turn in history[-2:]], evicted=evicted_exchanges,
+            summary=game_state.npc_summaries.get(npc_name) if evicted_exchanges else None,
+        )
+
+    def build_prompt_sections(self, game_state: GameState, npc_name: str) -> dict:
+        """Returns the chat history, earlier-conversation summary and knowledge summary, each within budget."""
+        history = game_state.full_npc_memory.get(npc_name, [])
+        per_message_budget = self.history_token_budget // max(1, len(history))
+        chat_history = [
+            {"role": turn.role, "content": clip_to_tokens(turn.content or "", per_message_budget)}
+            for turn in history
+        ]
+        return {
+            "chatHistory": chat_history,
+            "conversation_summary": game_state.npc_summaries.get(npc_name, ""),
+            # Latest discoveries matter most for "don't repeat what the player knows"
+            "player_knowledge_summary": clip_to_tokens(game_state.player_state.knowledge_summary, self.knowledge_token_budget, keep="tail"),
+        }
+
+    def _fold_into_summary(self, game_state: GameState, npc_name: str, exchange: list):
+        player_line = next((turn.content for turn in exchange if turn.role == "player"), "") or ""
+        npc_line = next((turn.content for turn in exchange if turn.role == "npc"), "") or ""
+        entry = f"Player: {self._gist(player_line)} / {npc_name}: {self._gist(npc_line)}"
+
+        summary = game_state.npc_summaries.get(npc_name, "")
+        summary = f"{summary}\n{entry}" if summary else entry
+        # Oldest entries are dropped first once the summary exceeds its budget
+        lines = summary.split("\n")
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_token_budget:
+            lines.pop(0)
+        game_state.npc_summaries[npc_name] = clip_to_tokens("\n".join(lines), self.summary_token_budget, keep="tail")
+
+    def _gist(self, text: str) -> str:
+        # First sentence only, capped at a handful of tokens
+        text = " ".join(text.split())
+        for stop in (". ", "? ", "! "):
+            cut = text.find(stop)
+            if cut != -1:
+                text = text[:cut + 1]
+        return clip_to_tokens(text, 20)
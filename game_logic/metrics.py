@@ -0,0 +1,170 @@
+# game_logic/metrics.py
+# In-process metrics: counters, histograms and timing spans, rendered in Prometheus text format.
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Every metric the server exports, with its type and help text
+METRIC_HELP = {
+    "echoes_stage_seconds": ("histogram", "Time spent in each request stage (prompt_build, llm_call, json_clean, json_parse, engine_update, response_serialize)."),
+    "echoes_http_request_seconds": ("histogram", "End-to-end HTTP request latency by route."),
+    "echoes_stream_ttft_seconds": ("histogram", "Time to first npc_dialogue token on streamed turns."),
+    "echoes_stream_total_seconds": ("histogram", "Total duration of streamed turns."),
+    "echoes_llm_calls_total": ("counter", "LLM calls by prompt type and outcome."),
+    "echoes_llm_retries_total": ("counter", "LLM attempts that failed and were retried."),
+    "echoes_llm_prompt_chars_total": ("counter", "Characters sent to the LLM by prompt type."),
+    "echoes_llm_response_chars_total": ("counter", "Characters received from the LLM by prompt type."),
+    "echoes_llm_prompt_tokens_total": ("counter", "Prompt tokens by prompt type (provider-reported, estimated when unavailable)."),
+    "echoes_llm_response_tokens_total": ("counter", "Response tokens by prompt type (provider-reported, estimated when unavailable)."),
+    "echoes_llm_cached_tokens_total": ("counter", "Prompt tokens served from a provider-side context cache."),
+    "echoes_speculation_total": ("counter", "Speculative replies by outcome (launched, hits, misses, wasted, skipped)."),
+    "echoes_speculation_wasted_tokens_total": ("counter", "Estimated tokens spent on speculative replies that were never used."),
+    "echoes_world_fill_batches_total": ("counter", "Per-villager clue batches written by progressive world building, by outcome."),
+    "echoes_world_fill_waits_total": ("counter", "Turns that had to wait for the villager's clue batch."),
+    "echoes_quest_networks_total": ("counter", "Generated quest networks by validation outcome (valid, repaired, regenerate)."),
+    "echoes_quest_repairs_total": ("counter", "Local quest-network repairs by kind."),
+    "echoes_llm_hedges_total": ("counter", "Hedged second LLM requests, launched and won."),
+    "echoes_llm_breaker_open": ("gauge", "1 while the LLM circuit breaker is refusing calls."),
+    "echoes_llm_queue_wait_seconds": ("histogram", "Time LLM calls waited for a scheduler slot, by priority."),
+    "echoes_llm_queue_depth": ("gauge", "LLM calls waiting for a scheduler slot, by priority."),
+    "echoes_llm_in_flight": ("gauge", "LLM calls currently holding a scheduler slot."),
+    "echoes_llm_rejected_total": ("counter", "LLM calls refused or evicted because the queue was full, by priority."),
+    "echoes_event_log_records_total": ("counter", "Events and snapshots committed to the game event log."),
+    "echoes_game_commits_total": ("counter", "Turn commits by outcome: clean, rebased (re-applied to a newer version) or conflict (gave up)."),
+    "echoes_llm_cache_requests_total": ("counter", "LLM response cache lookups by prompt type: memory_hit, disk_hit or miss."),
+    "echoes_llm_cache_hit_ratio": ("gauge", "Share of LLM response cache lookups answered from the cache, per prompt type."),
+    "echoes_llm_cache_bytes": ("gauge", "Size of the cached LLM replies, per tier."),
+    "echoes_llm_route_calls_total": ("counter", "LLM call attempts by prompt type and the backend:model target the router sent them to."),
+    "echoes_llm_route_shed_total": ("counter", "Times the router passed over a target, by reason: slow (p95 over LLM_ROUTE_SLOW_MS) or load (queue too deep)."),
+    "echoes_idempotency_requests_total": ("counter", "Requests with an Idempotency-Key: new, coalesced (joined one in flight), replayed or mismatch."),
+    "echoes_interact_batch_turns_total": ("counter", "Turns in interaction batches, played or deduplicated (answered by an identical turn)."),
+    "echoes_fast_dialogue_total": ("counter", "Turns answered by the fast dialogue tier, by tier."),
+    "echoes_world_catalog_picks_total": ("counter", "/game/new world picks from the world catalog: hit, or miss (no worlds for the key)."),
+    "echoes_world_pool_hits_total": ("counter", "/game/new requests served from the pre-generated world pool."),
+    "echoes_world_pool_misses_total": ("counter", "/game/new requests that had to generate a world live."),
+    "echoes_world_pool_ready": ("gauge", "Pre-generated worlds ready in the pool."),
+    "echoes_store_games": ("gauge", "Games held by the game-state store."),
+    "echoes_store_bytes": ("gauge", "Approximate bytes held by the in-memory game store."),
+    "echoes_store_evictions": ("gauge", "Games evicted from the in-memory game store since startup."),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+class Metrics:
+    """
+    A small process-wide metrics registry.
+
+    Collectors registered with add_collector() are called at render time and return
+    (name, type, labels, value) samples. They expose numbers other components already
+    track (world pool hits, store size, ...) without those components importing this module.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._collectors: List[Callable[[], Iterable[tuple]]] = []
+
+    @staticmethod
+    def _key(labels: dict) -> LabelKey:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(DEFAULT_BUCKETS)
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        """Times the enclosed block into echoes_stage_seconds{stage=...}."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("echoes_stage_seconds", time.perf_counter() - started, stage=stage, **labels)
+
+    def add_collector(self, collector: Callable[[], Iterable[tuple]]):
+        self._collectors.append(collector)
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(self._key(labels), 0.0)
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                self._header(lines, name, "counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            for name in sorted(self._histograms):
+                self._header(lines, name, "histogram")
+                for key, histogram in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+
+        collected: Dict[str, list] = {}
+        for collector in self._collectors:
+            for name, metric_type, labels, value in collector():
+                collected.setdefault(name, [metric_type, []])[1].append((self._key(labels), value))
+        for name in sorted(collected):
+            metric_type, samples = collected[name]
+            self._header(lines, name, metric_type)
+            for key, value in sorted(samples):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: list, name: str, metric_type: str):
+        help_text = METRIC_HELP.get(name, (metric_type, name.replace("_", " ")))[1]
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in key) + "}"
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+# Process-wide registry used by the engine, the LLM client and the API server
+METRICS = Metrics()
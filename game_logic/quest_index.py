@@ -0,0 +1,87 @@
+# game_logic/quest_index.py
+# Precomputed lookups over a quest network so per-turn clue checks don't rescan every node.
+
+import bisect
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .state_manager import QuestNode
+
+class QuestIndex:
+    """
+    Built once when a quest network is loaded, then updated incrementally as nodes are discovered.
+
+    - villager_queues: each villager's undiscovered nodes, highest priority first
+    - unmet: per node, how many distinct preconditions are still undiscovered
+    - discovered: set of discovered node ids (player_state keeps the ordered list for the API)
+    - key_clues / discovered_key_clues: cached key-clue id sets
+
+    A status lookup only looks at the talking villager's own queue, so its cost does not
+    depend on the size of the network.
+    """
+
+    def __init__(self, nodes: List[QuestNode], discovered: Iterable[str] = ()):
+        self._nodes = list(nodes)
+        self.nodes_by_id: Dict[str, QuestNode] = {}
+        self._position: Dict[str, int] = {}
+        self.villager_queues: Dict[str, List[QuestNode]] = {}
+        self.dependents: Dict[str, List[str]] = {}
+        self.unmet: Dict[str, int] = {}
+        self.discovered = set()
+        self._discovered_positions: List[int] = []
+
+        for position, node in enumerate(nodes):
+            node_id = node.node_id
+            self.nodes_by_id[node_id] = node
+            self._position[node_id] = position
+            self.villager_queues.setdefault(node.villager_name, []).append(node)
+            preconditions = set(node.preconditions)
+            self.unmet[node_id] = len(preconditions)
+            for precondition in preconditions:
+                self.dependents.setdefault(precondition, []).append(node_id)
+
+        for queue in self.villager_queues.values():
+            # sort() is stable, so equal priorities keep network order like the old scan did
+            queue.sort(key=lambda x: x.priority, reverse=True)
+
+        self.key_clues = frozenset(node.node_id for node in nodes if node.key_clue)
+        self.discovered_key_clues = set()
+
+        for node_id in discovered:
+            self.discover(node_id)
+
+    def discover(self, node_id: str) -> bool:
+        """Marks a node discovered. Returns False if it already was."""
+        if node_id in self.discovered:
+            return False
+        self.discovered.add(node_id)
+        for dependent in self.dependents.get(node_id, ()):
+            self.unmet[dependent] -= 1
+
+        node = self.nodes_by_id.get(node_id)
+        if node is not None:
+            self.villager_queues[node.villager_name].remove(node)
+            bisect.insort(self._discovered_positions, self._position[node_id])
+            if node_id in self.key_clues:
+                self.discovered_key_clues.add(node_id)
+        return True
+
+    def villager_status(self, npc_name: str, familiarity: int) -> Tuple[str, Optional[QuestNode]]:
+        queue = self.villager_queues.get(npc_name)
+        if not queue:
+            return "PERMANENTLY_EXHAUSTED", None
+
+        for node in queue:
+            required_familiarity = node.required_familiarity
+            familiarity_met = required_familiarity is None or familiarity >= required_familiarity
+            if self.unmet[node.node_id] == 0 and familiarity_met:
+                return "CAN_REVEAL", node
+
+        return "HAS_LOCKED_CLUES", queue[0]
+
+    def discovered_contents(self) -> List[str]:
+        """Content of every discovered node, in network order."""
+        # A node whose villager batch is still being written only has its skeleton beat
+        return [self._nodes[position].content or self._nodes[position].beat or '' for position in self._discovered_positions]
+
+    def all_key_clues_discovered(self) -> bool:
+        return len(self.discovered_key_clues) == len(self.key_clues)
@@ -0,0 +1,208 @@
+# game_logic/quest_validator.py
+# Checks a generated quest network and repairs what it can locally, before it reaches a game.
+
+from typing import Dict, List, Optional
+
+from .llm_calls import DIFFICULTY_SETTINGS
+
+NODE_TYPES = ("Information", "TalkToVillager")
+
+class QuestNetworkReport:
+    """What validate_and_repair() found and fixed. `salvageable` is False when only a regeneration will do."""
+
+    def __init__(self):
+        self.repairs: Dict[str, int] = {}
+        self.original_nodes = 0
+        self.salvageable = True
+        self.reason = ""
+
+    def count(self, kind: str, amount: int = 1):
+        if amount:
+            self.repairs[kind] = self.repairs.get(kind, 0) + amount
+
+    def summary(self) -> str:
+        if not self.salvageable:
+            return f"unsalvageable ({self.reason})"
+        if not self.repairs:
+            return "valid"
+        return "repaired: " + ", ".join(f"{kind}={amount}" for kind, amount in sorted(self.repairs.items()))
+
+def validate_and_repair(quest_network: dict, roster: List[dict], difficulty: str,
+                        require_content: bool = True, min_valid_fraction: float = 0.5) -> QuestNetworkReport:
+    """
+    Repairs quest_network in place and reports what was done.
+
+    Checks, in order: node shape (ids, types, familiarity), roster membership of every
+    villager_name, dangling and self-referencing preconditions, dependency cycles (the DAG
+    check; once it passes every node is reachable), and the key-clue count for the
+    difficulty. Each problem gets the cheapest local fix: drop the node or edge, remap the
+    villager, break the cycle, promote or demote key clues. The network is unsalvageable
+    when too few nodes survive, and then the caller should regenerate it.
+    """
+    report = QuestNetworkReport()
+    raw_nodes = quest_network.get("nodes") if isinstance(quest_network, dict) else None
+    if not isinstance(raw_nodes, list) or not raw_nodes:
+        report.salvageable = False
+        report.reason = "no nodes"
+        return report
+    report.original_nodes = len(raw_nodes)
+
+    nodes = _normalize_nodes(raw_nodes, require_content, report)
+    _remap_villagers(nodes, roster, report)
+    by_id = {node["node_id"]: node for node in nodes}
+    _drop_dangling_edges(nodes, by_id, report)
+    _break_cycles(nodes, by_id, report)
+
+    key_clue_count = DIFFICULTY_SETTINGS.get(difficulty, DIFFICULTY_SETTINGS['Medium'])['key_clue_count']
+    if len(nodes) < max(key_clue_count, report.original_nodes * min_valid_fraction):
+        report.salvageable = False
+        report.reason = f"only {len(nodes)} of {report.original_nodes} nodes usable"
+        return report
+    _fix_key_clue_count(nodes, by_id, key_clue_count, report)
+
+    quest_network["nodes"] = nodes
+    return report
+
+def _normalize_nodes(raw_nodes: list, require_content: bool, report: QuestNetworkReport) -> List[dict]:
+    nodes, seen = [], set()
+    for node in raw_nodes:
+        if not isinstance(node, dict) or not isinstance(node.get("node_id"), str) or node["node_id"] in seen:
+            report.count("dropped_nodes")
+            continue
+        if require_content and not (isinstance(node.get("content"), str) and node["content"].strip()):
+            report.count("dropped_nodes")
+            continue
+        seen.add(node["node_id"])
+
+        if node.get("type") not in NODE_TYPES:
+            node["type"] = "Information"
+            report.count("fixed_fields")
+        if not isinstance(node.get("priority"), int):
+            node["priority"] = _to_int(node.get("priority"), 3)
+            report.count("fixed_fields")
+        node["key_clue"] = node.get("key_clue") is True or str(node.get("key_clue")).lower() == "true"
+        familiarity = node.get("required_familiarity")
+        if familiarity is not None:
+            fixed = _to_int(familiarity, None)
+            fixed = None if fixed is None or fixed < 1 else min(fixed, 5)
+            if fixed != familiarity:
+                node["required_familiarity"] = fixed
+                report.count("fixed_fields")
+        if not isinstance(node.get("villager_name"), str):
+            # A list or object here is unusable (and unhashable); _remap_villagers reassigns the node
+            node["villager_name"] = None
+        preconditions = node.get("preconditions")
+        if not isinstance(preconditions, list):
+            node["preconditions"] = [preconditions] if isinstance(preconditions, str) else []
+        nodes.append(node)
+    return nodes
+
+def _remap_villagers(nodes: List[dict], roster: List[dict], report: QuestNetworkReport):
+    names = [v["name"] for v in roster]
+    if not names:
+        return
+    lowered = {name.lower(): name for name in names}
+    load = {name: 0 for name in names}
+    for node in nodes:
+        if node.get("villager_name") in load:
+            load[node["villager_name"]] += 1
+
+    for node in nodes:
+        name = node.get("villager_name")
+        if name in load:
+            continue
+        match = _match_villager(name, lowered)
+        if match is None:
+            # Nobody by that name: give the clue to the villager with the fewest clues
+            match = min(names, key=lambda n: load[n])
+        node["villager_name"] = match
+        load[match] += 1
+        report.count("remapped_villagers")
+
+def _match_villager(name, lowered: Dict[str, str]) -> Optional[str]:
+    if not isinstance(name, str) or not name.strip():
+        return None
+    name = name.strip().lower()
+    if name in lowered:
+        return lowered[name]
+    # "Arthur", "Old Arthur Hobbs", "arthur hobbs (woodcutter)" ...
+    for full_lower, full in lowered.items():
+        if full_lower in name or name in full_lower.split():
+            return full
+    return None
+
+def _drop_dangling_edges(nodes: List[dict], by_id: Dict[str, dict], report: QuestNetworkReport):
+    for node in nodes:
+        kept = []
+        for precondition in node["preconditions"]:
+            # Models sometimes nest a list or object here; only node id strings are edges
+            if not isinstance(precondition, str):
+                continue
+            if precondition in by_id and precondition != node["node_id"] and precondition not in kept:
+                kept.append(precondition)
+        report.count("dropped_edges", len(node["preconditions"]) - len(kept))
+        node["preconditions"] = kept
+
+def _break_cycles(nodes: List[dict], by_id: Dict[str, dict], report: QuestNetworkReport):
+    """Iterative DFS in network order; any edge back onto the current path is removed."""
+    state = {}  # node_id -> "active" | "done"
+    for root in nodes:
+        if root["node_id"] in state:
+            continue
+        state[root["node_id"]] = "active"
+        stack = [(root, 0)]
+        while stack:
+            node, index = stack[-1]
+            preconditions = node["preconditions"]
+            if index == len(preconditions):
+                state[node["node_id"]] = "done"
+                stack.pop()
+                continue
+            stack[-1] = (node, index + 1)
+            target = preconditions[index]
+            if state.get(target) == "active":
+                preconditions.pop(index)
+                stack[-1] = (node, index)
+                report.count("broken_cycles")
+            elif target not in state:
+                state[target] = "active"
+                stack.append((by_id[target], 0))
+
+def _fix_key_clue_count(nodes: List[dict], by_id: Dict[str, dict], wanted: int, report: QuestNetworkReport):
+    depth = _depths(nodes, by_id)
+    # Deep, high-priority nodes make the best key clues: they sit at the end of a chain
+    rank = lambda node: (depth[node["node_id"]], node.get("priority", 0))
+    key_nodes = [node for node in nodes if node["key_clue"]]
+    if len(key_nodes) > wanted:
+        for node in sorted(key_nodes, key=rank)[:len(key_nodes) - wanted]:
+            node["key_clue"] = False
+            report.count("key_clues_demoted")
+    elif len(key_nodes) < wanted:
+        candidates = sorted((node for node in nodes if not node["key_clue"]), key=rank, reverse=True)
+        for node in candidates[:wanted - len(key_nodes)]:
+            node["key_clue"] = True
+            report.count("key_clues_promoted")
+
+def _depths(nodes: List[dict], by_id: Dict[str, dict]) -> Dict[str, int]:
+    """Longest precondition chain below each node. Only valid once the network is a DAG."""
+    depth: Dict[str, int] = {}
+    for root in nodes:
+        stack = [root["node_id"]]
+        while stack:
+            node_id = stack[-1]
+            if node_id in depth:
+                stack.pop()
+                continue
+            pending = [p for p in by_id[node_id]["preconditions"] if p not in depth]
+            if pending:
+                stack.extend(pending)
+                continue
+            depth[node_id] = 1 + max((depth[p] for p in by_id[node_id]["preconditions"]), default=0)
+            stack.pop()
+    return depth
+
+def _to_int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,214 @@
+# game_logic/recording.py
+# Records live LLM traffic and player sessions to a compressed file, and replays the LLM side offline.
+
+import contextvars
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from . import fast_json
+from .fake_llm import FakeLLM
+from config import LLM_MAX_CONCURRENCY
+
+def context_hash(context: dict) -> str:
+    """Stable key for a prompt context, independent of dict ordering."""
+    return hashlib.sha1(fast_json.dumpb(context, sort_keys=True, default=str)).hexdigest()
+
+class SessionRecorder:
+    """
+    Appends records to a gzip-compressed JSON-lines file:
+
+    - {"kind": "llm", "t", "prompt_type", "context_hash", "prompt", "response", "latency", "game_id"}
+      for every successful model call (latency is the model call alone, without queueing)
+    - {"kind": "http", "t", "method", "path", "body", "status", "seconds", "game_id"}
+      for every /game request (game_id only on /game/new, to link the game's later requests)
+
+    `t` is seconds since the recorder started. One recorder per file: with several
+    gunicorn workers, record from a single one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.counts = {"llm": 0, "http": 0}
+
+    def now(self) -> float:
+        return time.monotonic() - self._started
+
+    def record_llm(self, prompt_type: str, context: dict, prompt: str, response: str, latency: float, game_id=None):
+        self._write({
+            "kind": "llm", "t": round(self.now() - latency, 4), "prompt_type": prompt_type,
+            "context_hash": context_hash(context), "prompt": prompt, "response": response, "latency": round(latency, 4),
+            "game_id": game_id,
+        })
+
+    def record_http(self, started: float, method: str, path: str, body, status: int, game_id=None):
+        self._write({
+            "kind": "http", "t": round(started, 4), "method": method, "path": path, "body": body,
+            "status": status, "seconds": round(self.now() - started, 4), "game_id": game_id,
+        })
+
+    def _write(self, record: dict):
+        line = fast_json.dumps(record) + "\n"
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+                self.counts[record["kind"]] += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        print(f"--- RECORDING: wrote {self.counts['llm']} LLM call(s) and {self.counts['http']} request(s) to {self.path} ---")
+
+def load_recording(path: str) -> List[dict]:
+    """Every record in a recording file, in the order they were written."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [fast_json.loads(line) for line in f if line.strip()]
+
+class SessionRecordingMiddleware:
+    """ASGI middleware that hands every /game request (and its outcome) to a SessionRecorder."""
+
+    def __init__(self, app, recorder: SessionRecorder):
+        self.app = app
+        self.recorder = recorder
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/game"):
+            await self.app(scope, receive, send)
+            return
+        started = self.recorder.now()
+        # Only /game/new's response is kept: it holds the id the game's later requests use
+        keep_response = scope["path"] == "/game/new"
+        request_body, response_body = [], []
+        status = 500
+
+        async def recording_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                request_body.append(message.get("body", b""))
+            return message
+
+        async def recording_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body" and keep_response:
+                response_body.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, recording_receive, recording_send)
+        finally:
+            self.recorder.record_http(
+                started, scope["method"], scope["path"], _json_or_none(b"".join(request_body)), status,
+                game_id=(_json_or_none(b"".join(response_body)) or {}).get("game_id") if keep_response else None,
+            )
+
+def _json_or_none(raw: bytes):
+    try:
+        return fast_json.loads(raw) if raw else None
+    except ValueError:
+        return None
+
+# ---------- replay ---------- #
+
+# The recorded game a replayed request stands in for, from its X-Replay-Game header. LLM
+# calls made for the request (and the background work it starts) inherit it.
+REPLAYED_GAME: contextvars.ContextVar = contextvars.ContextVar("replayed_game", default=None)
+
+class ReplayGameMiddleware:
+    """ASGI middleware that sets REPLAYED_GAME from the X-Replay-Game request header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        recorded_game = None
+        if scope["type"] == "http":
+            recorded_game = next((value.decode() for name, value in scope["headers"] if name == b"x-replay-game"), None)
+        if recorded_game is None:
+            await self.app(scope, receive, send)
+            return
+        token = REPLAYED_GAME.set(recorded_game)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            REPLAYED_GAME.reset(token)
+
+class ReplayLLM(FakeLLM):
+    """
+    Serves recorded responses instead of calling a model.
+
+    A call gets the next unused response recorded for the same prompt type and context
+    hash, preferring the recorded game it is replaying (see REPLAYED_GAME), since several
+    games can make identical calls. A call the recording has no exact match for (the engine
+    or the player's path diverged) gets the same game's next unused response of that prompt
+    type, or any recorded one, and is counted as a fallback. Each response arrives after its
+    recorded latency times `latency_scale`.
+    """
+
+    def __init__(self, path: str, latency_scale: float = 1.0, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        super().__init__(max_concurrency=max_concurrency)
+        self.path = path
+        self.latency_scale = max(0.0, latency_scale)
+        # Each reply is a [latency, text, used] list, indexed both with its game and with None
+        self._by_context: Dict[Tuple[str, str, Optional[str]], deque] = {}
+        self._by_type: Dict[Tuple[str, Optional[str]], deque] = {}
+        self._all_by_type: Dict[str, list] = {}
+        # Calls with identical contexts (every game's StoryGenerator call) are served in the
+        # order they were made; the file holds them in the order they finished
+        llm_records = sorted((r for r in load_recording(path) if r["kind"] == "llm"), key=lambda r: r["t"])
+        for record in llm_records:
+            reply = [record["latency"], record["response"], False]
+            prompt_type, game_id = record["prompt_type"], record.get("game_id")
+            for game in {game_id, None}:
+                self._by_context.setdefault((prompt_type, record["context_hash"], game), deque()).append(reply)
+                self._by_type.setdefault((prompt_type, game), deque()).append(reply)
+            self._all_by_type.setdefault(prompt_type, []).append(reply)
+        self._fallback_cursor: Dict[str, int] = {}
+        self.stats_counts = {"exact": 0, "fallback": 0}
+        print(f"✅ Replay LLM loaded {len(llm_records)} recorded call(s) from {path} (latency x{self.latency_scale}).")
+
+    def _plan_reply(self, prompt_type, context):
+        self.calls[prompt_type] = self.calls.get(prompt_type, 0) + 1
+        game = REPLAYED_GAME.get()
+        key = context_hash(context)
+        reply = self._take(self._by_context.get((prompt_type, key, game))) or self._take(self._by_context.get((prompt_type, key, None)))
+        if reply is not None:
+            self.stats_counts["exact"] += 1
+        else:
+            self.stats_counts["fallback"] += 1
+            reply = self._take(self._by_type.get((prompt_type, game))) if game is not None else None
+            if reply is None:
+                # Nothing unused left: cycle through everything recorded for this prompt type
+                replies = self._all_by_type.get(prompt_type)
+                if not replies:
+                    raise RuntimeError(f"No recorded {prompt_type} responses in {self.path}")
+                cursor = self._fallback_cursor.get(prompt_type, 0)
+                self._fallback_cursor[prompt_type] = cursor + 1
+                reply = replies[cursor % len(replies)]
+        return reply[0] * self.latency_scale, reply[1]
+
+    @staticmethod
+    def _take(replies: Optional[deque]) -> Optional[list]:
+        """The oldest reply in `replies` no other call has used yet, marked as used."""
+        while replies:
+            reply = replies.popleft()
+            if not reply[2]:
+                reply[2] = True
+                return reply
+        return None
+
+    def stats(self) -> dict:
+        return {"path": self.path, "latency_scale": self.latency_scale, **self.stats_counts}
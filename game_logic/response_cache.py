@@ -0,0 +1,235 @@
+# game_logic/response_cache.py
+# Content-addressed cache of LLM replies: an LRU in memory in front of an optional SQLite file.
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from . import fast_json
+from .metrics import METRICS
+
+POLICIES = ("always", "never", "deterministic", "opening")
+
+def is_opening_turn(context: dict) -> bool:
+    """True for an Interaction context with no conversation so far, at familiarity 0."""
+    return (
+        context.get("familiarity_level") == 0
+        and not context.get("chatHistory")
+        and not context.get("conversation_summary")
+    )
+
+class _MemoryTier:
+    """LRU of reply texts, bounded by their total size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+            return text
+
+    def put(self, key: str, text: str):
+        size = len(text)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self._entries[key] = text
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class _DiskTier:
+    """
+    Compressed replies in a SQLite (WAL) file, which every worker can share and which
+    outlives restarts. Once the file's replies pass `max_bytes`, the least recently used
+    are deleted until they fit in PRUNE_TO of it.
+
+    Hits do not write to the file: their use times are kept in memory and written in one
+    statement every TOUCH_EVERY seconds, before a prune and at close. Eviction order only
+    needs to be roughly right.
+    """
+
+    PRUNE_TO = 0.9
+    TOUCH_EVERY = 30.0
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, prompt_type TEXT NOT NULL,"
+            " response BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_by_use ON responses (last_used)")
+        (self.bytes,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        # key -> last hit, not yet written to the file
+        self._touched: Dict[str, float] = {}
+        self._touched_at = time.monotonic()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._touched[key] = time.time()
+            if time.monotonic() - self._touched_at >= self.TOUCH_EVERY:
+                self._write_touched()
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def _write_touched(self):
+        self._touched_at = time.monotonic()
+        if self._touched:
+            touched, self._touched = self._touched, {}
+            self._conn.executemany("UPDATE responses SET last_used = ? WHERE key = ?", [(t, k) for k, t in touched.items()])
+
+    def put(self, key: str, prompt_type: str, text: str):
+        blob = zlib.compress(text.encode("utf-8"))
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, prompt_type, response, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, prompt_type, blob, len(blob), time.time()),
+            )
+            self._touched.pop(key, None)
+            self.bytes += len(blob) - (previous[0] if previous else 0)
+            if self.bytes > self.max_bytes:
+                self._prune()
+
+    def _prune(self):
+        self._write_touched()
+        # Other workers write to the same file, so recount before deleting anything
+        (self.bytes,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        excess = self.bytes - self.max_bytes * self.PRUNE_TO
+        if excess <= 0:
+            return
+        evicted = []
+        cursor = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used")
+        for key, size in cursor:
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+            self.bytes -= size
+        cursor.close()
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._write_touched()
+            self._conn.close()
+
+class LLMResponseCache:
+    """
+    Reuses replies for byte-identical LLM requests.
+
+    The key is a hash of the model, prompt type, generation config and the rendered prompt,
+    so any change to what the model would see is a different entry. Lookups try the
+    memory tier, then the disk tier (promoting a hit into memory). Whether a prompt type is
+    cached at all is its policy: "always", "never", "deterministic", which only caches
+    while the type's temperature is 0 and the reply would not vary anyway, or "opening",
+    which only caches a villager's opening line: an Interaction with no conversation yet
+    at familiarity 0. Its prompt depends on nothing but the world and the player's first
+    line, so games sharing a world (see world_catalog.py) reuse it.
+    """
+
+    def __init__(self, policies: Dict[str, str], memory_max_bytes: int, disk_path: str = "", disk_max_bytes: int = 0):
+        for prompt_type, policy in policies.items():
+            if policy not in POLICIES:
+                raise ValueError(f"Unknown LLM cache policy '{policy}' for {prompt_type}; expected one of {POLICIES}.")
+        self.policies = dict(policies)
+        self.memory = _MemoryTier(memory_max_bytes)
+        self.disk = _DiskTier(disk_path, disk_max_bytes) if disk_path else None
+        # prompt_type -> {"memory_hit": n, "disk_hit": n, "miss": n}
+        self.stats_counts: Dict[str, Dict[str, int]] = {}
+
+    def policy(self, prompt_type: str) -> str:
+        return self.policies.get(prompt_type, self.policies.get("default", "deterministic"))
+
+    def cacheable(self, prompt_type: str, generation_config: dict, context: Optional[dict] = None) -> bool:
+        policy = self.policy(prompt_type)
+        if policy == "deterministic":
+            return generation_config.get("temperature") == 0
+        if policy == "opening":
+            return prompt_type == "Interaction" and context is not None and is_opening_turn(context)
+        return policy == "always"
+
+    @staticmethod
+    def key(model_name: str, prompt_type: str, prompt: str, generation_config: dict) -> str:
+        digest = hashlib.sha256(fast_json.dumpb([model_name, prompt_type, generation_config], sort_keys=True))
+        digest.update(b"\0")
+        digest.update(prompt.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str, prompt_type: str) -> Optional[str]:
+        text = self.memory.get(key)
+        outcome = "memory_hit"
+        if text is None and self.disk is not None:
+            text = self.disk.get(key)
+            outcome = "disk_hit"
+            if text is not None:
+                self.memory.put(key, text)
+        if text is None:
+            outcome = "miss"
+        self._count(prompt_type, outcome)
+        return text
+
+    def put(self, key: str, prompt_type: str, text: str):
+        self.memory.put(key, text)
+        if self.disk is not None:
+            self.disk.put(key, prompt_type, text)
+
+    def _count(self, prompt_type: str, outcome: str):
+        counts = self.stats_counts.setdefault(prompt_type, {"memory_hit": 0, "disk_hit": 0, "miss": 0})
+        counts[outcome] += 1
+        METRICS.inc("echoes_llm_cache_requests_total", prompt_type=prompt_type, outcome=outcome)
+
+    def hit_ratio(self, prompt_type: str) -> float:
+        counts = self.stats_counts.get(prompt_type)
+        if not counts:
+            return 0.0
+        hits = counts["memory_hit"] + counts["disk_hit"]
+        return hits / (hits + counts["miss"])
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+    def stats(self) -> dict:
+        return {
+            "policies": self.policies,
+            "memory": {"entries": len(self.memory), "bytes": self.memory.bytes, "max_bytes": self.memory.max_bytes},
+            "disk": {"path": self.disk.path, "entries": len(self.disk), "bytes": self.disk.bytes, "max_bytes": self.disk.max_bytes}
+                    if self.disk is not None else None,
+            "prompt_types": {
+                prompt_type: {**counts, "hit_ratio": round(self.hit_ratio(prompt_type), 4)}
+                for prompt_type, counts in self.stats_counts.items()
+            },
+        }
@@ -0,0 +1,125 @@
+# game_logic/speculation.py
+# Pre-generates the next NPC reply for each suggested player response while the player reads.
+
+import asyncio
+import hashlib
+import time
+from typing import Dict, List, Optional
+
+from . import fast_json
+from .memory import estimate_tokens
+from .metrics import METRICS
+from .llm_scheduler import LLM_PRIORITY
+
+class _Speculation:
+    __slots__ = ("task", "tokens", "created")
+
+    def __init__(self, task: asyncio.Task, tokens: int):
+        self.task = task
+        self.tokens = tokens
+        self.created = time.monotonic()
+
+class SpeculativeReplies:
+    """
+    Speculative Interaction calls, keyed by a hash of the full Interaction context.
+
+    The context holds everything the prompt is built from (villager, memory sections,
+    familiarity, clue status, the player's line), so a key match means a live call would
+    have been sent the exact same prompt. Any change to the game state changes the key.
+
+    After a turn, speculate() launches background calls for the suggested responses, at
+    most `max_in_flight` per game and within `token_budget` estimated prompt tokens per
+    turn. The game's next turn calls claim(): the matching speculation is returned (awaited
+    if still running) and every other one for that game is cancelled and counted as waste.
+    """
+
+    def __init__(self, llm_api, max_in_flight: int = 2, token_budget: int = 4000, ttl_seconds: float = 300.0):
+        self.llm_api = llm_api
+        self.max_in_flight = max(1, max_in_flight)
+        self.token_budget = token_budget
+        self.ttl_seconds = ttl_seconds
+        # game_id -> {context key -> _Speculation}
+        self._games: Dict[str, Dict[str, _Speculation]] = {}
+        self.stats_counts = {"launched": 0, "hits": 0, "misses": 0, "wasted": 0, "skipped": 0}
+
+    @staticmethod
+    def context_key(context: dict) -> str:
+        return hashlib.sha1(fast_json.dumpb(context, sort_keys=True, default=str)).hexdigest()
+
+    def speculate(self, game_id: str, contexts: List[dict]):
+        """Starts background calls for the given next-turn contexts. Must run on the event loop."""
+        self._expire()
+        pending = self._games.setdefault(game_id, {})
+        spent = 0
+        for context in contexts:
+            key = self.context_key(context)
+            if key in pending:
+                continue
+            tokens = estimate_tokens(fast_json.dumps(context, default=str))
+            in_flight = sum(1 for s in pending.values() if not s.task.done())
+            if in_flight >= self.max_in_flight or spent + tokens > self.token_budget:
+                self._count("skipped")
+                continue
+            spent += tokens
+            task = asyncio.create_task(self._generate(context))
+            pending[key] = _Speculation(task, tokens)
+            self._count("launched")
+
+    async def _generate(self, context: dict) -> str:
+        # Runs in its own task, so this only demotes the speculative call, not the turn that launched it
+        LLM_PRIORITY.set("background")
+        return await self.llm_api.generate_content_async("Interaction", context)
+
+    async def claim(self, game_id: str, context: dict) -> Optional[str]:
+        """Returns the speculated raw reply for this context, or None. Discards the game's other speculations."""
+        pending = self._games.pop(game_id, None)
+        if not pending:
+            return None
+        speculation = pending.pop(self.context_key(context), None)
+        for other in pending.values():
+            self._discard(other)
+        if speculation is None:
+            self._count("misses")
+            return None
+
+        try:
+            text = await speculation.task
+        except Exception as e:
+            print(f"--- Speculative reply failed, falling back to a live call: {e} ---")
+            text = None
+        if not text:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return text
+
+    def forget(self, game_id: str):
+        for speculation in self._games.pop(game_id, {}).values():
+            self._discard(speculation)
+
+    def stats(self) -> dict:
+        return {
+            **self.stats_counts,
+            "games": len(self._games),
+            "in_flight": sum(1 for pending in self._games.values() for s in pending.values() if not s.task.done()),
+        }
+
+    def _discard(self, speculation: _Speculation):
+        wasted = speculation.tokens
+        if speculation.task.done():
+            if not speculation.task.cancelled() and speculation.task.exception() is None:
+                wasted += estimate_tokens(speculation.task.result())
+        else:
+            speculation.task.cancel()
+        self._count("wasted")
+        METRICS.inc("echoes_speculation_wasted_tokens_total", wasted)
+
+    def _expire(self):
+        # Games whose player walked away never claim; drop their speculations after a while
+        cutoff = time.monotonic() - self.ttl_seconds
+        for game_id in [g for g, pending in self._games.items() if all(s.created < cutoff for s in pending.values())]:
+            self.forget(game_id)
+
+    def _count(self, outcome: str):
+        self.stats_counts[outcome] += 1
+        METRICS.inc("echoes_speculation_total", outcome=outcome)
@@ -1,19 +1,215 @@
 # game_logic/state_manager.py
 # Defines the GameState class, which holds all dynamic data for a single playthrough.
+# Game data lives in slotted dataclasses (no per-object __dict__) and villager names and
+# profiles are shared across games, so tens of thousands of live games stay cheap to hold.
 
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from config import VILLAGER_ROSTER
+
+# ---------- shared villager references ---------- #
+
+# Every game references these roster entries instead of holding its own copies
+ROSTER: Tuple[dict, ...] = tuple(VILLAGER_ROSTER)
+_ROSTER_BY_NAME = {sys.intern(v["name"]): v for v in ROSTER}
+_VILLAGER_TUPLES: Dict[Tuple[str, ...], Tuple[dict, ...]] = {tuple(_ROSTER_BY_NAME): ROSTER}
+
+def villager_refs(names) -> Tuple[dict, ...]:
+    """The roster entries for `names`; games with the same villagers share one tuple."""
+    names = tuple(name for name in names if name in _ROSTER_BY_NAME)
+    refs = _VILLAGER_TUPLES.get(names)
+    if refs is None:
+        refs = _VILLAGER_TUPLES[names] = tuple(_ROSTER_BY_NAME[name] for name in names)
+    return refs
+
+def intern_name(name):
+    """One shared string object per villager name, however many games and nodes mention it."""
+    return sys.intern(name) if isinstance(name, str) else name
+
+# ---------- game data ---------- #
+
+@dataclass(slots=True)
+class ChatTurn:
+    """One line of a villager conversation; role is "player" or "npc"."""
+    role: str
+    content: Optional[str]
+
+    def to_dict(self) -> dict:
+        return {"role": self.role, "content": self.content}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ChatTurn":
+        return cls(sys.intern(data.get("role") or "player"), data.get("content"))
+
+@dataclass(slots=True)
+class QuestNode:
+    """
+    One clue in the quest network. `content` is None until a progressive world build has
+    written it; until then `beat` holds the skeleton's one-line summary.
+    """
+    node_id: str
+    villager_name: str
+    content: Optional[str] = None
+    type: str = "Information"
+    priority: int = 0
+    key_clue: bool = False
+    preconditions: Tuple[str, ...] = ()
+    required_familiarity: Optional[int] = None
+    beat: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        data = {
+            "node_id": self.node_id,
+            "villager_name": self.villager_name,
+            "content": self.content,
+            "type": self.type,
+            "priority": self.priority,
+            "key_clue": self.key_clue,
+            "preconditions": list(self.preconditions),
+            "required_familiarity": self.required_familiarity,
+        }
+        if self.beat is not None:
+            data["beat"] = self.beat
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuestNode":
+        return cls(
+            node_id=data["node_id"],
+            villager_name=intern_name(data.get("villager_name")),
+            content=data.get("content"),
+            type=sys.intern(data.get("type") or "Information"),
+            priority=data.get("priority") or 0,
+            key_clue=bool(data.get("key_clue")),
+            preconditions=tuple(data.get("preconditions") or ()),
+            required_familiarity=data.get("required_familiarity"),
+            beat=data.get("beat"),
+        )
+
+def quest_nodes_from_dicts(nodes: List[dict]) -> List[QuestNode]:
+    return [QuestNode.from_dict(node) for node in nodes]
+
+@dataclass(slots=True)
+class PlayerState:
+    discovered_nodes: List[str] = field(default_factory=list)
+    knowledge_summary: str = "You've just woken up in a cozy cottage..."
+    familiarity: Dict[str, int] = field(default_factory=dict)
+    unproductive_turns: Dict[str, int] = field(default_factory=dict) # Tracks turns since last clue for each villager
+
+    def to_dict(self) -> dict:
+        return {
+            "discovered_nodes": list(self.discovered_nodes),
+            "knowledge_summary": self.knowledge_summary,
+            "familiarity": dict(self.familiarity),
+            "unproductive_turns": dict(self.unproductive_turns),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PlayerState":
+        return cls(
+            discovered_nodes=list(data.get("discovered_nodes", [])),
+            knowledge_summary=data.get("knowledge_summary", ""),
+            familiarity={intern_name(k): v for k, v in data.get("familiarity", {}).items()},
+            unproductive_turns={intern_name(k): v for k, v in data.get("unproductive_turns", {}).items()},
+        )
+
+@dataclass(slots=True, eq=False, repr=False)
 class GameState:
-    def __init__(self, game_id: str, difficulty: str):
-        self.game_id = game_id
-        self.difficulty = difficulty
-        self.correct_location = ""
-        self.story_theme = ""
-        self.inaccessible_locations = []
-        self.quest_network = {"nodes": []}
-        self.villagers = [] # Each game session will store its own list of villagers
-        self.player_state = {
-            "discovered_nodes": [],
-            "knowledge_summary": "You've just woken up in a cozy cottage...",
-            "familiarity": {},
-            "unproductive_turns": {} # Tracks turns since last clue for each villager
+    game_id: str
+    difficulty: str
+    correct_location: str = ""
+    story_theme: str = ""
+    inaccessible_locations: List[str] = field(default_factory=list)
+    quest_network: List[QuestNode] = field(default_factory=list)
+    villagers: Tuple[dict, ...] = () # Shared roster entries (see villager_refs)
+    player_state: PlayerState = field(default_factory=PlayerState)
+    full_npc_memory: Dict[str, List[ChatTurn]] = field(default_factory=dict) # Recent exchanges per villager (a sliding window, see ConversationMemory)
+    npc_summaries: Dict[str, str] = field(default_factory=dict) # Rolling summary of exchanges that fell out of the window
+    quest_index: object = None # QuestIndex over quest_network; derived, so never serialized
+    version: int = 0 # Bumped by every committed turn (see game_store.commit_turn)
+    # Changes made since the last store write, for the event log (see event_log.py). None
+    # until a DurableGameStore starts tracking this game, so untracked games record nothing.
+    pending_events: Optional[list] = None
+    events_since_snapshot: Optional[int] = None
+
+    def record_event(self, kind: str, **data):
+        """Notes a change for the event log; a no-op unless the game is being tracked."""
+        if self.pending_events is not None:
+            self.pending_events.append((kind, data))
+
+    def sizeof(self) -> int:
+        """Approximate bytes held by this game alone; shared roster entries are not counted."""
+        return sizeof(self)
+
+    def to_dict(self) -> dict:
+        """JSON-compatible snapshot used by the persistent game stores."""
+        return {
+            "game_id": self.game_id,
+            "difficulty": self.difficulty,
+            "correct_location": self.correct_location,
+            "story_theme": self.story_theme,
+            "inaccessible_locations": self.inaccessible_locations,
+            "quest_network": {"nodes": [node.to_dict() for node in self.quest_network]},
+            # Villagers always come from the static roster, so only their names are stored
+            "villagers": [v["name"] for v in self.villagers],
+            "player_state": self.player_state.to_dict(),
+            "full_npc_memory": {npc: [turn.to_dict() for turn in turns] for npc, turns in self.full_npc_memory.items()},
+            "npc_summaries": self.npc_summaries,
+            "version": self.version,
         }
-        self.full_npc_memory = {}
\ No newline at end of file
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GameState":
+        return cls(
+            game_id=data["game_id"],
+            difficulty=data["difficulty"],
+            correct_location=data.get("correct_location", ""),
+            story_theme=data.get("story_theme", ""),
+            inaccessible_locations=data.get("inaccessible_locations", []),
+            quest_network=quest_nodes_from_dicts(data.get("quest_network", {}).get("nodes", [])),
+            villagers=villager_refs(data.get("villagers", [])),
+            player_state=PlayerState.from_dict(data.get("player_state", {})),
+            full_npc_memory={
+                intern_name(npc): [ChatTurn.from_dict(turn) for turn in turns]
+                for npc, turns in data.get("full_npc_memory", {}).items()
+            },
+            npc_summaries={intern_name(npc): summary for npc, summary in data.get("npc_summaries", {}).items()},
+            version=data.get("version", 0),
+        )
+
+# ---------- memory accounting ---------- #
+
+# Objects every game points at; charging them to each game would count them thousands of times
+_SHARED_IDS = {id(obj) for obj in (ROSTER, *ROSTER, *_ROSTER_BY_NAME)}
+
+def mark_shared(*objects):
+    """
+    Leaves objects (and everything they hold) out of sizeof, e.g. a catalog world's quest
+    network that many games point at. The caller must keep them alive until unmark_shared.
+    """
+    _SHARED_IDS.update(id(obj) for obj in objects)
+
+def unmark_shared(*objects):
+    _SHARED_IDS.difference_update(id(obj) for obj in objects)
+
+def sizeof(obj) -> int:
+    """Deep sys.getsizeof of game data: containers, slotted objects and the strings they hold."""
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if current is None or id(current) in seen or id(current) in _SHARED_IDS:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif hasattr(current, "__slots__"):
+            stack.extend(getattr(current, slot, None) for slot in current.__slots__)
+    return total
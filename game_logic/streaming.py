@@ -0,0 +1,92 @@
+# game_logic/streaming.py
+# Pulls the npc_dialogue text out of a JSON reply while the model is still streaming it.
+
+from .fast_json import JSONObjectScanner, dumps
+
+_SIMPLE_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+class JSONStringFieldStreamer:
+    """
+    Incremental extractor for one string field of a streamed JSON object.
+
+    feed() takes raw chunks as they arrive and returns the newly decoded characters of
+    the field's value (possibly ""). Escape sequences split across chunks are held back
+    until complete. The chunks also go through a JSONObjectScanner, so once the stream
+    ends json_text is the reply's JSON object, found without re-scanning the whole text.
+    """
+
+    def __init__(self, field: str = "npc_dialogue"):
+        self._key = dumps(field)
+        self._object = JSONObjectScanner()
+        self._buffer = ""
+        self._state = "seek_key"  # seek_key -> seek_quote -> in_value -> done
+        self.value = ""
+
+    @property
+    def json_text(self) -> str:
+        """The reply's JSON object (all of the text if the model sent no object)."""
+        return self._object.text()
+
+    def feed(self, chunk: str) -> str:
+        self._object.feed(chunk)
+        if self._state == "done":
+            return ""
+        self._buffer += chunk
+
+        if self._state == "seek_key":
+            at = self._buffer.find(self._key)
+            if at == -1:
+                # Keep just enough of the tail to match a key split across chunks
+                self._buffer = self._buffer[-len(self._key):]
+                return ""
+            self._buffer = self._buffer[at + len(self._key):]
+            self._state = "seek_quote"
+
+        if self._state == "seek_quote":
+            # Only whitespace and the colon may sit between the key and a string value
+            self._buffer = self._buffer.lstrip(" \t\r\n:")
+            if not self._buffer:
+                return ""
+            if self._buffer[0] != '"':
+                # null, a number, ...: nothing to stream; parse_dialogue or the fallback handles the reply
+                self._state = "done"
+                self._buffer = ""
+                return ""
+            self._buffer = self._buffer[1:]
+            self._state = "in_value"
+
+        return self._decode_value()
+
+    def _decode_value(self) -> str:
+        out = []
+        buffer = self._buffer
+        i = 0
+        while i < len(buffer):
+            char = buffer[i]
+            if char == '"':
+                self._state = "done"
+                i += 1
+                break
+            if char != '\\':
+                out.append(char)
+                i += 1
+                continue
+            # Escape sequence; wait for the rest of it if the chunk ended mid-way
+            if i + 1 >= len(buffer):
+                break
+            escape = buffer[i + 1]
+            if escape == 'u':
+                if i + 6 > len(buffer):
+                    break
+                try:
+                    out.append(chr(int(buffer[i + 2:i + 6], 16)))
+                except ValueError:
+                    pass
+                i += 6
+            else:
+                out.append(_SIMPLE_ESCAPES.get(escape, escape))
+                i += 2
+        self._buffer = buffer[i:] if self._state == "in_value" else ""
+        text = "".join(out)
+        self.value += text
+        return text
@@ -0,0 +1,236 @@
+# game_logic/world_builder.py
+# Progressive world building: a quest-network skeleton first, then each villager's clue text.
+
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List
+
+from .metrics import METRICS
+from .llm_schemas import parse_llm_json
+from .llm_resilience import LLMError
+from .state_manager import QuestNode
+from config import VILLAGER_ROSTER
+
+class ProgressiveWorldBuilder:
+    """
+    Splits the single WorldBuilder call into stages.
+
+    1. WorldSkeleton (run by the engine): every node's id, villager, type, priority,
+       key_clue, preconditions and required_familiarity, plus a one-line `beat`, but no
+       `content`. Skeleton nodes carry content=None until their villager is filled.
+    2. VillagerNodes, one call per villager: writes `content` for that villager's nodes.
+       Batches run concurrently, and only a batch that fails (or leaves nodes out) is
+       retried; after that a node falls back to its beat.
+
+    A world is playable once its skeleton exists. start() launches the batches in the
+    background, and ensure_villager_async() awaits (or starts) a villager's batch the first
+    time the player talks to them. Finished batches are held here, keyed by game id, and
+    applied to whichever GameState copy the next turn loads, so this works with any store.
+    """
+
+    def __init__(self, llm_api, max_games: int = 1000):
+        self.llm_api = llm_api
+        self.max_games = max(1, max_games)
+        # game_id -> {villager_name -> asyncio.Task returning {node_id: content}}
+        self._fills: "OrderedDict[str, Dict[str, asyncio.Task]]" = OrderedDict()
+
+    # ---------- skeleton ---------- #
+
+    def prepare_skeleton(self, quest_network: dict) -> dict:
+        """Marks every skeleton node as unfilled (content=None) unless the model already wrote it."""
+        for node in quest_network.get("nodes", []):
+            if not node.get("content"):
+                node["content"] = None
+        return quest_network
+
+    @staticmethod
+    def pending_villagers(nodes: List[QuestNode]) -> List[str]:
+        pending = []
+        for node in nodes:
+            if node.content is None and node.villager_name not in pending:
+                pending.append(node.villager_name)
+        return pending
+
+    # ---------- whole-world fill (pool and script paths) ---------- #
+
+    async def fill_all_async(self, world: dict, difficulty: str):
+        quest_network = world["quest_network"]
+        results = await asyncio.gather(*(
+            self.fill_villager_async(world["story_theme"], world["correct_location"], difficulty, quest_network, name)
+            for name in self.pending_villagers(quest_network)
+        ))
+        for contents in results:
+            self._apply(quest_network, contents)
+
+    def fill_all(self, world: dict, difficulty: str):
+        quest_network = world["quest_network"]
+        for name in self.pending_villagers(quest_network):
+            self._apply(quest_network, self.fill_villager(world["story_theme"], world["correct_location"], difficulty, quest_network, name))
+
+    # ---------- per-game background fill ---------- #
+
+    def start(self, game_state):
+        """Starts filling every pending villager of a freshly built game in the background."""
+        pending = self.pending_villagers(game_state.quest_network)
+        if not pending:
+            return
+        tasks = self._fills.setdefault(game_state.game_id, {})
+        for name in pending:
+            if name not in tasks:
+                tasks[name] = self._start_task(game_state, name)
+        # Games that are never played again would keep their results forever; cap them
+        while len(self._fills) > self.max_games:
+            _, stale = self._fills.popitem(last=False)
+            for task in stale.values():
+                task.cancel()
+
+    async def ensure_villager_async(self, game_state, npc_name: str) -> Dict[str, str]:
+        """
+        Applies finished batches to this game and waits for npc_name's batch if it is still
+        pending. Returns every clue text it took from a batch, so a turn committed to a newer
+        copy of the game can apply them there too (see apply_contents).
+        """
+        taken: Dict[str, str] = {}
+        tasks = self._fills.get(game_state.game_id, {})
+        for name, task in list(tasks.items()):
+            if task.done():
+                del tasks[name]
+                if not task.cancelled() and task.exception() is None:
+                    taken.update(task.result())
+                    self.apply_contents(game_state, task.result())
+
+        if npc_name in self.pending_villagers(game_state.quest_network):
+            task = tasks.get(npc_name)
+            if task is None:
+                # Not started in this process (e.g. another worker created the game)
+                task = tasks[npc_name] = self._start_task(game_state, npc_name)
+                self._fills[game_state.game_id] = tasks
+            METRICS.inc("echoes_world_fill_waits_total")
+            # shield: a cancelled request must not cancel a batch other requests may be waiting on
+            contents = await asyncio.shield(task)
+            tasks.pop(npc_name, None)
+            taken.update(contents)
+            self.apply_contents(game_state, contents)
+
+        if not tasks:
+            self._fills.pop(game_state.game_id, None)
+        return taken
+
+    def ensure_villager(self, game_state, npc_name: str):
+        """Blocking variant of ensure_villager_async, for the script path."""
+        if npc_name in self.pending_villagers(game_state.quest_network):
+            self.apply_contents(game_state, self.fill_villager(
+                game_state.story_theme, game_state.correct_location, game_state.difficulty, game_state.quest_network, npc_name,
+            ))
+
+    def _start_task(self, game_state, npc_name: str) -> asyncio.Task:
+        return asyncio.create_task(self.fill_villager_async(
+            game_state.story_theme, game_state.correct_location, game_state.difficulty, game_state.quest_network, npc_name,
+        ))
+
+    # ---------- one villager batch ---------- #
+
+    async def fill_villager_async(self, story_theme: str, correct_location: str, difficulty: str,
+                                  quest_network: List[QuestNode], npc_name: str) -> Dict[str, str]:
+        context = self._batch_context(story_theme, correct_location, difficulty, quest_network, npc_name)
+        contents = await self._request_batch_async(context)
+        missing = self._missing(context, contents)
+        if missing:
+            print(f"--- WORLD FILL: {len(missing)} node(s) for {npc_name} missing, retrying just those ---")
+            context = {**context, "nodes": missing}
+            contents.update(await self._request_batch_async(context))
+        return self._finish_batch(quest_network, npc_name, contents, retried=bool(missing))
+
+    def fill_villager(self, story_theme: str, correct_location: str, difficulty: str,
+                      quest_network: List[QuestNode], npc_name: str) -> Dict[str, str]:
+        context = self._batch_context(story_theme, correct_location, difficulty, quest_network, npc_name)
+        contents = self._request_batch(context)
+        missing = self._missing(context, contents)
+        if missing:
+            print(f"--- WORLD FILL: {len(missing)} node(s) for {npc_name} missing, retrying just those ---")
+            context = {**context, "nodes": missing}
+            contents.update(self._request_batch(context))
+        return self._finish_batch(quest_network, npc_name, contents, retried=bool(missing))
+
+    def _batch_context(self, story_theme: str, correct_location: str, difficulty: str, nodes: List[QuestNode], npc_name: str) -> dict:
+        by_id = {node.node_id: node for node in nodes}
+        own = [node for node in nodes if node.villager_name == npc_name and node.content is None]
+        own_ids = {node.node_id for node in own}
+        preceding_ids = []
+        for node in own:
+            for precondition in node.preconditions:
+                if precondition not in own_ids and precondition in by_id and precondition not in preceding_ids:
+                    preceding_ids.append(precondition)
+
+        villager = next((v for v in VILLAGER_ROSTER if v["name"] == npc_name), {"name": npc_name})
+        return {
+            "story_theme": story_theme,
+            "correctLocation": correct_location,
+            "difficulty": difficulty,
+            "villager": {k: villager[k] for k in ("name", "title", "backstory") if k in villager},
+            "other_villagers": [f"{v['name']} ({v['title']})" for v in VILLAGER_ROSTER if v["name"] != npc_name],
+            "nodes": [
+                {"node_id": node.node_id, "type": node.type, "key_clue": node.key_clue, "beat": node.beat, "preconditions": list(node.preconditions)}
+                for node in own
+            ],
+            "preceding": [
+                {"node_id": i, "villager_name": by_id[i].villager_name, "clue": by_id[i].content or by_id[i].beat}
+                for i in preceding_ids
+            ],
+        }
+
+    async def _request_batch_async(self, context: dict) -> Dict[str, str]:
+        try:
+            return self._parse_batch(context, await self.llm_api.generate_content_async("VillagerNodes", context))
+        except LLMError as e:
+            print(f"--- WORLD FILL: VillagerNodes call failed: {e} ---")
+            return {}
+
+    def _request_batch(self, context: dict) -> Dict[str, str]:
+        try:
+            return self._parse_batch(context, self.llm_api.generate_content("VillagerNodes", context))
+        except LLMError as e:
+            print(f"--- WORLD FILL: VillagerNodes call failed: {e} ---")
+            return {}
+
+    def _parse_batch(self, context: dict, text: str) -> Dict[str, str]:
+        wanted = {node["node_id"] for node in context["nodes"]}
+        try:
+            data = parse_llm_json("VillagerNodes", text)
+        except (ValueError, TypeError) as e:
+            print(f"--- WORLD FILL: could not parse VillagerNodes reply: {e} ---")
+            return {}
+        nodes = data.get("nodes", []) if isinstance(data, dict) else []
+        return {
+            node["node_id"]: node["content"]
+            for node in nodes
+            if isinstance(node, dict) and node.get("node_id") in wanted and isinstance(node.get("content"), str) and node["content"].strip()
+        }
+
+    def _missing(self, context: dict, contents: Dict[str, str]) -> list:
+        return [node for node in context["nodes"] if node["node_id"] not in contents]
+
+    def _finish_batch(self, nodes: List[QuestNode], npc_name: str, contents: Dict[str, str], retried: bool) -> Dict[str, str]:
+        fallback = 0
+        for node in nodes:
+            if node.villager_name == npc_name and node.content is None and node.node_id not in contents:
+                # Still nothing after the retry: the beat is a short but usable clue
+                contents[node.node_id] = node.beat or "I can't quite remember... ask around the village."
+                fallback += 1
+        outcome = "fallback" if fallback else ("retried" if retried else "ok")
+        METRICS.inc("echoes_world_fill_batches_total", outcome=outcome)
+        return contents
+
+    def _apply(self, nodes: List[QuestNode], contents: Dict[str, str]) -> Dict[str, str]:
+        applied = {}
+        for node in nodes:
+            if node.content is None and node.node_id in contents:
+                node.content = applied[node.node_id] = contents[node.node_id]
+                node.beat = None
+        return applied
+
+    def apply_contents(self, game_state, contents: Dict[str, str]):
+        """Fills the game's nodes that are still empty; nodes that already have text keep it."""
+        applied = self._apply(game_state.quest_network, contents)
+        if applied:
+            game_state.record_event("node_content", contents=applied)
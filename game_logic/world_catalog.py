@@ -0,0 +1,237 @@
+# game_logic/world_catalog.py
+# A read-only file of pre-built worlds, indexed by difficulty and location count, that /game/new picks from.
+
+import hashlib
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from . import fast_json
+from .llm_calls import canonical_difficulty
+from .llm_scheduler import llm_work
+from .metrics import METRICS
+from .state_manager import QuestNode, mark_shared, quest_nodes_from_dicts, unmark_shared
+
+# File layout (little-endian):
+#   header   MAGIC, index offset (u64), index length (u64)
+#   records  one zlib-compressed JSON world each, back to back
+#   tables   per key, `count` ENTRY structs: record offset (u64), record length (u32)
+#   index    JSON: {"format", "created", "worlds", "keys": {"medium:5": {"table": offset, "count": n}}}
+# Picking a world reads one ENTRY at table + i * ENTRY.size, so it costs the same for any catalog size.
+MAGIC = b"ECHOCAT1"
+HEADER = struct.Struct("<8sQQ")
+ENTRY = struct.Struct("<QI")
+FORMAT_VERSION = 1
+
+def catalog_key(difficulty: str, num_inaccessible_locations: int) -> str:
+    # Clients send difficulty in any case ("medium", "Medium")
+    return f"{str(difficulty).strip().lower()}:{int(num_inaccessible_locations)}"
+
+def encode_world(world: dict) -> bytes:
+    """A finished world (see GameEngine.generate_world_async) as a catalog record."""
+    return zlib.compress(fast_json.dumpb({
+        "story_theme": world.get("story_theme"),
+        "inaccessible_locations": list(world.get("inaccessible_locations") or []),
+        "correct_location": world.get("correct_location"),
+        "quest_network": {"nodes": [node.to_dict() for node in world["quest_network"]]},
+    }), 9)
+
+def decode_world(record: bytes) -> dict:
+    data = fast_json.loads(zlib.decompress(record))
+    return {
+        "story_theme": data["story_theme"],
+        # Tuples, so a game holding a shared world cannot grow or reorder it
+        "inaccessible_locations": tuple(data["inaccessible_locations"]),
+        "correct_location": data["correct_location"],
+        "quest_network": tuple(quest_nodes_from_dicts(data["quest_network"]["nodes"])),
+    }
+
+def world_problem(world: dict, num_inaccessible_locations: int) -> Optional[str]:
+    """Why a generated world should not go into a catalog, or None if it is fit to share."""
+    if not isinstance(world.get("story_theme"), str) or not world["story_theme"].strip():
+        return "no_story_theme"
+    locations = world.get("inaccessible_locations") or []
+    if len(locations) != num_inaccessible_locations or len(set(locations)) != len(locations):
+        return "wrong_locations"
+    if world.get("correct_location") not in locations:
+        return "correct_location_missing"
+    nodes: List[QuestNode] = world.get("quest_network") or []
+    # One node is the engine's fallback network, used when generation failed
+    if len(nodes) < 2:
+        return "fallback_network"
+    if any(not (node.content or "").strip() for node in nodes):
+        return "missing_clue_text"
+    if not any(node.key_clue for node in nodes):
+        return "no_key_clue"
+    return None
+
+async def generate_catalog_world(engine, difficulty: str, num_inaccessible_locations: int) -> Tuple[dict, Optional[str]]:
+    """
+    (world, problem): one world built the way live games build theirs, with every villager's
+    clues written, and why it is unfit for a catalog (None if it is fit).
+    """
+    with llm_work(priority="world"):
+        world = await engine.generate_world_async(num_inaccessible_locations, canonical_difficulty(difficulty))
+    return world, world_problem(world, num_inaccessible_locations)
+
+class WorldCatalogWriter:
+    """
+    Writes a catalog file. Records go to a temporary file next to `path`, which replaces
+    `path` only once close() has written the index, so a server never maps a half-written
+    catalog. Byte-identical worlds are stored once.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._tmp_path = f"{path}.tmp-{os.getpid()}"
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(HEADER.pack(MAGIC, 0, 0))
+        self._entries: Dict[str, List[Tuple[int, int]]] = {}
+        self._digests = set()
+        self.duplicates = 0
+
+    def add(self, difficulty: str, num_inaccessible_locations: int, world: dict) -> bool:
+        return self.add_record(catalog_key(difficulty, num_inaccessible_locations), encode_world(world))
+
+    def add_record(self, key: str, record: bytes) -> bool:
+        """Appends an encoded world under key. False if the key already has an identical world."""
+        digest = hashlib.sha1(key.encode() + b"\0" + record).digest()
+        if digest in self._digests:
+            self.duplicates += 1
+            return False
+        self._digests.add(digest)
+        offset = self._file.tell()
+        self._file.write(record)
+        self._entries.setdefault(key, []).append((offset, len(record)))
+        return True
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    def close(self):
+        keys = {}
+        for key, entries in sorted(self._entries.items()):
+            keys[key] = {"table": self._file.tell(), "count": len(entries)}
+            self._file.write(b"".join(ENTRY.pack(offset, length) for offset, length in entries))
+        index = fast_json.dumpb({"format": FORMAT_VERSION, "created": time.time(), "worlds": len(self), "keys": keys})
+        index_offset = self._file.tell()
+        self._file.write(index)
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, index_offset, len(index)))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self._tmp_path)
+
+class WorldCatalog:
+    """
+    A catalog file, memory-mapped read-only. Every gunicorn worker maps the same file, so
+    the operating system keeps one copy of it in its page cache however many workers run.
+
+    pick() returns a random world for a key without any LLM call. Decoded worlds are kept
+    in an LRU of `cache_worlds` and handed to every game that picks them: the quest
+    network is shared, not copied, and left out of each game's size (see mark_shared).
+    That is safe because catalog worlds are complete; nothing writes to their nodes.
+    """
+
+    def __init__(self, path: str, cache_worlds: int = 1024):
+        self.path = path
+        self.cache_worlds = max(1, cache_worlds)
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset, index_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a world catalog.")
+        index = fast_json.loads(self._mmap[index_offset:index_offset + index_length])
+        if index.get("format") != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} has catalog format {index.get('format')}; expected {FORMAT_VERSION}.")
+        self.created = index.get("created")
+        self._tables: Dict[str, Tuple[int, int]] = {key: (entry["table"], entry["count"]) for key, entry in index["keys"].items()}
+        self._cache: "OrderedDict[int, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return sum(count for _, count in self._tables.values())
+
+    def count(self, difficulty: str, num_inaccessible_locations: int) -> int:
+        return self._tables.get(catalog_key(difficulty, num_inaccessible_locations), (0, 0))[1]
+
+    def pick(self, difficulty: str, num_inaccessible_locations: int) -> Optional[dict]:
+        """A random world for this key, or None if the catalog has none."""
+        key = catalog_key(difficulty, num_inaccessible_locations)
+        table = self._tables.get(key)
+        if table is None:
+            self.misses[key] = self.misses.get(key, 0) + 1
+            METRICS.inc("echoes_world_catalog_picks_total", outcome="miss")
+            return None
+        table_offset, count = table
+        offset, length = ENTRY.unpack_from(self._mmap, table_offset + self._rng.randrange(count) * ENTRY.size)
+        self.hits[key] = self.hits.get(key, 0) + 1
+        METRICS.inc("echoes_world_catalog_picks_total", outcome="hit")
+        return self._world_at(offset, length)
+
+    def _world_at(self, offset: int, length: int) -> dict:
+        with self._lock:
+            world = self._cache.get(offset)
+            if world is not None:
+                self._cache.move_to_end(offset)
+                return world
+        world = decode_world(self._mmap[offset:offset + length])
+        with self._lock:
+            cached = self._cache.get(offset)
+            if cached is not None:
+                return cached
+            mark_shared(world["quest_network"], world["inaccessible_locations"], world["story_theme"])
+            self._cache[offset] = world
+            while len(self._cache) > self.cache_worlds:
+                # Games still holding it keep it alive; from now on each of them is charged for it
+                _, evicted = self._cache.popitem(last=False)
+                unmark_shared(evicted["quest_network"], evicted["inaccessible_locations"], evicted["story_theme"])
+        return world
+
+    def records(self) -> Iterator[Tuple[str, bytes]]:
+        """Every (key, encoded world) in the file, e.g. to carry them into a new catalog."""
+        for key, (table_offset, count) in self._tables.items():
+            for i in range(count):
+                offset, length = ENTRY.unpack_from(self._mmap, table_offset + i * ENTRY.size)
+                yield key, self._mmap[offset:offset + length]
+
+    def close(self):
+        with self._lock:
+            for world in self._cache.values():
+                unmark_shared(world["quest_network"], world["inaccessible_locations"], world["story_theme"])
+            self._cache.clear()
+        self._mmap.close()
+
+    def stats(self) -> dict:
+        keys = set(self._tables) | set(self.misses)
+        return {
+            "path": self.path,
+            "worlds": len(self),
+            "bytes": len(self._mmap),
+            "decoded_worlds": len(self._cache),
+            "hits": sum(self.hits.values()),
+            "misses": sum(self.misses.values()),
+            "keys": [
+                {"key": key, "worlds": self._tables.get(key, (0, 0))[1], "hits": self.hits.get(key, 0), "misses": self.misses.get(key, 0)}
+                for key in sorted(keys)
+            ],
+        }
@@ -0,0 +1,124 @@
+# game_logic/world_pool.py
+# Keeps a stock of pre-generated worlds so /game/new can answer without waiting on the LLM.
+
+import asyncio
+import traceback
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from .llm_calls import canonical_difficulty
+from .llm_scheduler import LLM_PRIORITY
+
+PoolKey = Tuple[str, int]  # (lowercased difficulty, num_inaccessible_locations)
+
+def pool_key(difficulty: str, num_inaccessible_locations: int) -> PoolKey:
+    # Clients send difficulty in any case ("medium", "Medium")
+    return (str(difficulty).strip().lower(), int(num_inaccessible_locations))
+
+class WorldPool:
+    """
+    A per-key stock of ready-made worlds (see GameEngine.generate_world_async).
+
+    Every configured key has a target size. Background refill workers top the stock
+    back up whenever a world is taken, so /game/new only pays for live generation
+    when the pool for its key is empty (or the key is not configured at all).
+    """
+
+    def __init__(self, engine, targets: Dict[PoolKey, int], workers_per_key: int = 1, retry_delay: float = 5.0):
+        self.engine = engine
+        self.targets = {pool_key(*key): size for key, size in targets.items() if size > 0}
+        self.workers_per_key = max(1, workers_per_key)
+        self.retry_delay = retry_delay
+
+        self._worlds: Dict[PoolKey, deque] = {key: deque() for key in self.targets}
+        self._in_progress: Dict[PoolKey, int] = {key: 0 for key in self.targets}
+        self._wakeups: Dict[PoolKey, asyncio.Event] = {}
+        self._workers = []
+        self._stopping = False
+
+        self.hits: Dict[PoolKey, int] = {}
+        self.misses: Dict[PoolKey, int] = {}
+
+    def start(self):
+        """Launches the refill workers on the running event loop."""
+        for key in self.targets:
+            self._wakeups[key] = asyncio.Event()
+            for _ in range(self.workers_per_key):
+                self._workers.append(asyncio.create_task(self._refill_worker(key)))
+        print(f"World pool started with targets: {self.targets}")
+
+    async def stop(self):
+        # A cancel can be lost when it lands just as a call inside asyncio.wait_for finishes
+        # (Python 3.11), so workers also stop on the flag once they are woken
+        self._stopping = True
+        for worker in self._workers:
+            worker.cancel()
+        for wakeup in self._wakeups.values():
+            wakeup.set()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def take(self, difficulty: str, num_inaccessible_locations: int) -> Optional[dict]:
+        """Returns a ready world for this key, or None if the caller must generate one live."""
+        key = pool_key(difficulty, num_inaccessible_locations)
+        worlds = self._worlds.get(key)
+        if not worlds:
+            self.misses[key] = self.misses.get(key, 0) + 1
+            self._wake(key)
+            return None
+
+        self.hits[key] = self.hits.get(key, 0) + 1
+        world = worlds.popleft()
+        self._wake(key)
+        return world
+
+    def stats(self) -> dict:
+        keys = set(self.targets) | set(self.hits) | set(self.misses)
+        return {
+            "hits": sum(self.hits.values()),
+            "misses": sum(self.misses.values()),
+            "pools": [
+                {
+                    "difficulty": difficulty,
+                    "num_inaccessible_locations": num_locations,
+                    "target": self.targets.get((difficulty, num_locations), 0),
+                    "ready": len(self._worlds.get((difficulty, num_locations), ())),
+                    "in_progress": self._in_progress.get((difficulty, num_locations), 0),
+                    "hits": self.hits.get((difficulty, num_locations), 0),
+                    "misses": self.misses.get((difficulty, num_locations), 0),
+                }
+                for difficulty, num_locations in sorted(keys)
+            ],
+        }
+
+    def _wake(self, key: PoolKey):
+        wakeup = self._wakeups.get(key)
+        if wakeup:
+            wakeup.set()
+
+    def _needs_refill(self, key: PoolKey) -> bool:
+        return len(self._worlds[key]) + self._in_progress[key] < self.targets[key]
+
+    async def _refill_worker(self, key: PoolKey):
+        difficulty, num_locations = key
+        wakeup = self._wakeups[key]
+        # Refills only matter for future games; live turns and world builds go first
+        LLM_PRIORITY.set("background")
+        while not self._stopping:
+            if not self._needs_refill(key):
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+
+            self._in_progress[key] += 1
+            try:
+                world = await self.engine.generate_world_async(num_locations, canonical_difficulty(difficulty))
+                self._worlds[key].append(world)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"--- WORLD POOL: refill for {key} failed: {e} ---")
+                traceback.print_exc()
+                await asyncio.sleep(self.retry_delay)
+            finally:
+                self._in_progress[key] -= 1
@@ -0,0 +1,114 @@
+# llm_stub_server.py
+# A local stand-in for an OpenAI-compatible inference server, answering with FakeLLM's canned replies.
+#
+# Start it, then route prompt types to it (see LLM_BACKENDS and LLM_ROUTES in config.py):
+#   python llm_stub_server.py --port 8081 --latency-ms 200
+#   LLM_BACKENDS=local=http://127.0.0.1:8081/v1 LLM_BACKENDS_WITH_CONTEXT=local \
+#   LLM_ROUTES="Interaction=gemini:gemini-2.5-flash-lite>local:stub" uvicorn main:app
+#
+# Serves POST /v1/chat/completions (plain and streamed as server-sent events) and GET /v1/models.
+# Replies are built from the "echoes_context" field the server sends to backends listed in
+# LLM_BACKENDS_WITH_CONTEXT; without it they are generic. Latency, errors and malformed output
+# follow the FakeLLM flags below, so a chain's fallback and load shedding can be exercised offline.
+
+import argparse
+import asyncio
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from game_logic import fast_json
+from game_logic.fake_llm import FakeLLM
+from game_logic.memory import estimate_tokens
+
+STUB_MODELS = ("stub",)
+
+def create_app(fake_llm: FakeLLM) -> FastAPI:
+    app = FastAPI(title="Village of Echoes LLM stub")
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": model, "object": "model", "owned_by": "echoes"} for model in STUB_MODELS]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request, x_echoes_prompt_type: str = Header("Interaction")):
+        body = fast_json.loads(await request.body())
+        prompt = "".join(message.get("content") or "" for message in body.get("messages") or [])
+        context = body.get("echoes_context") or _generic_context(x_echoes_prompt_type)
+        try:
+            delay, text = fake_llm._plan_reply(x_echoes_prompt_type, context)
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Unknown prompt type '{x_echoes_prompt_type}'.")
+        except RuntimeError as e:
+            # FakeLLM's injected provider error
+            raise HTTPException(status_code=503, detail=str(e))
+        model = body.get("model") or STUB_MODELS[0]
+        usage = {"prompt_tokens": estimate_tokens(prompt), "completion_tokens": estimate_tokens(text)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        if body.get("stream"):
+            return StreamingResponse(_stream(completion_id, model, text, delay, usage), media_type="text/event-stream")
+        await asyncio.sleep(delay)
+        return JSONResponse({
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    return app
+
+async def _stream(completion_id: str, model: str, text: str, delay: float, usage: dict):
+    """The reply in a handful of chunks, like FakeLLM's own streaming, then the usage and [DONE]."""
+    def event(delta: dict, finish_reason=None, **extra) -> bytes:
+        chunk = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+            **extra,
+        }
+        return b"data: " + fast_json.dumpb(chunk) + b"\n\n"
+
+    chunk_size = max(1, len(text) // 8)
+    chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+    await asyncio.sleep(delay / 3)
+    yield event({"role": "assistant", "content": ""})
+    for chunk in chunks:
+        yield event({"content": chunk})
+        await asyncio.sleep(delay * 2 / 3 / len(chunks))
+    yield event({}, finish_reason="stop")
+    yield event(None, usage=usage)
+    yield b"data: [DONE]\n\n"
+
+def _generic_context(prompt_type: str) -> dict:
+    """Just enough context for FakeLLM to answer a prompt type when the caller sent none."""
+    villagers = [{"name": name, "title": "Villager"} for name in ("Arthur Hobbs", "Old Mara", "Nia")]
+    world = {"difficulty": "Medium", "villagers": villagers, "correctLocation": "The Old Mill", "story_theme": ""}
+    return {
+        "StoryGenerator": {"num_inaccessible_locations": 3},
+        "WorldBuilder": world,
+        "WorldSkeleton": world,
+        "VillagerNodes": {**world, "villager": villagers[0], "nodes": [], "preceding": [], "other_villagers": []},
+        "Interaction": {"context_node": None, "villagerProfile": villagers[0]},
+    }.get(prompt_type, {})
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server for Village of Echoes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Median reply latency for an Interaction call.")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of the latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with HTTP 503.")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of calls answered with non-JSON text.")
+    args = parser.parse_args()
+
+    fake_llm = FakeLLM(
+        seed=args.seed, latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate, malformed_rate=args.malformed_rate,
+    )
+    uvicorn.run(create_app(fake_llm), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
 # main.py
 # This script runs the FastAPI server, exposing the game engine through API endpoints.
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import asyncio
+import re
+import secrets
+import time
 import uuid
 import os
 import traceback
@@ -12,15 +16,41 @@ from dotenv import load_dotenv
 
 from schemas import *
 from game_logic.engine import GameEngine
-from game_logic.state_manager import GameState
+from game_logic.world_pool import WorldPool
+from game_logic.world_catalog import WorldCatalog
+from game_logic.game_store import GameConflictError, GameStore, commit_turn, create_game_store
+from game_logic.event_log import DurableGameStore, GameEventLog
+from game_logic.fake_llm import FakeLLM
+from game_logic.idempotency import IdempotencyCache, IdempotencyKeyReused
+from game_logic.recording import ReplayLLM, ReplayGameMiddleware, SessionRecorder, SessionRecordingMiddleware
+from game_logic.metrics import METRICS
+from game_logic import fast_json
+from game_logic.llm_resilience import LLMError, LLMUnavailableError
+from game_logic.llm_scheduler import LLMOverloadedError, llm_work, PRIORITIES
+from config import (
+    LLM_BACKEND, FAKE_LLM_SEED, FAKE_LLM_LATENCY_MS, FAKE_LLM_LATENCY_SIGMA, FAKE_LLM_ERROR_RATE, FAKE_LLM_MALFORMED_RATE,
+    WORLD_POOL_TARGETS, WORLD_POOL_WORKERS_PER_KEY, WORLD_CATALOG_PATH, WORLD_CATALOG_CACHE_WORLDS,
+    GAME_STORE_BACKEND, GAME_STORE_MAX_GAMES, GAME_STORE_MAX_BYTES, GAME_STORE_TTL_SECONDS,
+    GAME_STORE_SQLITE_PATH, GAME_STORE_SHARDS, GAME_STORE_SHARD_BACKEND,
+    GAME_EVENT_LOG_PATH, GAME_EVENT_LOG_SNAPSHOT_EVERY, GAME_EVENT_LOG_FLUSH_MS,
+    LLM_RECORD_PATH, LLM_REPLAY_PATH, LLM_REPLAY_LATENCY_SCALE, INTERACT_BATCH_MAX_ITEMS, ADMIN_TOKEN,
+    GAME_COMMIT_MAX_ATTEMPTS, IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_MAX_KEYS,
+)
 
 # ... (startup code remains the same) ...
 
 # Load environment variables from a .env file if it exists
 load_dotenv()
 
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse rendered by the fast JSON backend, recording how long that takes."""
+
+    def render(self, content) -> bytes:
+        with METRICS.span("response_serialize"):
+            return fast_json.dumpb(content)
+
 # Initialize the FastAPI app and the Game Engine
-app = FastAPI()
+app = FastAPI(default_response_class=TimedJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -28,41 +58,209 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Captures LLM calls and player requests for replay.py when LLM_RECORD_PATH is set
+session_recorder = SessionRecorder(LLM_RECORD_PATH) if LLM_RECORD_PATH else None
+if session_recorder is not None:
+    app.add_middleware(SessionRecordingMiddleware, recorder=session_recorder)
+if LLM_BACKEND == "replay":
+    app.add_middleware(ReplayGameMiddleware)
 API_KEY = os.environ.get("GOOGLE_API_KEY")
 game_engine: GameEngine
-active_games: Dict[str, GameState] = {}
+world_pool: WorldPool
+world_catalog: Optional[WorldCatalog] = None
+game_store: GameStore = create_game_store(
+    backend=GAME_STORE_BACKEND,
+    max_games=GAME_STORE_MAX_GAMES,
+    max_bytes=GAME_STORE_MAX_BYTES,
+    ttl_seconds=GAME_STORE_TTL_SECONDS,
+    sqlite_path=GAME_STORE_SQLITE_PATH,
+    num_shards=GAME_STORE_SHARDS,
+    shard_backend=GAME_STORE_SHARD_BACKEND,
+)
+# SQLite stores already keep every game on disk; only stores that lose games with the process get the log
+if GAME_EVENT_LOG_PATH and not game_store.durable:
+    game_store = DurableGameStore(
+        game_store,
+        GameEventLog(GAME_EVENT_LOG_PATH, flush_interval=GAME_EVENT_LOG_FLUSH_MS / 1000.0, ttl_seconds=GAME_STORE_TTL_SECONDS),
+        snapshot_every=GAME_EVENT_LOG_SNAPSHOT_EVERY,
+    )
+idempotency_cache = IdempotencyCache(ttl_seconds=IDEMPOTENCY_TTL_SECONDS, max_keys=IDEMPOTENCY_MAX_KEYS)
 
 @app.on_event("startup")
 async def startup_event():
     """Initializes the game engine on server startup."""
-    global game_engine
+    global game_engine, world_pool, world_catalog
     print("--- Server Startup ---")
-    if not API_KEY or API_KEY == "YOUR_GOOGLE_API_KEY_HERE":
+    llm_api = None
+    if LLM_BACKEND == "fake":
+        print("LLM_BACKEND=fake: serving canned LLM replies, no Gemini calls will be made.")
+        llm_api = FakeLLM(
+            seed=FAKE_LLM_SEED,
+            latency_ms=FAKE_LLM_LATENCY_MS,
+            latency_sigma=FAKE_LLM_LATENCY_SIGMA,
+            error_rate=FAKE_LLM_ERROR_RATE,
+            malformed_rate=FAKE_LLM_MALFORMED_RATE,
+        )
+    elif LLM_BACKEND == "replay":
+        print(f"LLM_BACKEND=replay: serving the LLM responses recorded in {LLM_REPLAY_PATH}.")
+        llm_api = ReplayLLM(LLM_REPLAY_PATH, latency_scale=LLM_REPLAY_LATENCY_SCALE)
+    elif not API_KEY or API_KEY == "YOUR_GOOGLE_API_KEY_HERE":
         print("!!! FATAL ERROR: API Key not found. Please set the GOOGLE_API_KEY environment variable. !!!")
         sys.exit("API Key is not configured. Shutting down.")
-    
-    print("API Key found. Initializing Game Engine...")
-    game_engine = GameEngine(api_key=API_KEY)
+    else:
+        print("API Key found. Initializing Game Engine...")
+    game_engine = GameEngine(api_key=API_KEY, llm_api=llm_api)
     if not game_engine.llm_api.model:
         sys.exit("Failed to initialize Gemini Model. Please check your API key and network connection.")
+    game_engine.llm_api.recorder = session_recorder
     print("Game Engine initialized successfully.")
 
+    if WORLD_CATALOG_PATH:
+        world_catalog = WorldCatalog(WORLD_CATALOG_PATH, cache_worlds=WORLD_CATALOG_CACHE_WORLDS)
+        print(f"World catalog mapped: {len(world_catalog)} worlds from {WORLD_CATALOG_PATH}.")
+    world_pool = WorldPool(game_engine, WORLD_POOL_TARGETS, workers_per_key=WORLD_POOL_WORKERS_PER_KEY)
+    world_pool.start()
+    METRICS.add_collector(_collect_component_metrics)
+
+def _collect_component_metrics():
+    """Exposes world pool and game store numbers on /metrics."""
+    for pool in world_pool.stats()["pools"]:
+        labels = {"difficulty": pool["difficulty"], "num_inaccessible_locations": pool["num_inaccessible_locations"]}
+        yield ("echoes_world_pool_hits_total", "counter", labels, pool["hits"])
+        yield ("echoes_world_pool_misses_total", "counter", labels, pool["misses"])
+        yield ("echoes_world_pool_ready", "gauge", labels, pool["ready"])
+    yield ("echoes_llm_breaker_open", "gauge", {}, 0 if game_engine.llm_api.breaker.state == "closed" else 1)
+    scheduler = game_engine.llm_api.scheduler.stats()
+    for priority in PRIORITIES:
+        yield ("echoes_llm_queue_depth", "gauge", {"priority": priority}, scheduler["queued"][priority])
+    yield ("echoes_llm_in_flight", "gauge", {}, scheduler["in_flight"])
+    response_cache = game_engine.llm_api.response_cache
+    for prompt_type in response_cache.stats_counts:
+        yield ("echoes_llm_cache_hit_ratio", "gauge", {"prompt_type": prompt_type}, response_cache.hit_ratio(prompt_type))
+    yield ("echoes_llm_cache_bytes", "gauge", {"tier": "memory"}, response_cache.memory.bytes)
+    if response_cache.disk is not None:
+        yield ("echoes_llm_cache_bytes", "gauge", {"tier": "disk"}, response_cache.disk.bytes)
+    store_stats = game_store.stats()
+    for shard_index, shard in enumerate(store_stats.get("shards", [store_stats])):
+        for field in ("games", "bytes", "evictions"):
+            if field in shard:
+                yield (f"echoes_store_{field}", "gauge", {"backend": shard["backend"], "shard": shard_index}, shard[field])
+
+@app.middleware("http")
+async def record_request_timing(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not the raw path, so game ids don't explode the series count
+    route = request.scope.get("route")
+    METRICS.observe(
+        "echoes_http_request_seconds", time.perf_counter() - started,
+        route=getattr(route, "path", "unmatched"), method=request.method, status=response.status_code,
+    )
+    return response
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stops the background world pool refill workers and flushes the game store."""
+    await world_pool.stop()
+    if world_catalog is not None:
+        world_catalog.close()
+    game_store.close()
+    game_engine.llm_api.response_cache.close()
+    if session_recorder is not None:
+        session_recorder.close()
+
 @app.get("/ping/")
 async def ping():
     """A simple ping endpoint to confirm the server is running."""
     return {"status": "ok", "message": "Village of Echoes API is running"}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text-format metrics for this worker process."""
+    return PlainTextResponse(METRICS.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/pool/stats/")
+async def pool_stats():
+    """Reports pre-generated world pool levels and hit/miss counters."""
+    return world_pool.stats()
+
+@app.get("/catalog/stats/")
+async def catalog_stats():
+    """Reports the world catalog's worlds per key and how often each key was picked."""
+    if world_catalog is None:
+        raise HTTPException(status_code=404, detail="No world catalog is configured (WORLD_CATALOG_PATH).")
+    return world_catalog.stats()
+
+@app.get("/llm/stats/")
+async def llm_stats():
+    """Reports the LLM circuit breaker state and recent outcomes, the scheduler queue, the response cache and routing."""
+    return {
+        **game_engine.llm_api.breaker.stats(),
+        "scheduler": game_engine.llm_api.scheduler.stats(),
+        "response_cache": game_engine.llm_api.response_cache.stats(),
+        "routing": game_engine.llm_api.router.stats(),
+    }
+
+@app.get("/store/stats/")
+async def store_stats():
+    """Reports how many games the game-state store is holding."""
+    return game_store.stats()
+
+@app.get("/idempotency/stats/")
+async def idempotency_stats():
+    """Reports how many requests carrying an Idempotency-Key were coalesced or replayed."""
+    return idempotency_cache.stats()
+
+@app.get("/speculation/stats/")
+async def speculation_stats():
+    """Reports speculative reply hits, misses and waste (SPECULATION_ENABLED=1 only)."""
+    if game_engine.speculator is None:
+        return {"enabled": False}
+    return {"enabled": True, **game_engine.speculator.stats()}
+
+async def _idempotent(key: Optional[str], scope: str, request, response: Response, handler):
+    """
+    Runs handler once per Idempotency-Key: a retry with the same key gets the first
+    attempt's result, or waits for it while it is still running, instead of starting
+    another LLM call. Without a key the handler simply runs.
+    """
+    if key is None:
+        return await handler()
+    if not 0 < len(key) <= 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be 1 to 255 characters.")
+    try:
+        result, outcome = await idempotency_cache.run(
+            f"{scope}:{key}", IdempotencyCache.fingerprint(request.model_dump()), handler,
+        )
+    except IdempotencyKeyReused:
+        raise HTTPException(status_code=422, detail="This Idempotency-Key was already used for a different request.")
+    if outcome != "new":
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
 @app.post("/game/new", response_model=NewGameResponse)
-async def create_new_game(request: NewGameRequest):
+async def create_new_game(request: NewGameRequest, response: Response, idempotency_key: Optional[str] = Header(None)):
+    return await _idempotent(idempotency_key, "/game/new", request, response, lambda: _create_new_game(request))
+
+async def _create_new_game(request: NewGameRequest) -> NewGameResponse:
     game_id = str(uuid.uuid4())
     try:
         # num_villagers is no longer needed as the engine uses the full roster
-        game_state = game_engine.start_new_game(
-            game_id=game_id,
-            num_inaccessible_locations=request.num_inaccessible_locations,
-            difficulty=request.difficulty
-        )
-        active_games[game_id] = game_state
+        world = world_catalog.pick(request.difficulty, request.num_inaccessible_locations) if world_catalog is not None else None
+        if world is None:
+            world = world_pool.take(request.difficulty, request.num_inaccessible_locations)
+        if world is None:
+            # Pool is empty (or not configured) for this key; fall back to live generation
+            # Returns once the skeleton is ready; villagers' clues are written in the background
+            with llm_work(priority="world", game_id=game_id):
+                world = await game_engine.generate_world_async(
+                    num_inaccessible_locations=request.num_inaccessible_locations,
+                    difficulty=request.difficulty,
+                    lazy=True,
+                )
+        game_state = game_engine.build_game_state(game_id, request.difficulty, world)
+        game_store.put(game_state)
+        game_engine.start_world_fill(game_state)
         
         initial_villagers = [
             {"id": f"villager_{i}", "title": v["title"]} 
@@ -75,32 +273,83 @@ async def create_new_game(request: NewGameRequest):
             inaccessible_locations=game_state.inaccessible_locations,
             villagers=initial_villagers
         )
+    except LLMError as e:
+        raise _llm_unavailable(e)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to generate new game: {e}")
 
+def _llm_unavailable(error: LLMError) -> HTTPException:
+    """Maps a typed LLM failure to 503 (429 when the LLM queue is full), with Retry-After."""
+    if isinstance(error, LLMOverloadedError):
+        return HTTPException(
+            status_code=429,
+            detail="The storyteller is busy; try again shortly.",
+            headers={"Retry-After": str(int(error.retry_after + 0.999))},
+        )
+    retry_after = error.retry_after if isinstance(error, LLMUnavailableError) and error.retry_after else 5
+    return HTTPException(
+        status_code=503,
+        detail=f"The storyteller is unavailable right now: {error}",
+        headers={"Retry-After": str(int(retry_after + 0.999))},
+    )
+
 # ... (the rest of the endpoints remain the same) ...
+VILLAGER_ID_PATTERN = re.compile(r"villager_(\d+)", re.ASCII)
+
+def _resolve_turn(game_state, request: InteractRequest):
+    """Resolves the villager and player input for an interaction request."""
+    match = VILLAGER_ID_PATTERN.fullmatch(request.villager_id)
+    villager_index = int(match.group(1)) if match else -1
+    if not (0 <= villager_index < len(game_state.villagers)):
+        raise HTTPException(status_code=400, detail="Invalid villager ID.")
+
+    villager_name = game_state.villagers[villager_index]["name"]
+    player_input = request.player_prompt if request.player_prompt is not None else "I'd like to talk."
+    return villager_name, player_input
+
+def _prepare_turn(game_state, request: InteractRequest):
+    """Resolves the villager, player input and frustration for an interaction request."""
+    villager_name, player_input = _resolve_turn(game_state, request)
+    return villager_name, player_input, game_engine.get_frustration(game_state, villager_name)
+
+def _commit(game_state, turn):
+    """
+    Applies a played turn and writes the game: the only step of a turn that has to be
+    exclusive, and a short one (see commit_turn). 404 if the game expired meanwhile,
+    409 if other writers kept changing it.
+    """
+    try:
+        committed = commit_turn(
+            game_store, game_state, turn.read_version,
+            lambda target: game_engine.commit_interaction_turn(target, turn),
+            max_attempts=GAME_COMMIT_MAX_ATTEMPTS,
+        )
+    except GameConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
+    if committed is None:
+        raise HTTPException(status_code=404, detail="Game not found")
+    return committed
+
 @app.post("/game/{game_id}/interact", response_model=InteractResponse)
-async def interact(game_id: str, request: InteractRequest):
-    if game_id not in active_games:
+async def interact(game_id: str, request: InteractRequest, response: Response, idempotency_key: Optional[str] = Header(None)):
+    return await _idempotent(
+        idempotency_key, f"/game/{game_id}/interact", request, response, lambda: _interact(game_id, request),
+    )
+
+async def _interact(game_id: str, request: InteractRequest) -> InteractResponse:
+    game_state = game_store.get(game_id)
+    if game_state is None:
         raise HTTPException(status_code=404, detail="Game not found")
     
-    game_state = active_games[game_id]
-    
     try:
-        villager_index = int(request.villager_id.split('_')[1])
-        if not (0 <= villager_index < len(game_state.villagers)):
-            raise HTTPException(status_code=400, detail="Invalid villager ID.")
-            
-        villager_name = game_state.villagers[villager_index]["name"]
-        # FIX: Add a check to ensure msg.get('content') is not None before calling .lower()
-        frustration = {"friends": len([
-            msg for msg in game_state.full_npc_memory.get(villager_name, [])
-            if msg.get("content") and "friend" in msg.get("content").lower()
-        ])}
-        player_input = request.player_prompt if request.player_prompt is not None else "I'd like to talk."
-
-        dialogue_data = game_engine.process_interaction_turn(game_state, villager_name, player_input, frustration)
+        villager_name, player_input, frustration = _prepare_turn(game_state, request)
+
+        with llm_work(priority="interactive", game_id=game_id):
+            # The model is called with nothing held; _commit writes the turn once it is ready
+            dialogue_data = await game_engine.process_interaction_turn_async(
+                game_state, villager_name, player_input, frustration, commit=_commit,
+            )
         
         if not dialogue_data:
              raise HTTPException(status_code=500, detail="LLM failed to generate valid dialogue.")
@@ -111,21 +360,153 @@ async def interact(game_id: str, request: InteractRequest):
             npc_dialogue=dialogue_data.get("npc_dialogue"),
             player_suggestions=dialogue_data.get("player_responses")
         )
+    except HTTPException:
+        raise
+    except LLMError as e:
+        raise _llm_unavailable(e)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Interaction failed: {e}")
 
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {fast_json.dumps(data)}\n\n"
+
+@app.post("/game/{game_id}/interact/stream")
+async def interact_stream(game_id: str, request: InteractRequest):
+    """
+    Server-Sent Events version of /interact. Emits "token" events carrying npc_dialogue text
+    as it is generated, then one "final" event with the suggestions, revealed node,
+    familiarity and timings (time-to-first-token and total), or an "error" event.
+    """
+    game_state = game_store.get(game_id)
+    if game_state is None:
+        raise HTTPException(status_code=404, detail="Game not found")
+    villager_name, player_input, frustration = _prepare_turn(game_state, request)
+
+    async def event_stream():
+        try:
+            with llm_work(priority="interactive", game_id=game_id):
+                async for event in game_engine.stream_interaction_turn(
+                    game_state, villager_name, player_input, frustration, commit=_commit,
+                ):
+                    if event[0] == "token":
+                        yield _sse_event("token", {"text": event[1]})
+                        continue
+                    # The turn has been committed, to committed_state
+                    _, dialogue_data, timings, committed_state = event
+                    yield _sse_event("final", {
+                        "villager_id": request.villager_id,
+                        "villager_name": villager_name,
+                        "npc_dialogue": dialogue_data.get("npc_dialogue"),
+                        "player_suggestions": dialogue_data.get("player_responses"),
+                        "node_revealed_id": dialogue_data.get("node_revealed_id"),
+                        "familiarity": committed_state.player_state.familiarity.get(villager_name, 0),
+                        "timings": timings,
+                    })
+        except LLMOverloadedError as e:
+            yield _sse_event("error", {"detail": "The storyteller is busy; try again shortly.", "retry_after": e.retry_after})
+        except HTTPException as e:
+            yield _sse_event("error", {"detail": e.detail, "status_code": e.status_code})
+        except Exception as e:
+            traceback.print_exc()
+            yield _sse_event("error", {"detail": f"Interaction failed: {e}"})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# ---------- batch interactions ---------- #
+
+def _check_batch_size(count: int):
+    if count > INTERACT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch holds at most {INTERACT_BATCH_MAX_ITEMS} interactions.")
+
+def _batch_error(villager_id: str, error: Exception) -> BatchInteractResult:
+    """The per-item equivalent of the error response /interact would have sent."""
+    if isinstance(error, LLMError):
+        error = _llm_unavailable(error)
+    if isinstance(error, HTTPException):
+        retry_after = (error.headers or {}).get("Retry-After")
+        return BatchInteractResult(
+            villager_id=villager_id, status_code=error.status_code, error=str(error.detail),
+            retry_after=float(retry_after) if retry_after else None,
+        )
+    print(f"--- BATCH: turn with {villager_id} failed: {error!r} ---")
+    return BatchInteractResult(villager_id=villager_id, status_code=500, error=f"Interaction failed: {error}")
+
+async def _play_batch(game_id: str, interactions: List[InteractRequest]) -> List[BatchInteractResult]:
+    """Plays one game's share of a batch, committing each turn as its reply arrives."""
+    game_state = game_store.get(game_id)
+    if game_state is None:
+        return [_batch_error(item.villager_id, HTTPException(status_code=404, detail="Game not found")) for item in interactions]
+
+    results: List[Optional[BatchInteractResult]] = [None] * len(interactions)
+    turns, positions = [], []
+    for index, item in enumerate(interactions):
+        try:
+            turns.append(_resolve_turn(game_state, item))
+            positions.append(index)
+        except HTTPException as e:
+            results[index] = _batch_error(item.villager_id, e)
+
+    with llm_work(priority="interactive", game_id=game_id):
+        outcomes = await game_engine.process_interaction_batch_async(game_state, turns, commit=_commit)
+    for index, (villager_name, _), outcome in zip(positions, turns, outcomes):
+        villager_id = interactions[index].villager_id
+        if isinstance(outcome, Exception):
+            results[index] = _batch_error(villager_id, outcome)
+        else:
+            results[index] = BatchInteractResult(villager_id=villager_id, status_code=200, response=InteractResponse(
+                villager_id=villager_id,
+                villager_name=villager_name,
+                npc_dialogue=outcome.get("npc_dialogue"),
+                player_suggestions=outcome.get("player_responses"),
+            ))
+    return results
+
+@app.post("/game/{game_id}/interact/batch", response_model=BatchInteractResponse)
+async def interact_batch(game_id: str, request: BatchInteractRequest):
+    """
+    Several interactions in one request. Turns with different villagers run concurrently,
+    turns with the same villager in order, and repeated turns are played once. Each item
+    gets its own result, with the status code /interact would have returned for it.
+    """
+    _check_batch_size(len(request.interactions))
+    if game_store.get(game_id) is None:
+        raise HTTPException(status_code=404, detail="Game not found")
+    return BatchInteractResponse(game_id=game_id, results=await _play_batch(game_id, request.interactions))
+
+def _require_admin(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if token is None or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+@app.post("/admin/interact/batch", response_model=MultiGameInteractResponse)
+async def admin_interact_batch(request: MultiGameInteractRequest, x_admin_token: Optional[str] = Header(None)):
+    """/interact/batch across several games (bot-driven QA, kiosks); the games are played concurrently."""
+    _require_admin(x_admin_token)
+    _check_batch_size(len(request.interactions))
+    by_game: Dict[str, List[int]] = {}
+    for index, item in enumerate(request.interactions):
+        by_game.setdefault(item.game_id, []).append(index)
+
+    game_results = await asyncio.gather(*(
+        _play_batch(game_id, [request.interactions[index] for index in indexes]) for game_id, indexes in by_game.items()
+    ))
+    results: List[Optional[MultiGameInteractResult]] = [None] * len(request.interactions)
+    for (game_id, indexes), batch in zip(by_game.items(), game_results):
+        for index, result in zip(indexes, batch):
+            results[index] = MultiGameInteractResult(game_id=game_id, **result.model_dump())
+    return MultiGameInteractResponse(results=results)
+
 @app.post("/game/{game_id}/guess", response_model=GuessResponse)
 async def guess(game_id: str, request: GuessRequest):
-    if game_id not in active_games:
+    game_state = game_store.get(game_id)
+    if game_state is None:
         raise HTTPException(status_code=404, detail="Game not found")
     
-    game_state = active_games[game_id]
     is_correct = request.location_name == game_state.correct_location
     
-    key_clues = [node['node_id'] for node in game_state.quest_network.get('nodes', []) if node.get('key_clue')]
-    discovered_key_clues = [node_id for node_id in game_state.player_state['discovered_nodes'] if node_id in key_clues]
-    is_true_ending = len(discovered_key_clues) == len(key_clues)
+    is_true_ending = game_engine.get_quest_index(game_state).all_key_clues_discovered()
 
     message = ""
     if is_correct:
@@ -0,0 +1,194 @@
+# replay.py
+# Replays a recorded session (see game_logic/recording.py) against main.app in-process, with the
+# recorded LLM responses standing in for the model.
+#
+# Record a session against the live model (single worker):
+#   LLM_RECORD_PATH=data/session.jsonl.gz uvicorn main:app
+# Replay it ten times faster, with at most 20 games in flight:
+#   python replay.py data/session.jsonl.gz --speedup 10 --concurrency 20
+#
+# Every request is sent at its recorded offset divided by --speedup (or as soon as the previous
+# request of its game has finished, if that is later). LLM latency is the recorded latency
+# times --latency-scale (1/--speedup by default). Reports requests/s, per-endpoint latency next
+# to the recorded latency, LLM tokens by prompt type, and how many LLM calls matched the recording.
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+from benchmark import ASGIClient, LatencyRecorder, percentile
+
+PROMPT_TYPES = ("StoryGenerator", "WorldBuilder", "WorldSkeleton", "VillagerNodes", "Interaction")
+_GAME_PATH = re.compile(r"^/game/([^/]+)(/.*)$")
+
+def endpoint_label(path: str) -> str:
+    """"/game/<id>/interact" -> "/interact", matching benchmark.py's report."""
+    match = _GAME_PATH.match(path)
+    return match.group(2) if match and path != "/game/new" else path
+
+def build_sessions(records: list) -> list:
+    """
+    Groups the recorded requests into games: a /game/new and every later request on the id
+    it returned, in recorded order. Requests for games created before the recording started
+    cannot be replayed and are dropped.
+    """
+    sessions, by_game = [], {}
+    for record in sorted((r for r in records if r["kind"] == "http"), key=lambda r: r["t"]):
+        if record["path"] == "/game/new":
+            session = {"start": record["t"], "game_id": record.get("game_id"), "requests": [record]}
+            sessions.append(session)
+            if record.get("game_id"):
+                by_game[record["game_id"]] = session
+            continue
+        match = _GAME_PATH.match(record["path"])
+        session = by_game.get(match.group(1)) if match else None
+        if session is not None:
+            session["requests"].append(record)
+    return sessions
+
+class SessionReplayer:
+    """Plays recorded games against the app, swapping each recorded game id for the new one."""
+
+    def __init__(self, client: ASGIClient, recorder: LatencyRecorder, speedup: float):
+        self.client = client
+        self.recorder = recorder
+        self.speedup = speedup
+        self.skipped = 0
+
+    def _scaled(self, seconds: float) -> float:
+        return seconds / self.speedup if self.speedup > 0 else 0.0
+
+    async def play(self, session: dict, replay_started: float, origin: float):
+        game_id = None
+        for record in session["requests"]:
+            # Sent at its recorded offset, or right away if the replay has fallen behind
+            await asyncio.sleep(max(0.0, replay_started + self._scaled(record["t"] - origin) - time.perf_counter()))
+            path = record["path"]
+            if path != "/game/new":
+                if game_id is None:
+                    self.skipped += 1
+                    continue
+                path = f"/game/{game_id}{endpoint_label(path)}"
+            started = time.perf_counter()
+            # Tells ReplayLLM which recorded game's replies this request should get
+            headers = {"X-Replay-Game": session["game_id"]} if session["game_id"] else None
+            status, _, raw = await self.client.request(record["method"], path, record.get("body"), headers)
+            self.recorder.record(endpoint_label(record["path"]), time.perf_counter() - started, status == 200)
+            if record["path"] == "/game/new" and status == 200:
+                game_id = json.loads(raw)["game_id"]
+
+def recorded_latency(sessions: list) -> dict:
+    samples = {}
+    for session in sessions:
+        for record in session["requests"]:
+            samples.setdefault(endpoint_label(record["path"]), []).append(record["seconds"])
+    report = {}
+    for endpoint, values in samples.items():
+        ordered = sorted(values)
+        report[endpoint] = {
+            "count": len(ordered),
+            "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+            "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        }
+    return report
+
+async def run_replay(server, sessions: list, speedup: float, concurrency: int, quiet: bool = True) -> dict:
+    client = ASGIClient(server.app)
+    recorder = LatencyRecorder()
+    server_output = open(os.devnull, "w") if quiet else sys.stdout
+    with contextlib.redirect_stdout(server_output):
+        await client.startup()
+        replayer = SessionReplayer(client, recorder, speedup)
+        slots = asyncio.Semaphore(concurrency) if concurrency > 0 else contextlib.nullcontext()
+
+        async def one_session(session: dict):
+            async with slots:
+                await replayer.play(session, started, origin)
+
+        # Recorded offsets count from the server's start; replay from the first game
+        origin = min((session["start"] for session in sessions), default=0.0)
+        started = time.perf_counter()
+        await asyncio.gather(*(one_session(session) for session in sessions))
+        wall = time.perf_counter() - started
+        llm_api = server.game_engine.llm_api
+        await client.shutdown()
+    if quiet:
+        server_output.close()
+
+    report = recorder.report(wall)
+    report["games"] = len(sessions)
+    report["skipped_requests"] = replayer.skipped
+    report["recorded"] = recorded_latency(sessions)
+    report["replay"] = llm_api.stats()
+    report["tokens"] = {
+        prompt_type: {
+            "prompt": int(server.METRICS.counter_value("echoes_llm_prompt_tokens_total", prompt_type=prompt_type)),
+            "response": int(server.METRICS.counter_value("echoes_llm_response_tokens_total", prompt_type=prompt_type)),
+        }
+        for prompt_type in PROMPT_TYPES
+        if server.METRICS.counter_value("echoes_llm_calls_total", prompt_type=prompt_type, outcome="ok")
+    }
+    return report
+
+def print_report(report: dict, speedup: float, concurrency: int):
+    print(f"\n=== Replay: {report['games']} games, speed-up {speedup or 'max'}, concurrency {concurrency or 'unlimited'} ===")
+    print(f"{'endpoint':<18} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rec p50':>9} {'rec p95':>9}")
+    for endpoint, stats in sorted(report["endpoints"].items()):
+        recorded = report["recorded"].get(endpoint, {})
+        print(f"{endpoint:<18} {stats['count']:>6} {stats['errors']:>6} {stats['p50_ms']:>9} {stats['p95_ms']:>9} "
+              f"{stats['p99_ms']:>9} {recorded.get('p50_ms', '-'):>9} {recorded.get('p95_ms', '-'):>9}")
+    if report["tokens"]:
+        print(f"\n{'prompt type':<18} {'prompt tok':>11} {'response tok':>13}")
+        for prompt_type, tokens in report["tokens"].items():
+            print(f"{prompt_type:<18} {tokens['prompt']:>11} {tokens['response']:>13}")
+    replay = report["replay"]
+    print(f"\nLLM calls matched the recording: {replay['exact']} exact, {replay['fallback']} fallback")
+    if report["skipped_requests"]:
+        print(f"{report['skipped_requests']} request(s) skipped because their game failed to start")
+    print(f"\n{report['requests']} requests in {report['wall_seconds']} s -> {report['requests_per_second']} requests/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded Village of Echoes session offline.")
+    parser.add_argument("recording", help="File written with LLM_RECORD_PATH set.")
+    parser.add_argument("--speedup", type=float, default=1.0, help="Divide recorded offsets by this; 0 sends requests back to back.")
+    parser.add_argument("--concurrency", type=int, default=0, help="Games replayed at the same time (0 = as recorded).")
+    parser.add_argument("--latency-scale", type=float, default=None,
+                        help="Multiplier for recorded LLM latency (default 1/speedup, 0 with --speedup 0).")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    parser.add_argument("--verbose", action="store_true", help="Show the server's own log output.")
+    args = parser.parse_args()
+
+    latency_scale = args.latency_scale
+    if latency_scale is None:
+        latency_scale = 1.0 / args.speedup if args.speedup > 0 else 0.0
+
+    # main.py reads its configuration at import time
+    os.environ["LLM_BACKEND"] = "replay"
+    os.environ["LLM_REPLAY_PATH"] = args.recording
+    os.environ["LLM_REPLAY_LATENCY_SCALE"] = str(latency_scale)
+    os.environ["LLM_RECORD_PATH"] = ""
+    # Pool refills would consume recorded replies meant for the games themselves
+    os.environ.setdefault("WORLD_POOL_TARGETS", "")
+    os.environ.setdefault("GAME_STORE_BACKEND", "memory")
+    os.environ.setdefault("GAME_EVENT_LOG_PATH", os.path.join(tempfile.mkdtemp(prefix="echoes-replay-"), "game_events.db"))
+    with contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext():
+        import main as server
+        from game_logic.recording import load_recording
+        sessions = build_sessions(load_recording(args.recording))
+
+    report = asyncio.run(run_replay(server, sessions, args.speedup, args.concurrency, quiet=not args.verbose))
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report, args.speedup, args.concurrency)
+
+if __name__ == "__main__":
+    main()
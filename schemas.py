@@ -31,4 +31,30 @@ class GuessRequest(BaseModel):
 class GuessResponse(BaseModel):
     is_correct: bool
     is_true_ending: bool
-    message: str
\ No newline at end of file
+    message: str
+
+class BatchInteractRequest(BaseModel):
+    interactions: List[InteractRequest]
+
+class BatchInteractResult(BaseModel):
+    villager_id: str
+    status_code: int # What the same turn would have got from /interact
+    response: Optional[InteractResponse] = None
+    error: Optional[str] = None
+    retry_after: Optional[float] = None
+
+class BatchInteractResponse(BaseModel):
+    game_id: str
+    results: List[BatchInteractResult]
+
+class GameInteraction(InteractRequest):
+    game_id: str
+
+class MultiGameInteractRequest(BaseModel):
+    interactions: List[GameInteraction]
+
+class MultiGameInteractResult(BatchInteractResult):
+    game_id: str
+
+class MultiGameInteractResponse(BaseModel):
+    results: List[MultiGameInteractResult]